@@ -3,39 +3,116 @@ Webpage Screenshot API
 A REST API service for capturing webpage screenshots with caching, authentication, and rate limiting.
 """
 
-from flask import Flask, request, jsonify, send_file, render_template, render_template_string
+from flask import Flask, request, jsonify, send_file, render_template, g, Response
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.middleware.proxy_fix import ProxyFix
 from functools import wraps
 from datetime import datetime, timedelta
-import hashlib
+import atexit
+import base64
 import json
 import os
+import psutil
+import queue
+import threading
 import time
+import uuid
 from pathlib import Path
+from urllib.parse import quote
 import logging
-from logging.handlers import RotatingFileHandler
+import orjson
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener, MemoryHandler
 
 from screenshot_service import ScreenshotService
 from auth_service import AuthService
-from rate_limiter import RateLimiter
+from rate_limiter import RateLimiter, RedisRateLimiter
 from cache_service import CacheService
 from comparison_service import ComparisonService
 from webhook_service import WebhookService
 from dashboard_service import DashboardService
 
+# Accepted spellings for boolean query parameters and environment flags
+_TRUTHY = frozenset({'true', '1', 'yes', 'on', 'y', 't'})
+
+
+def truthy(value):
+    """Return True if a string flag is one of the accepted truthy spellings"""
+    return value is not None and value.lower() in _TRUTHY
+
+
+def json_flag(value):
+    """Read a boolean from a JSON body: real booleans as-is, strings through truthy()"""
+    if isinstance(value, str):
+        return truthy(value)
+    return value is True
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider that serializes responses with orjson
+    
+    Output matches Flask's default provider: keys are sorted (sort_keys) and
+    dates are passed through to default(), which renders them as HTTP dates.
+    """
+    
+    def _options(self):
+        """orjson flags equivalent to the provider's settings"""
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+    
+    def dumps(self, obj, **kwargs):
+        """Serialize obj to a JSON string"""
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        """Deserialize a JSON string or bytes"""
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        """Build a JSON response from bytes without a str round trip"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._options()),
+            mimetype=self.mimetype
+        )
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request size
 app.config['START_TIME'] = time.time()  # Track startup time for uptime calculation
+# Only enable behind a proxy that honours X-Sendfile; otherwise gunicorn's file_wrapper already uses sendfile(2)
+app.config['USE_X_SENDFILE'] = truthy(os.environ.get('USE_X_SENDFILE'))
+
+# Behind Cloud Run / a load balancer, set PROXY_HOPS to the number of proxies that append to
+# X-Forwarded-For so request.remote_addr is the real client; left at 0 the header is untrusted
+# and every client behind a proxy shares the proxy's address for invalid-key throttling
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 0))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
 
 # Initialize services
+POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', 4))  # Concurrent browser contexts per worker
 screenshot_service = ScreenshotService()
 auth_service = AuthService()
 rate_limiter = RateLimiter(requests_per_minute=60, requests_per_hour=1000)  # Increased for production
-cache_service = CacheService()
+if os.environ.get('REDIS_URL'):
+    # Share limits across gunicorn workers instead of enforcing them per process
+    try:
+        rate_limiter = RedisRateLimiter(os.environ['REDIS_URL'], requests_per_minute=60, requests_per_hour=1000)
+    except Exception as e:
+        print(f"Redis rate limiter warning: {e}")
+cache_service = CacheService(hot_cache_size=int(os.environ.get('CACHE_HOT_SIZE', 1024)))  # 0 disables the in-memory LRU
 comparison_service = ComparisonService()
-webhook_service = WebhookService()
+webhook_service = WebhookService(max_workers=POOL_SIZE)
 dashboard_service = DashboardService()
 
+# Launch browsers once per worker; captures only open a fresh context
+screenshot_service.start_pool(size=POOL_SIZE)
+
 # Setup logging
 if not os.path.exists('logs'):
     os.makedirs('logs')
@@ -44,12 +121,42 @@ file_handler = RotatingFileHandler('logs/api_requests.log', maxBytes=10240000, b
 file_handler.setFormatter(logging.Formatter(
     '%(asctime)s - %(levelname)s - [%(api_key)s] - %(url)s - %(status)s - %(message)s'
 ))
-app.logger.addHandler(file_handler)
+
+# Buffer file writes; errors and a full buffer flush immediately, a timer flushes the rest
+buffered_handler = MemoryHandler(capacity=256, flushLevel=logging.ERROR,
+                                 target=file_handler, flushOnClose=True)
+atexit.register(buffered_handler.close)
+
+
+def _flush_logs_periodically(interval=1.0):
+    """Flush buffered log records so they reach disk within about a second"""
+    while True:
+        time.sleep(interval)
+        buffered_handler.flush()
+
+
+threading.Thread(target=_flush_logs_periodically, name='log-flush', daemon=True).start()
+
+# Hand records to a background listener so requests never block on disk writes
+log_queue = queue.Queue(-1)
+app.logger.addHandler(QueueHandler(log_queue))
 app.logger.setLevel(logging.INFO)
+log_listener = QueueListener(log_queue, buffered_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
 
 
-def require_api_key(f):
-    """Decorator to require API key authentication (skips for RapidAPI traffic)"""
+def require_api_key(f=None, *, cost=None):
+    """
+    Decorator to require API key authentication (skips for RapidAPI traffic)
+    
+    Args:
+        cost (callable, optional): Returns how many requests the call counts as;
+            charged against the rate limit in one reservation (default 1)
+    """
+    if f is None:
+        return lambda f: require_api_key(f, cost=cost)
+    
     @wraps(f)
     def decorated_function(*args, **kwargs):
         # Check if request is from RapidAPI proxy
@@ -67,14 +174,20 @@ def require_api_key(f):
             api_key_for_limits = rapidapi_key if rapidapi_key else 'rapidapi_default'
             
             # Apply rate limiting based on RapidAPI key
-            if not rate_limiter.check_rate_limit(api_key_for_limits):
+            allowed, remaining_minute, remaining_hour, retry_after = rate_limiter.check_and_consume(
+                api_key_for_limits, cost=cost() if cost else 1)
+            if not allowed:
                 log_request(api_key_for_limits, None, 429, "Rate limit exceeded")
                 return jsonify({
                     'error': 'Rate limit exceeded',
                     'message': 'You have exceeded your rate limit. Please try again later.',
-                    'retry_after': rate_limiter.get_retry_after(api_key_for_limits)
-                }), 429
+                    'retry_after': retry_after
+                }), 429, {'Retry-After': str(retry_after)}
             
+            # RapidAPI traffic carries no key of ours for the views to use
+            g.api_key = None
+            g.rate_limit_key = api_key_for_limits
+            g.rate_limit_remaining = (remaining_minute, remaining_hour)
             return f(*args, **kwargs)
         
         # For direct API access (non-RapidAPI), require our API key
@@ -87,7 +200,19 @@ def require_api_key(f):
                 'message': 'Please provide an API key using X-API-Key header or api_key parameter'
             }), 401
         
-        if not auth_service.validate_api_key(api_key):
+        # Read before validating so the failure this request may record does not count against it
+        retry_after = auth_service.attempt_retry_after(request.remote_addr)
+        if not auth_service.validate_api_key(api_key, client_ip=request.remote_addr):
+            # Only rejected keys are throttled; while throttled, bcrypt keys that have not
+            # been fingerprinted yet are rejected too since they need the bcrypt scan
+            if retry_after:
+                log_request(None, None, 429, "Too many invalid API key attempts")
+                return jsonify({
+                    'error': 'Too many invalid API key attempts',
+                    'message': 'Too many requests with invalid API keys. Please try again later.',
+                    'retry_after': retry_after
+                }), 429, {'Retry-After': str(retry_after)}
+            
             log_request(api_key, None, 401, "Invalid API key")
             return jsonify({
                 'error': 'Invalid API key',
@@ -95,14 +220,20 @@ def require_api_key(f):
             }), 401
         
         # Check rate limit
-        if not rate_limiter.check_rate_limit(api_key):
+        allowed, remaining_minute, remaining_hour, retry_after = rate_limiter.check_and_consume(
+            api_key, cost=cost() if cost else 1)
+        if not allowed:
             log_request(api_key, None, 429, "Rate limit exceeded")
             return jsonify({
                 'error': 'Rate limit exceeded',
                 'message': 'You have exceeded your rate limit. Please try again later.',
-                'retry_after': rate_limiter.get_retry_after(api_key)
-            }), 429
+                'retry_after': retry_after
+            }), 429, {'Retry-After': str(retry_after)}
         
+        # Views read the validated key from g instead of re-parsing the request
+        g.api_key = api_key
+        g.rate_limit_key = api_key
+        g.rate_limit_remaining = (remaining_minute, remaining_hour)
         return f(*args, **kwargs)
     
     return decorated_function
@@ -126,31 +257,114 @@ def home():
     return render_template('landing.html')
 
 
+# Static API description, serialized once at import time
+API_INFO_JSON = app.json.dumps({
+    'name': 'Webpage Screenshot API',
+    'version': '1.0',
+    'status': 'operational',
+    'endpoints': [
+        '/screenshot (GET/POST) - Capture screenshot',
+        '/screenshot/async (POST) - Async screenshot with webhook',
+        '/jobs/{id} (GET) - Check job status',
+        '/batch (POST) - Batch screenshot processing',
+        '/compare (POST) - Compare screenshots',
+        '/baseline (POST) - Create baseline screenshot',
+        '/devices (GET) - List device presets',
+        '/dashboard (GET) - Usage dashboard',
+        '/health (GET) - API health check',
+        '/docs (GET) - API documentation'
+    ],
+    'documentation': '/docs',
+    'dashboard': '/dashboard',
+    'github': 'https://github.com/your-repo'
+}).encode('utf-8')
+
+
 @app.route('/api')
 def api_info():
     """
     API information endpoint (JSON)
     """
-    return jsonify({
-        'name': 'Webpage Screenshot API',
-        'version': '1.0',
-        'status': 'operational',
-        'endpoints': [
-            '/screenshot (GET/POST) - Capture screenshot',
-            '/screenshot/async (POST) - Async screenshot with webhook',
-            '/jobs/{id} (GET) - Check job status',
-            '/batch (POST) - Batch screenshot processing',
-            '/compare (POST) - Compare screenshots',
-            '/baseline (POST) - Create baseline screenshot',
-            '/devices (GET) - List device presets',
-            '/dashboard (GET) - Usage dashboard',
-            '/health (GET) - API health check',
-            '/docs (GET) - API documentation'
-        ],
-        'documentation': '/docs',
-        'dashboard': '/dashboard',
-        'github': 'https://github.com/your-repo'
-    })
+    return app.response_class(API_INFO_JSON, mimetype='application/json')
+
+
+# Screenshot request schema: (argument name, request key, type, default).
+# Query-string values arrive as strings and are converted by type; JSON bodies keep their types.
+SCREENSHOT_PARAMS = (
+    ('url', 'url', str, None),
+    ('width', 'width', int, 1920),
+    ('height', 'height', int, 1080),
+    ('fullpage', 'fullpage', bool, False),
+    ('delay', 'delay', int, 0),
+    ('image_format', 'format', str, 'jpeg'),
+    ('quality', 'quality', int, ScreenshotService.DEFAULT_QUALITY),
+    ('selector', 'selector', str, None),
+    ('device', 'device', str, None),
+    ('user_agent', 'user_agent', str, None),
+    ('dark_mode', 'dark_mode', bool, False),
+    ('wait_for_selector', 'wait_for_selector', str, None),
+    ('custom_script', 'script', str, None),
+    ('block_ads', 'block_ads', bool, False),
+    ('scroll_page', 'scroll_page', bool, False),
+    ('media_type', 'media_type', str, None),
+    ('timezone', 'timezone', str, None),
+    ('browser_type', 'browser', str, 'chromium'),
+    ('disable_animations', 'disable_animations', bool, False),
+    ('compression', 'compression', int, None),
+    ('wait_until', 'wait_until', str, None),
+)
+
+# Structured options only accepted in a JSON body: (argument name, request key)
+SCREENSHOT_POST_PARAMS = (
+    ('extra_headers', 'headers'),
+    ('cookies', 'cookies'),
+    ('geolocation', 'geolocation'),
+    ('inject_data', 'inject_data'),
+)
+
+
+def parse_screenshot_params(source, from_query=False):
+    """
+    Parse screenshot options from a JSON body or query string in one pass
+    
+    Args:
+        source (dict): Request JSON body or request.args
+        from_query (bool): Convert string values from the query string
+    
+    Returns:
+        dict: Keyword arguments for capture_screenshot
+    
+    Raises:
+        ValueError: If a numeric query parameter is not an integer
+    """
+    params = {}
+    
+    for name, key, kind, default in SCREENSHOT_PARAMS:
+        if key not in source:
+            params[name] = default
+            continue
+        
+        value = source[key]
+        if from_query:
+            if kind is int:
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ValueError(f'{key} must be an integer')
+            elif kind is bool:
+                value = truthy(value)
+        params[name] = value
+    
+    for name, key in SCREENSHOT_POST_PARAMS:
+        params[name] = None if from_query else source.get(key)
+    
+    params['image_format'] = params['image_format'].lower()
+    
+    # Normalize jpeg format so both spellings share a cache entry
+    if params['image_format'] == 'jpg':
+        params['image_format'] = 'jpeg'
+    
+    return params
 
 
 @app.route('/screenshot', methods=['GET', 'POST'])
@@ -165,8 +379,8 @@ def screenshot():
         height (int, optional): Viewport height (default: 1080)
         fullpage (bool, optional): Capture full page (default: false)
         delay (int, optional): Delay before capture in milliseconds (default: 0)
-        format (str, optional): Image format - 'png', 'jpeg', or 'pdf' (default: 'png')
-        quality (int, optional): JPEG quality 1-100 (default: 80)
+        format (str, optional): Image format - 'png', 'jpeg', or 'pdf' (default: 'jpeg')
+        quality (int, optional): JPEG quality 1-100 (default: 85)
         selector (str, optional): CSS selector to capture specific element
         device (str, optional): Device preset (iphone13, ipad_pro, etc.)
         user_agent (str, optional): Custom user agent string
@@ -176,62 +390,71 @@ def screenshot():
         block_ads (bool, optional): Block ads and trackers (default: false)
         scroll_page (bool, optional): Scroll page for lazy loading (default: false)
         media_type (str, optional): Emulate media type ('screen' or 'print')
+        compression (int, optional): PNG compression level 0-9 (default: browser encoder)
+        wait_until (str, optional): 'networkidle' to wait for network quiet before capture
     
     Returns:
         Image file, PDF, or error message
     """
-    api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
+    api_key = g.api_key
     
     # Get parameters
-    if request.method == 'POST':
-        data = request.get_json() or {}
-        url = data.get('url') or request.form.get('url')
-        width = data.get('width', 1920)
-        height = data.get('height', 1080)
-        fullpage = data.get('fullpage', False)
-        delay = data.get('delay', 0)
-        image_format = data.get('format', 'png').lower()
-        quality = data.get('quality', 80)
-        selector = data.get('selector')
-        device = data.get('device')
-        user_agent = data.get('user_agent')
-        dark_mode = data.get('dark_mode', False)
-        wait_for_selector = data.get('wait_for_selector')
-        custom_script = data.get('script')
-        block_ads = data.get('block_ads', False)
-        scroll_page = data.get('scroll_page', False)
-        media_type = data.get('media_type')
-        extra_headers = data.get('headers')
-        cookies = data.get('cookies')
-        geolocation = data.get('geolocation')
-        timezone = data.get('timezone')
-        browser_type = data.get('browser', 'chromium')
-        disable_animations = data.get('disable_animations', False)
-        inject_data = data.get('inject_data')
-    else:
-        url = request.args.get('url')
-        width = int(request.args.get('width', 1920))
-        height = int(request.args.get('height', 1080))
-        fullpage = request.args.get('fullpage', 'false').lower() in ('true', '1', 'yes')
-        delay = int(request.args.get('delay', 0))
-        image_format = request.args.get('format', 'png').lower()
-        quality = int(request.args.get('quality', 80))
-        selector = request.args.get('selector')
-        device = request.args.get('device')
-        user_agent = request.args.get('user_agent')
-        dark_mode = request.args.get('dark_mode', 'false').lower() in ('true', '1', 'yes')
-        wait_for_selector = request.args.get('wait_for_selector')
-        custom_script = request.args.get('script')
-        block_ads = request.args.get('block_ads', 'false').lower() in ('true', '1', 'yes')
-        scroll_page = request.args.get('scroll_page', 'false').lower() in ('true', '1', 'yes')
-        media_type = request.args.get('media_type')
-        extra_headers = None
-        cookies = None
-        geolocation = None
-        timezone = request.args.get('timezone')
-        browser_type = request.args.get('browser', 'chromium')
-        disable_animations = request.args.get('disable_animations', 'false').lower() in ('true', '1', 'yes')
-        inject_data = None  # Only available via POST
+    try:
+        if request.method == 'POST':
+            # Only fall back to form parsing when the body is not JSON
+            data = request.get_json(silent=True, cache=False)
+            if data:
+                params = parse_screenshot_params(data)
+            else:
+                params = parse_screenshot_params({})
+                params['url'] = request.form.get('url')
+        else:
+            params = parse_screenshot_params(request.args, from_query=True)
+    except ValueError as e:
+        log_request(api_key, None, 400, "Invalid parameter")
+        return jsonify({
+            'error': 'Invalid parameter',
+            'message': str(e)
+        }), 400
+    
+    url = params['url']
+    width = params['width']
+    height = params['height']
+    image_format = params['image_format']
+    quality = params['quality']
+    
+    # Probe the cache before validating: only valid requests ever produce a cache entry,
+    # so a hit can be served without re-checking the parameters
+    cache_key = cache_service.generate_cache_key(
+        url, width, height, params['fullpage'], image_format, quality, params['delay'],
+        selector=params['selector'], device=params['device'], user_agent=params['user_agent'],
+        dark_mode=params['dark_mode'], wait_for_selector=params['wait_for_selector'],
+        block_ads=params['block_ads'], scroll_page=params['scroll_page'],
+        media_type=params['media_type'], timezone=params['timezone'],
+        compression=params['compression'], wait_until=params['wait_until']
+    )
+    
+    cached_file = cache_service.get_cached_screenshot(cache_key)
+    
+    if cached_file:
+        if image_format == 'pdf':
+            mimetype = 'application/pdf'
+        elif image_format == 'jpeg':
+            mimetype = 'image/jpeg'
+        else:
+            mimetype = 'image/png'
+        try:
+            # Let clients revalidate with If-None-Match / If-Modified-Since and get a 304;
+            # the ETag follows the bytes, so a fresh capture after expiry is never a false 304
+            response = send_file(cached_file, mimetype=mimetype, as_attachment=False,
+                                 conditional=True, etag=cache_service.content_etag(cached_file),
+                                 last_modified=os.path.getmtime(cached_file), max_age=300)
+        except OSError:
+            # Evicted (possibly by another worker) since the lookup: capture it again below
+            cache_service.mark_missing(cache_key)
+        else:
+            log_request(api_key, url, 200, "Screenshot served from cache")
+            return response
     
     # Validate URL
     if not url:
@@ -257,10 +480,6 @@ def screenshot():
             'message': 'Format must be "png", "jpeg", or "pdf"'
         }), 400
     
-    # Normalize jpeg format
-    if image_format == 'jpg':
-        image_format = 'jpeg'
-    
     # Validate viewport dimensions
     if width < 100 or width > 3840 or height < 100 or height > 2160:
         log_request(api_key, url, 400, "Invalid viewport dimensions")
@@ -277,24 +496,14 @@ def screenshot():
             'message': 'Quality must be between 1-100'
         }), 400
     
-    # Generate cache key (include all relevant parameters)
-    cache_params = f"{selector}|{device}|{user_agent}|{dark_mode}|{wait_for_selector}|{block_ads}|{scroll_page}|{media_type}|{timezone}"
-    cache_key = cache_service.generate_cache_key(url, width, height, fullpage, image_format, quality, delay)
-    # Extend cache key with advanced params
-    import hashlib
-    cache_key = hashlib.sha256(f"{cache_key}|{cache_params}".encode()).hexdigest()
-    
-    cached_file = cache_service.get_cached_screenshot(cache_key)
-    
-    if cached_file:
-        log_request(api_key, url, 200, "Screenshot served from cache")
-        if image_format == 'pdf':
-            mimetype = 'application/pdf'
-        elif image_format == 'jpeg':
-            mimetype = 'image/jpeg'
-        else:
-            mimetype = 'image/png'
-        return send_file(cached_file, mimetype=mimetype, as_attachment=False)
+    # Validate PNG compression level
+    compression = params['compression']
+    if compression is not None and (compression < 0 or compression > 9):
+        log_request(api_key, url, 400, "Invalid compression")
+        return jsonify({
+            'error': 'Invalid compression',
+            'message': 'Compression must be between 0-9'
+        }), 400
     
     # Capture screenshot or PDF
     try:
@@ -304,39 +513,15 @@ def screenshot():
                 url=url,
                 width=width,
                 height=height,
-                landscape=fullpage,
-                extra_headers=extra_headers
+                landscape=params['fullpage'],
+                extra_headers=params['extra_headers']
             )
         else:
             # Image screenshot
-            screenshot_path = screenshot_service.capture_screenshot(
-                url=url,
-                width=width,
-                height=height,
-                fullpage=fullpage,
-                delay=delay,
-                image_format=image_format,
-                quality=quality,
-                selector=selector,
-                device=device,
-                user_agent=user_agent,
-                dark_mode=dark_mode,
-                wait_for_selector=wait_for_selector,
-                custom_script=custom_script,
-                block_ads=block_ads,
-                scroll_page=scroll_page,
-                media_type=media_type,
-                extra_headers=extra_headers,
-                cookies=cookies,
-                geolocation=geolocation,
-                timezone=timezone,
-                browser_type=browser_type,
-                disable_animations=disable_animations,
-                inject_data=inject_data
-            )
+            screenshot_path = screenshot_service.capture_screenshot(**params)
         
         # Cache the screenshot
-        cache_service.cache_screenshot(cache_key, screenshot_path)
+        cached_path = cache_service.cache_screenshot(cache_key, screenshot_path)
         
         log_request(api_key, url, 200, "Screenshot captured successfully")
         
@@ -348,10 +533,11 @@ def screenshot():
             mimetype = 'image/png'
         
         # Add rate limit headers
-        response = send_file(screenshot_path, mimetype=mimetype, as_attachment=False)
-        remaining = rate_limiter.get_remaining_requests(api_key)
-        response.headers['X-RateLimit-Remaining-Minute'] = str(remaining['per_minute'])
-        response.headers['X-RateLimit-Remaining-Hour'] = str(remaining['per_hour'])
+        response = send_file(screenshot_path, mimetype=mimetype, as_attachment=False,
+                             conditional=True, etag=cache_service.content_etag(cached_path), max_age=300)
+        remaining_minute, remaining_hour = g.rate_limit_remaining
+        response.headers['X-RateLimit-Remaining-Minute'] = str(remaining_minute)
+        response.headers['X-RateLimit-Remaining-Hour'] = str(remaining_hour)
         return response
         
     except Exception as e:
@@ -373,7 +559,8 @@ def compare_screenshots():
     {
         "baseline": "path/to/baseline.png",
         "current": "path/to/current.png",
-        "threshold": 0.02
+        "threshold": 0.02,
+        "fast": false
     }
     
     Option 2 - Capture and compare with baseline:
@@ -383,7 +570,7 @@ def compare_screenshots():
         "capture_params": {...}
     }
     """
-    api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
+    api_key = g.api_key
     
     data = request.get_json() or {}
     
@@ -397,7 +584,8 @@ def compare_screenshots():
             result = comparison_service.compare_images(
                 baseline_path,
                 current_path,
-                threshold=threshold
+                threshold=threshold,
+                fast=json_flag(data.get('fast'))
             )
             
             log_request(api_key, "Comparison", 200, "Images compared")
@@ -429,7 +617,8 @@ def compare_screenshots():
             result = comparison_service.compare_images(
                 baseline_path,
                 screenshot_path,
-                threshold=threshold
+                threshold=threshold,
+                fast=json_flag(data.get('fast'))
             )
             result['current_screenshot'] = screenshot_path
             result['baseline_screenshot'] = baseline_path
@@ -465,7 +654,7 @@ def create_baseline():
         "capture_params": {...}
     }
     """
-    api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
+    api_key = g.api_key
     
     data = request.get_json() or {}
     url = data.get('url')
@@ -516,7 +705,7 @@ def screenshot_async():
         "params": {...}
     }
     """
-    api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
+    api_key = g.api_key
     
     data = request.get_json() or {}
     url = data.get('url')
@@ -530,6 +719,13 @@ def screenshot_async():
             'message': 'URL parameter is required'
         }), 400
     
+    if webhook_service.is_overloaded():
+        log_request(api_key, url, 503, "Async job queue full")
+        return jsonify({
+            'error': 'Service busy',
+            'message': 'Too many pending jobs. Please try again later.'
+        }), 503
+    
     try:
         # Create async job
         job_id = webhook_service.create_job(
@@ -539,13 +735,18 @@ def screenshot_async():
             webhook_secret=webhook_secret
         )
         
-        # Process job asynchronously
-        webhook_service.process_job_async(
+        # Process job asynchronously; the queue may have filled since the check above
+        if not webhook_service.process_job_async(
             job_id,
             screenshot_service.capture_screenshot,
             url=url,
             **params
-        )
+        ):
+            log_request(api_key, url, 503, "Async job queue full")
+            return jsonify({
+                'error': 'Service busy',
+                'message': 'Too many pending jobs. Please try again later.'
+            }), 503
         
         log_request(api_key, url, 202, f"Async job created: {job_id}")
         
@@ -577,7 +778,7 @@ def get_job_status(job_id):
         "result": {...}
     }
     """
-    api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
+    api_key = g.api_key
     
     try:
         status = webhook_service.get_job_status(job_id)
@@ -600,8 +801,107 @@ def get_job_status(job_id):
         }), 500
 
 
+def _batch_result(params, outcome):
+    """
+    Build the result record for one batch entry
+    
+    Args:
+        params (dict): Keyword arguments the entry was captured with
+        outcome: Screenshot path, or the exception the capture raised
+    
+    Returns:
+        dict: Result with the screenshot path or error message
+    """
+    if isinstance(outcome, Exception):
+        return {
+            'url': params['url'],
+            'status': 'error',
+            'message': str(outcome)
+        }
+    
+    return {
+        'url': params['url'],
+        'status': 'success',
+        'format': params['image_format'],
+        'path': outcome
+    }
+
+
+def _batch_result_base64(result):
+    """Convert a batch result record into its JSON form with inline base64 data"""
+    if result['status'] != 'success':
+        return result
+    
+    with open(result['path'], 'rb') as f:
+        image_data = base64.b64encode(f.read()).decode('utf-8')
+    
+    return {
+        'url': result['url'],
+        'status': 'success',
+        'data': f"data:image/{result['format']};base64,{image_data}"
+    }
+
+
+# Characters kept as-is when a request value goes into a part header; everything
+# else (CR, LF, spaces, non-ASCII) is percent-encoded so it cannot end the header
+_HEADER_SAFE = "!#$%&'()*+,-./:;=?@[]~_"
+
+
+def _header_value(value):
+    """Percent-encode a client-supplied value for use in a multipart part header"""
+    return quote(str(value), safe=_HEADER_SAFE)
+
+
+def _stream_batch_multipart(results, boundary):
+    """
+    Yield batch results as multipart/mixed parts with raw image bytes
+    
+    Args:
+        results (list): Batch result records in request order
+        boundary (str): Multipart boundary
+    
+    Yields:
+        bytes: Response body chunks
+    """
+    for result in results:
+        location = _header_value(result['url'])
+        if result['status'] == 'success':
+            headers = (f"--{boundary}\r\n"
+                       f"Content-Type: image/{_header_value(result['format'])}\r\n"
+                       f"Content-Location: {location}\r\n"
+                       f"X-Status: success\r\n\r\n")
+            yield headers.encode('utf-8')
+            with open(result['path'], 'rb') as f:
+                while True:
+                    chunk = f.read(65536)
+                    if not chunk:
+                        break
+                    yield chunk
+        else:
+            headers = (f"--{boundary}\r\n"
+                       f"Content-Type: application/json\r\n"
+                       f"Content-Location: {location}\r\n"
+                       f"X-Status: error\r\n\r\n")
+            yield headers.encode('utf-8') + app.json.dumps({'message': result['message']}).encode('utf-8')
+        yield b"\r\n"
+    
+    yield f"--{boundary}--\r\n".encode('utf-8')
+
+
+MAX_BATCH_URLS = 10
+
+
+def _batch_cost():
+    """Each URL of a well-formed batch counts as a request; malformed ones cost one"""
+    data = request.get_json(silent=True)
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if isinstance(urls, list) and 0 < len(urls) <= MAX_BATCH_URLS:
+        return len(urls)
+    return 1
+
+
 @app.route('/batch', methods=['POST'])
-@require_api_key
+@require_api_key(cost=_batch_cost)
 def batch_screenshot():
     """
     Capture multiple screenshots in one request
@@ -612,7 +912,7 @@ def batch_screenshot():
         "settings": {"width": 1280, "height": 720, "format": "png"}
     }
     """
-    api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
+    api_key = g.api_key
     
     data = request.get_json() or {}
     urls = data.get('urls', [])
@@ -625,56 +925,44 @@ def batch_screenshot():
             'message': 'urls must be a non-empty array'
         }), 400
     
-    if len(urls) > 10:
+    if len(urls) > MAX_BATCH_URLS:
         log_request(api_key, None, 400, "Too many URLs in batch")
         return jsonify({
             'error': 'Too many URLs',
-            'message': 'Maximum 10 URLs per batch request'
+            'message': f'Maximum {MAX_BATCH_URLS} URLs per batch request'
         }), 400
     
-    results = []
+    params_list = [{
+        'url': url,
+        'width': settings.get('width', 1920),
+        'height': settings.get('height', 1080),
+        'fullpage': settings.get('fullpage', False),
+        'delay': settings.get('delay', 0),
+        'image_format': settings.get('format', 'jpeg'),
+        'quality': settings.get('quality', ScreenshotService.DEFAULT_QUALITY),
+        'selector': settings.get('selector'),
+        'device': settings.get('device'),
+        'dark_mode': settings.get('dark_mode', False),
+    } for url in urls]
     
-    for url in urls:
-        try:
-            # Merge settings with defaults
-            params = {
-                'url': url,
-                'width': settings.get('width', 1920),
-                'height': settings.get('height', 1080),
-                'fullpage': settings.get('fullpage', False),
-                'delay': settings.get('delay', 0),
-                'image_format': settings.get('format', 'png'),
-                'quality': settings.get('quality', 80),
-                'selector': settings.get('selector'),
-                'device': settings.get('device'),
-                'dark_mode': settings.get('dark_mode', False),
-            }
-            
-            screenshot_path = screenshot_service.capture_screenshot(**params)
-            
-            # Return base64 encoded image for batch
-            import base64
-            with open(screenshot_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            results.append({
-                'url': url,
-                'status': 'success',
-                'data': f"data:image/{params['image_format']};base64,{image_data}"
-            })
-            
-        except Exception as e:
-            results.append({
-                'url': url,
-                'status': 'error',
-                'message': str(e)
-            })
+    # Captures are independent, so run them concurrently on the browser context pool
+    outcomes = screenshot_service.capture_many(params_list)
+    results = [_batch_result(params, outcome) for params, outcome in zip(params_list, outcomes)]
     
     log_request(api_key, f"Batch: {len(urls)} URLs", 200, "Batch processing completed")
     
-    return jsonify({
+    # Raw image parts avoid the base64 overhead; JSON stays the default for existing clients
+    encoding = request.args.get('encoding') or data.get('encoding', 'base64')
+    if encoding == 'multipart' or 'multipart/mixed' in request.headers.get('Accept', ''):
+        boundary = uuid.uuid4().hex
+        return Response(_stream_batch_multipart(results, boundary),
+                        mimetype=f'multipart/mixed; boundary={boundary}',
+                        headers={'X-Batch-Total': str(len(urls))})
+    
+    # The provider serializes straight to bytes; the base64 payload can be several MB
+    return app.json.response({
         'total': len(urls),
-        'results': results
+        'results': [_batch_result_base64(result) for result in results]
     })
 
 
@@ -720,26 +1008,36 @@ def devices():
     })
 
 
-@app.route('/health')
-def health():
+# (monotonic timestamp, metrics) of the last psutil sample served by /health
+_last_metrics = (0.0, None)
+
+# Prime the CPU counter so non-blocking cpu_percent() calls return a real value
+psutil.cpu_percent(interval=None)
+
+
+def get_system_metrics(max_age=1.0):
     """
-    Health check endpoint
+    Get system metrics, reusing the last sample for up to max_age seconds
     
-    Returns API health status, uptime, and system metrics
+    Args:
+        max_age (float): Maximum age of a cached sample in seconds
+    
+    Returns:
+        dict: CPU, memory and disk usage
     """
-    import psutil
-    from datetime import datetime
+    global _last_metrics
     
-    # Calculate uptime (approximate - since app start)
-    uptime_seconds = int(time.time() - app.config.get('START_TIME', time.time()))
+    now = time.monotonic()
+    sampled_at, metrics = _last_metrics
+    if metrics is not None and now - sampled_at < max_age:
+        return metrics
     
-    # Get system metrics
     try:
-        cpu_percent = psutil.cpu_percent(interval=0.1)
+        cpu_percent = psutil.cpu_percent(interval=None)
         memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
         
-        system_metrics = {
+        metrics = {
             'cpu_usage_percent': round(cpu_percent, 2),
             'memory_usage_percent': round(memory.percent, 2),
             'memory_available_gb': round(memory.available / (1024**3), 2),
@@ -747,7 +1045,7 @@ def health():
             'disk_free_gb': round(disk.free / (1024**3), 2)
         }
     except Exception:
-        system_metrics = {
+        metrics = {
             'cpu_usage_percent': 0,
             'memory_usage_percent': 0,
             'memory_available_gb': 0,
@@ -755,6 +1053,25 @@ def health():
             'disk_free_gb': 0
         }
     
+    _last_metrics = (now, metrics)
+    return metrics
+
+
+@app.route('/health')
+def health():
+    """
+    Health check endpoint
+    
+    Returns API health status, uptime, and system metrics
+    """
+    from datetime import datetime
+    
+    # Calculate uptime (approximate - since app start)
+    uptime_seconds = int(time.time() - app.config.get('START_TIME', time.time()))
+    
+    # Get system metrics
+    system_metrics = get_system_metrics()
+    
     # Check service health
     services_healthy = True
     service_status = {}
@@ -797,270 +1114,16 @@ def health():
     return jsonify(response), status_code
 
 
+# Static documentation page; served from static/docs.html so a front proxy can
+# answer /docs itself, and sent with sendfile when it does reach Flask
+DOCS_FILE = Path(app.static_folder) / 'docs.html'
+
+
 @app.route('/docs')
 def docs():
     """API documentation endpoint"""
-    doc_html = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Webpage Screenshot API - Documentation</title>
-        <style>
-            body {
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-                max-width: 1200px;
-                margin: 0 auto;
-                padding: 20px;
-                background: #f5f5f5;
-            }
-            .container {
-                background: white;
-                padding: 30px;
-                border-radius: 8px;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-            }
-            h1 { color: #2c3e50; border-bottom: 3px solid #3498db; padding-bottom: 10px; }
-            h2 { color: #34495e; margin-top: 30px; }
-            h3 { color: #7f8c8d; }
-            code {
-                background: #ecf0f1;
-                padding: 2px 6px;
-                border-radius: 3px;
-                font-family: 'Courier New', monospace;
-            }
-            pre {
-                background: #2c3e50;
-                color: #ecf0f1;
-                padding: 15px;
-                border-radius: 5px;
-                overflow-x: auto;
-            }
-            .endpoint {
-                background: #e8f4f8;
-                padding: 15px;
-                margin: 15px 0;
-                border-left: 4px solid #3498db;
-                border-radius: 4px;
-            }
-            .method {
-                display: inline-block;
-                padding: 3px 8px;
-                border-radius: 3px;
-                font-weight: bold;
-                margin-right: 10px;
-            }
-            .get { background: #3498db; color: white; }
-            .post { background: #2ecc71; color: white; }
-            table {
-                width: 100%;
-                border-collapse: collapse;
-                margin: 15px 0;
-            }
-            th, td {
-                padding: 12px;
-                text-align: left;
-                border-bottom: 1px solid #ddd;
-            }
-            th {
-                background: #34495e;
-                color: white;
-            }
-            .warning {
-                background: #fff3cd;
-                border-left: 4px solid #ffc107;
-                padding: 15px;
-                margin: 15px 0;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>📸 Webpage Screenshot API Documentation</h1>
-            <p>A powerful REST API for capturing webpage screenshots with advanced features including caching, authentication, and rate limiting.</p>
-            
-            <h2>🔑 Authentication</h2>
-            <p>All requests require API key authentication. Provide your API key in one of two ways:</p>
-            <ul>
-                <li>Header: <code>X-API-Key: your_api_key_here</code></li>
-                <li>Query parameter: <code>?api_key=your_api_key_here</code></li>
-            </ul>
-            
-            <div class="warning">
-                <strong>⚠️ Note:</strong> For security, use the header method in production environments.
-            </div>
-            
-            <h2>📊 Rate Limiting</h2>
-            <p>Each API key is limited to:</p>
-            <ul>
-                <li><strong>60 requests per hour</strong></li>
-                <li><strong>10 requests per minute</strong></li>
-            </ul>
-            <p>When rate limit is exceeded, you'll receive a 429 status code with retry-after information.</p>
-            
-            <h2>🛠️ Endpoints</h2>
-            
-            <div class="endpoint">
-                <h3><span class="method get">GET</span><span class="method post">POST</span> /screenshot</h3>
-                <p>Capture a screenshot of any webpage.</p>
-                
-                <h4>Parameters</h4>
-                <table>
-                    <tr>
-                        <th>Parameter</th>
-                        <th>Type</th>
-                        <th>Required</th>
-                        <th>Default</th>
-                        <th>Description</th>
-                    </tr>
-                    <tr>
-                        <td><code>url</code></td>
-                        <td>string</td>
-                        <td>Yes</td>
-                        <td>-</td>
-                        <td>The URL of the webpage to capture (must start with http:// or https://)</td>
-                    </tr>
-                    <tr>
-                        <td><code>width</code></td>
-                        <td>integer</td>
-                        <td>No</td>
-                        <td>1920</td>
-                        <td>Viewport width in pixels (100-3840)</td>
-                    </tr>
-                    <tr>
-                        <td><code>height</code></td>
-                        <td>integer</td>
-                        <td>No</td>
-                        <td>1080</td>
-                        <td>Viewport height in pixels (100-2160)</td>
-                    </tr>
-                    <tr>
-                        <td><code>fullpage</code></td>
-                        <td>boolean</td>
-                        <td>No</td>
-                        <td>false</td>
-                        <td>Capture the entire page (true/false)</td>
-                    </tr>
-                    <tr>
-                        <td><code>delay</code></td>
-                        <td>integer</td>
-                        <td>No</td>
-                        <td>0</td>
-                        <td>Delay before capture in milliseconds (0-30000)</td>
-                    </tr>
-                    <tr>
-                        <td><code>format</code></td>
-                        <td>string</td>
-                        <td>No</td>
-                        <td>png</td>
-                        <td>Image format: "png" or "jpeg"</td>
-                    </tr>
-                    <tr>
-                        <td><code>quality</code></td>
-                        <td>integer</td>
-                        <td>No</td>
-                        <td>80</td>
-                        <td>JPEG quality (1-100, only for JPEG format)</td>
-                    </tr>
-                </table>
-                
-                <h4>Example Requests</h4>
-                
-                <p><strong>GET Request:</strong></p>
-                <pre>curl -H "X-API-Key: your_api_key" \
-  "http://localhost:5000/screenshot?url=https://example.com&width=1280&height=720&format=png"</pre>
-                
-                <p><strong>POST Request:</strong></p>
-                <pre>curl -X POST http://localhost:5000/screenshot \
-  -H "X-API-Key: your_api_key" \
-  -H "Content-Type: application/json" \
-  -d '{
-    "url": "https://example.com",
-    "width": 1280,
-    "height": 720,
-    "fullpage": true,
-    "format": "jpeg",
-    "quality": 90
-  }'</pre>
-                
-                <h4>Response</h4>
-                <p>On success: Binary image data (PNG or JPEG)</p>
-                <p>On error: JSON error object</p>
-                <pre>{
-  "error": "Error type",
-  "message": "Detailed error message"
-}</pre>
-            </div>
-            
-            <div class="endpoint">
-                <h3><span class="method get">GET</span> /health</h3>
-                <p>Check API health status (no authentication required).</p>
-                
-                <h4>Response</h4>
-                <pre>{
-  "status": "healthy",
-  "timestamp": "2025-10-05T15:51:29.000000"
-}</pre>
-            </div>
-            
-            <h2>💾 Caching</h2>
-            <p>Screenshots are cached for 24 hours based on URL and parameters. Identical requests within this window will return cached results instantly, reducing server load and improving response times.</p>
-            
-            <h2>📝 Response Codes</h2>
-            <table>
-                <tr>
-                    <th>Code</th>
-                    <th>Description</th>
-                </tr>
-                <tr>
-                    <td>200</td>
-                    <td>Success - Screenshot returned</td>
-                </tr>
-                <tr>
-                    <td>400</td>
-                    <td>Bad Request - Invalid parameters</td>
-                </tr>
-                <tr>
-                    <td>401</td>
-                    <td>Unauthorized - Missing or invalid API key</td>
-                </tr>
-                <tr>
-                    <td>429</td>
-                    <td>Too Many Requests - Rate limit exceeded</td>
-                </tr>
-                <tr>
-                    <td>500</td>
-                    <td>Internal Server Error - Screenshot capture failed</td>
-                </tr>
-            </table>
-            
-            <h2>🔐 Default API Keys</h2>
-            <p>For testing purposes, the following API keys are pre-configured:</p>
-            <ul>
-                <li><code>demo-key-12345</code></li>
-                <li><code>test-key-67890</code></li>
-                <li><code>dev-key-abcde</code></li>
-            </ul>
-            
-            <div class="warning">
-                <strong>⚠️ Production Note:</strong> Replace these with secure, randomly generated keys before deployment.
-            </div>
-            
-            <h2>🚀 Quick Start</h2>
-            <ol>
-                <li>Choose an API key (or use a demo key for testing)</li>
-                <li>Make a request to <code>/screenshot</code> with your URL</li>
-                <li>Receive your screenshot image instantly</li>
-            </ol>
-            
-            <p style="margin-top: 40px; padding-top: 20px; border-top: 1px solid #ddd; color: #7f8c8d;">
-                <strong>Webpage Screenshot API v1.0.0</strong><br>
-                Need help? Check the logs at <code>logs/api_requests.log</code>
-            </p>
-        </div>
-    </body>
-    </html>
-    """
-    return render_template_string(doc_html)
+    # Conditional send answers If-None-Match / If-Modified-Since with an empty 304
+    return send_file(DOCS_FILE, mimetype='text/html', conditional=True, max_age=3600)
 
 
 if __name__ == '__main__':
@@ -1,22 +1,45 @@
 """
 Authentication Service with Secure API Key Hashing
-Handles API key validation and management using bcrypt for secure storage
+Handles API key validation and management using peppered HMAC-SHA256 for
+generated keys, with bcrypt kept for short custom keys and older entries
 """
 
-import json
+import hashlib
+import hmac
+import math
+import os
+import re
 import secrets
+import threading
+import time
 import bcrypt
+import orjson
 from pathlib import Path
 from datetime import datetime
 from typing import Optional, Dict, Tuple
 
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so the log is never compacted in place
+    fcntl = None
+
+# Size of the generated digest pepper
+PEPPER_BYTES = 32
+
+# Keys at least this long are random enough that HMAC needs no key stretching
+MIN_HMAC_KEY_LENGTH = 16
+
+# Anything outside this (whitespace, control or non-ASCII characters, huge
+# values) was never issued as a key, so it can skip the bcrypt scan
+_PLAUSIBLE_KEY = re.compile(r'[\x21-\x7e]{1,128}')
+
 
 class AuthService:
     """
     Service for secure API key authentication with bcrypt hashing
     
     Features:
-    - Secure API key hashing using bcrypt
+    - Peppered HMAC-SHA256 storage for high-entropy keys, bcrypt for the rest
     - Constant-time comparison to prevent timing attacks
     - API key generation with cryptographically secure random
     - Key management (add, deactivate, list)
@@ -30,7 +53,78 @@ class AuthService:
             api_keys_file (str): Path to API keys storage file
         """
         self.api_keys_file = Path(api_keys_file)
+        self.pepper = self._load_pepper()
+        # Mutations are appended here and replayed over the JSON snapshot on load
+        self.api_keys_log = self.api_keys_file.with_suffix('.log')
+        # Shared while appending, exclusive while compacting, across every process using the files
+        self.api_keys_lock_file = self.api_keys_file.with_suffix('.lock')
+        self._log_entries = 0
         self.api_keys = self._load_api_keys()
+        
+        # Peppered HMAC fingerprint -> storage key, so validation needs no bcrypt
+        self._lookup = self._build_lookup()
+        # Old bcrypt entries with no fingerprint yet; the only ones that need a scan
+        self._unfingerprinted = self._find_unfingerprinted()
+        
+        # Recent validation results: api_key -> (is_valid, expires_at)
+        self._validation_cache = {}
+        self._validation_cache_lock = threading.Lock()
+        self._validation_cache_ttl = 60
+        self._validation_cache_size = 4096
+        
+        # Failed-attempt buckets: client_ip -> (tokens, last_refill), refilled lazily
+        self._attempt_buckets = {}
+        self._attempt_lock = threading.Lock()
+        self._attempt_burst = 5.0
+        self._attempt_refill_per_sec = 1.0
+    
+    def _load_pepper(self) -> bytes:
+        """
+        Load the server-side secret mixed into key digests
+        
+        Uses API_KEY_PEPPER if set, otherwise a random pepper generated on first
+        run and kept next to the keys file. Losing it invalidates HMAC-stored keys.
+        
+        Returns:
+            bytes: Pepper
+        
+        Raises:
+            ValueError: If the pepper is shorter than PEPPER_BYTES
+        """
+        env_pepper = os.environ.get('API_KEY_PEPPER')
+        if env_pepper:
+            pepper = env_pepper.encode('utf-8')
+            if len(pepper) < PEPPER_BYTES:
+                raise ValueError(f"API_KEY_PEPPER must be at least {PEPPER_BYTES} bytes; "
+                                 f"generate one with: python -c \"import secrets; print(secrets.token_hex(32))\"")
+            return pepper
+        
+        pepper_file = self.api_keys_file.with_name('api_key_pepper')
+        if not pepper_file.exists():
+            self.api_keys_file.parent.mkdir(exist_ok=True)
+            pepper = secrets.token_bytes(PEPPER_BYTES)
+            
+            # Write a private temp file, then hardlink it into place: the pepper file
+            # only ever appears complete, and exactly one gunicorn worker's pepper wins
+            temp_file = pepper_file.with_name(f'.{pepper_file.name}.{os.getpid()}.{secrets.token_hex(4)}')
+            fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(pepper.hex())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.link(temp_file, pepper_file)
+                return pepper
+            except FileExistsError:
+                pass  # Another worker created it first; use theirs
+            finally:
+                temp_file.unlink(missing_ok=True)
+        
+        pepper = bytes.fromhex(pepper_file.read_text().strip())
+        if len(pepper) < PEPPER_BYTES:
+            raise ValueError(f"API key pepper in {pepper_file} is empty or truncated; "
+                             f"restore it or set API_KEY_PEPPER")
+        return pepper
     
     def _load_api_keys(self) -> Dict:
         """
@@ -58,21 +152,24 @@ class AuthService:
                     'created': datetime.now().strftime('%Y-%m-%d'),
                     'active': True,
                     'plaintext_key': demo_key[0],  # Store for initial setup only
-                    'hashed': True
+                    'hashed': True,
+                    'scheme': 'hmac-sha256'
                 },
                 test_key[1]: {
                     'name': 'Test Key',
                     'created': datetime.now().strftime('%Y-%m-%d'),
                     'active': True,
                     'plaintext_key': test_key[0],
-                    'hashed': True
+                    'hashed': True,
+                    'scheme': 'hmac-sha256'
                 },
                 dev_key[1]: {
                     'name': 'Development Key',
                     'created': datetime.now().strftime('%Y-%m-%d'),
                     'active': True,
                     'plaintext_key': dev_key[0],
-                    'hashed': True
+                    'hashed': True,
+                    'scheme': 'hmac-sha256'
                 },
                 # Legacy plaintext keys for backward compatibility (will be migrated)
                 'demo-key-12345': {
@@ -95,8 +192,9 @@ class AuthService:
                 }
             }
             
-            with open(self.api_keys_file, 'w') as f:
-                json.dump(default_keys, f, indent=2)
+            with open(self.api_keys_file, 'wb') as f:
+                f.write(orjson.dumps(default_keys, option=orjson.OPT_INDENT_2))
+            self.api_keys_log.unlink(missing_ok=True)
             
             print("=" * 60)
             print("🔐 NEW SECURE API KEYS GENERATED")
@@ -109,17 +207,126 @@ class AuthService:
             
             return default_keys
         
-        # Load existing keys
+        # Load existing keys; the shared lock keeps a compaction from swapping the files mid-read
+        lock = self._lock_files(exclusive=False)
         try:
-            with open(self.api_keys_file, 'r') as f:
-                return json.load(f)
-        except Exception:
-            return {}
+            try:
+                with open(self.api_keys_file, 'rb') as f:
+                    api_keys = orjson.loads(f.read())
+            except Exception:
+                api_keys = {}
+            
+            self._replay_log(api_keys)
+        finally:
+            if lock is not None:
+                lock.close()
+        return api_keys
+    
+    def _replay_log(self, api_keys: Dict):
+        """
+        Apply logged mutations on top of the loaded snapshot
+        
+        Args:
+            api_keys (dict): Snapshot to update in place
+        """
+        if not self.api_keys_log.exists():
+            return
+        
+        with open(self.api_keys_log, 'rb') as f:
+            for line in f:
+                try:
+                    event = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue  # Torn final line from an interrupted append
+                
+                if event['op'] == 'add':
+                    api_keys[event['key']] = event['info']
+                elif event['op'] == 'update' and event['key'] in api_keys:
+                    api_keys[event['key']].update(event['info'])
+                self._log_entries += 1
+    
+    def _lock_files(self, exclusive: bool):
+        """
+        Take the inter-process lock on the keys file and its log
+        
+        Args:
+            exclusive (bool): True to compact or rewrite, False to append
+        
+        Returns:
+            file or None: Open lock file to close when done (None without flock)
+        """
+        if fcntl is None:
+            return None
+        lock = open(self.api_keys_lock_file, 'ab')
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return lock
+    
+    def _write_snapshot(self, api_keys: Dict):
+        """Replace the snapshot with api_keys and truncate the log; callers hold the exclusive lock"""
+        temp_file = self.api_keys_file.with_suffix('.tmp')
+        with open(temp_file, 'wb') as f:
+            f.write(orjson.dumps(api_keys, option=orjson.OPT_INDENT_2))
+        os.replace(temp_file, self.api_keys_file)
+        
+        self.api_keys_log.unlink(missing_ok=True)
+        self._log_entries = 0
     
     def _save_api_keys(self):
-        """Save API keys to file"""
-        with open(self.api_keys_file, 'w') as f:
-            json.dump(self.api_keys, f, indent=2)
+        """Write this process's keys as the full snapshot and truncate the log"""
+        lock = self._lock_files(exclusive=True)
+        try:
+            self._write_snapshot(self.api_keys)
+        finally:
+            if lock is not None:
+                lock.close()
+    
+    def _compact_log(self):
+        """
+        Fold the log into a fresh snapshot
+        
+        The snapshot and log are re-read under the exclusive lock, so keys that
+        manage_keys.py or another worker appended since this process loaded
+        are kept rather than overwritten by a stale in-memory copy.
+        """
+        lock = self._lock_files(exclusive=True)
+        try:
+            with open(self.api_keys_file, 'rb') as f:
+                api_keys = orjson.loads(f.read())
+            self._replay_log(api_keys)
+            self._write_snapshot(api_keys)
+        finally:
+            lock.close()
+        
+        self.api_keys = api_keys
+        self._lookup = self._build_lookup()
+        self._unfingerprinted = self._find_unfingerprinted()
+    
+    def _append_event(self, op: str, key: str, info: Dict):
+        """
+        Record one key mutation as a line in the append-only log
+        
+        Compacts into a fresh snapshot once the log is twice the size of the key
+        set, unless the platform has no flock to make that safe.
+        
+        Args:
+            op (str): 'add' for a new entry, 'update' to merge fields into one
+            key (str): Storage key of the entry
+            info (dict): Entry (add) or changed fields (update)
+        """
+        line = orjson.dumps({'op': op, 'key': key, 'info': info}) + b'\n'
+        lock = self._lock_files(exclusive=False)
+        try:
+            with open(self.api_keys_log, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            if lock is not None:
+                lock.close()
+        
+        self._log_entries += 1
+        if fcntl is not None and self._log_entries > 2 * max(len(self.api_keys), 1):
+            self._compact_log()
     
     @staticmethod
     def hash_api_key(api_key: str) -> str:
@@ -132,7 +339,115 @@ class AuthService:
         Returns:
             str: Hashed API key
         """
-        return bcrypt.hashpw(api_key.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        # Keys are random tokens, not passwords; 10 rounds keeps key creation fast
+        return bcrypt.hashpw(api_key.encode('utf-8'), bcrypt.gensalt(rounds=10)).decode('utf-8')
+    
+    def digest_api_key(self, api_key: str) -> str:
+        """
+        Compute the peppered HMAC-SHA256 digest stored for a generated API key
+        
+        Args:
+            api_key (str): Plaintext API key
+        
+        Returns:
+            str: Hex HMAC-SHA256 digest
+        """
+        return hmac.new(self.pepper, api_key.encode('utf-8'), hashlib.sha256).hexdigest()
+    
+    def _build_lookup(self) -> Dict:
+        """
+        Map key fingerprints to their entries in api_keys
+        
+        Returns:
+            dict: Fingerprint -> storage key
+        """
+        lookup = {}
+        for stored_key, key_info in self.api_keys.items():
+            if not key_info.get('hashed', False):
+                lookup[self.digest_api_key(stored_key)] = stored_key
+            elif key_info.get('fingerprint'):
+                lookup[key_info['fingerprint']] = stored_key
+        return lookup
+    
+    def _find_unfingerprinted(self) -> Dict:
+        """
+        Collect bcrypt entries that can only be matched by checking their hash
+        
+        Returns:
+            dict: Storage key -> key info
+        """
+        return {stored_hash: key_info for stored_hash, key_info in self.api_keys.items()
+                if key_info.get('hashed', False)
+                and key_info.get('scheme') != 'hmac-sha256'
+                and not key_info.get('fingerprint')}
+    
+    def _lookup_api_key(self, api_key: str) -> Optional[str]:
+        """
+        Find the storage key for a plaintext API key by its digest alone
+        
+        Args:
+            api_key (str): Plaintext API key
+        
+        Returns:
+            str or None: Key into api_keys if found without a bcrypt check
+        """
+        digest = self.digest_api_key(api_key)
+        key_info = self.api_keys.get(digest)
+        if key_info is not None and key_info.get('scheme') == 'hmac-sha256':
+            return digest
+        
+        # bcrypt entries are fingerprinted with the same peppered HMAC
+        return self._lookup.get(digest)
+    
+    def _find_api_key(self, api_key: str) -> Optional[str]:
+        """
+        Find the storage key for a plaintext API key
+        
+        HMAC-stored keys are a single dict lookup. Hashed keys saved before
+        fingerprints were stored are found with a one-off bcrypt scan and get
+        their fingerprint recorded for next time.
+        
+        Args:
+            api_key (str): Plaintext API key
+        
+        Returns:
+            str or None: Key into api_keys if found
+        """
+        stored_key = self._lookup_api_key(api_key)
+        if stored_key is not None:
+            return stored_key
+        
+        if not self._unfingerprinted or not _PLAUSIBLE_KEY.fullmatch(api_key):
+            return None
+        
+        fingerprint = self.digest_api_key(api_key)
+        
+        for stored_hash, key_info in list(self._unfingerprinted.items()):
+            if self.verify_api_key(api_key, stored_hash):
+                key_info['fingerprint'] = fingerprint
+                self._lookup[fingerprint] = stored_hash
+                self._unfingerprinted.pop(stored_hash, None)
+                self._append_event('update', stored_hash, {'fingerprint': fingerprint})
+                return stored_hash
+        
+        return None
+    
+    def resolve_api_key(self, api_key: str) -> Optional[str]:
+        """
+        Find which stored entry a plaintext API key belongs to
+        
+        Never runs bcrypt, so it is cheap enough for arbitrary logged values;
+        bcrypt entries that have not been fingerprinted yet are not matched.
+        
+        Args:
+            api_key (str): Plaintext API key
+        
+        Returns:
+            str or None: Key into api_keys if found
+        """
+        if not _PLAUSIBLE_KEY.fullmatch(api_key):
+            return None
+        return self._lookup_api_key(api_key)
     
     @staticmethod
     def verify_api_key(plaintext_key: str, hashed_key: str) -> bool:
@@ -151,8 +466,7 @@ class AuthService:
         except Exception:
             return False
     
-    @staticmethod
-    def generate_api_key(length: int = 32) -> Tuple[str, str]:
+    def generate_api_key(self, length: int = 32) -> Tuple[str, str]:
         """
         Generate a cryptographically secure API key
         
@@ -160,48 +474,124 @@ class AuthService:
             length (int): Length of the API key (default: 32)
         
         Returns:
-            tuple: (plaintext_key, hashed_key)
+            tuple: (plaintext_key, hmac_digest)
         """
         # Generate secure random key
         plaintext_key = secrets.token_urlsafe(length)
         
-        # Hash it
-        hashed_key = AuthService.hash_api_key(plaintext_key)
+        # 256 random bits leave nothing to brute-force, so no bcrypt
+        hashed_key = self.digest_api_key(plaintext_key)
         
         return (plaintext_key, hashed_key)
     
-    def validate_api_key(self, api_key: str) -> bool:
+    def _refill_attempts(self, client_ip: str, now: float) -> float:
+        """Return the current token count for a client, topped up for elapsed time"""
+        tokens, last = self._attempt_buckets.get(client_ip, (self._attempt_burst, now))
+        return min(self._attempt_burst, tokens + (now - last) * self._attempt_refill_per_sec)
+    
+    def attempt_retry_after(self, client_ip: str) -> int:
+        """
+        Seconds until a client has a failed attempt to spend again
+        
+        Only reads the bucket. Each failed validation spends one token and
+        successful ones spend none; once the bucket is empty, unknown keys
+        from the client are refused without a bcrypt scan until it refills.
+        
+        Args:
+            client_ip (str): Address of the caller
+        
+        Returns:
+            int: 0 if the client may still fail, otherwise seconds to wait
+        """
+        with self._attempt_lock:
+            tokens = self._refill_attempts(client_ip, time.monotonic())
+        if tokens >= 1:
+            return 0
+        return max(1, math.ceil((1 - tokens) / self._attempt_refill_per_sec))
+    
+    def _record_failed_attempt(self, client_ip: str):
+        """Spend one token from a client's failed-attempt bucket"""
+        now = time.monotonic()
+        with self._attempt_lock:
+            tokens = self._refill_attempts(client_ip, now)
+            # Re-insert so the dict stays ordered by last failure; drop the stalest client when full
+            self._attempt_buckets.pop(client_ip, None)
+            if len(self._attempt_buckets) >= self._validation_cache_size:
+                self._attempt_buckets.pop(next(iter(self._attempt_buckets)))
+            self._attempt_buckets[client_ip] = (max(tokens - 1, 0.0), now)
+    
+    def validate_api_key(self, api_key: str, client_ip: Optional[str] = None) -> bool:
         """
         Validate if an API key is valid and active
         
-        Supports both hashed and legacy plaintext keys for backward compatibility
+        Supports both hashed and legacy plaintext keys for backward compatibility.
+        Results are cached for a short TTL so repeat requests skip the digest work.
         
         Args:
             api_key (str): The API key to validate
+            client_ip (str, optional): Caller address; failures are charged to it,
+                and once its bucket is empty only digest lookups are tried
         
         Returns:
             bool: True if valid and active, False otherwise
         """
-        # Check for direct match (legacy plaintext keys)
-        if api_key in self.api_keys:
-            key_info = self.api_keys[api_key]
+        now = time.monotonic()
+        
+        with self._validation_cache_lock:
+            cached = self._validation_cache.get(api_key)
+        
+        if cached and cached[1] > now:
+            is_valid = cached[0]
+        elif not _PLAUSIBLE_KEY.fullmatch(api_key):
+            # Junk values are rejected without caching so they never crowd real keys out
+            is_valid = False
+        elif client_ip is not None and self.attempt_retry_after(client_ip):
+            # Throttled clients still get digest lookups but never the bcrypt scan, so
+            # unfingerprinted bcrypt keys fail until the bucket refills
+            stored_key = self._lookup_api_key(api_key)
+            is_valid = stored_key is not None and self.api_keys[stored_key].get('active', False)
+        else:
+            is_valid = self._validate_api_key_uncached(api_key)
             
-            # If it's a plaintext key, migrate it to hashed
-            if not key_info.get('hashed', False):
-                # This is a legacy key, still allow it but recommend migration
-                return key_info.get('active', False)
-            else:
-                # This shouldn't happen (hashed key as dict key)
-                return key_info.get('active', False)
+            with self._validation_cache_lock:
+                if len(self._validation_cache) >= self._validation_cache_size:
+                    # Drop the oldest entry (dicts keep insertion order)
+                    self._validation_cache.pop(next(iter(self._validation_cache)))
+                self._validation_cache[api_key] = (is_valid, now + self._validation_cache_ttl)
         
-        # Check against all hashed keys
-        for stored_hash, key_info in self.api_keys.items():
-            if key_info.get('hashed', False):
-                # This is a hashed key, verify it
-                if self.verify_api_key(api_key, stored_hash):
-                    return key_info.get('active', False)
+        if not is_valid and client_ip is not None:
+            self._record_failed_attempt(client_ip)
         
-        return False
+        return is_valid
+    
+    def _validate_api_key_uncached(self, api_key: str) -> bool:
+        """
+        Validate an API key against the stored keys without consulting the cache
+        
+        Args:
+            api_key (str): The API key to validate
+        
+        Returns:
+            bool: True if valid and active, False otherwise
+        """
+        stored_key = self._find_api_key(api_key)
+        if stored_key is None:
+            return False
+        
+        return self.api_keys[stored_key].get('active', False)
+    
+    def invalidate(self, api_key: Optional[str] = None):
+        """
+        Drop cached validation results
+        
+        Args:
+            api_key (str, optional): Key to forget. If None, clears the whole cache.
+        """
+        with self._validation_cache_lock:
+            if api_key is None:
+                self._validation_cache.clear()
+            else:
+                self._validation_cache.pop(api_key, None)
     
     def validate_key(self, api_key: str) -> bool:
         """
@@ -222,31 +612,48 @@ class AuthService:
         Args:
             name (str): Name/description of the key
             key (str, optional): Specific key to add (will be hashed). If None, generates new key.
+                Must be 1-128 printable ASCII characters with no spaces.
         
         Returns:
             tuple: (plaintext_key, success)
         """
         if key:
+            # validate_api_key rejects anything else unseen, so such a key could never be used
+            if not _PLAUSIBLE_KEY.fullmatch(key):
+                return (key, False)
             # Use provided key
             plaintext_key = key
-            hashed_key = self.hash_api_key(key)
         else:
             # Generate new key
-            plaintext_key, hashed_key = self.generate_api_key()
+            plaintext_key = secrets.token_urlsafe(32)
         
         # Check if already exists
-        if hashed_key in self.api_keys:
+        if self._find_api_key(plaintext_key) is not None:
             return (plaintext_key, False)
         
-        # Add to storage
-        self.api_keys[hashed_key] = {
+        key_info = {
             'name': name,
             'created': datetime.now().strftime('%Y-%m-%d'),
             'active': True,
             'hashed': True
         }
         
-        self._save_api_keys()
+        if len(plaintext_key) >= MIN_HMAC_KEY_LENGTH:
+            hashed_key = self.digest_api_key(plaintext_key)
+            key_info['scheme'] = 'hmac-sha256'
+        else:
+            # Short custom keys could be guessed from a leaked digest; keep bcrypt for them.
+            # Their lookup fingerprint is peppered, so it is no easier to attack than bcrypt
+            hashed_key = self.hash_api_key(plaintext_key)
+            fingerprint = self.digest_api_key(plaintext_key)
+            key_info['fingerprint'] = fingerprint
+            self._lookup[fingerprint] = hashed_key
+        
+        # Add to storage
+        self.api_keys[hashed_key] = key_info
+        
+        self._append_event('add', hashed_key, self.api_keys[hashed_key])
+        self.invalidate()
         return (plaintext_key, True)
     
     def deactivate_api_key(self, api_key: str) -> bool:
@@ -259,21 +666,14 @@ class AuthService:
         Returns:
             bool: True if deactivated, False if not found
         """
-        # Check direct match (legacy)
-        if api_key in self.api_keys:
-            self.api_keys[api_key]['active'] = False
-            self._save_api_keys()
-            return True
-        
-        # Check hashed keys
-        for stored_hash, key_info in self.api_keys.items():
-            if key_info.get('hashed', False):
-                if self.verify_api_key(api_key, stored_hash):
-                    self.api_keys[stored_hash]['active'] = False
-                    self._save_api_keys()
-                    return True
-        
-        return False
+        stored_key = self._find_api_key(api_key)
+        if stored_key is None:
+            return False
+        
+        self.api_keys[stored_key]['active'] = False
+        self._append_event('update', stored_key, {'active': False})
+        self.invalidate(api_key)
+        return True
     
     def list_api_keys(self) -> Dict:
         """
@@ -323,6 +723,7 @@ class AuthService:
                     'created': datetime.now().strftime('%Y-%m-%d'),
                     'active': info.get('active', True),
                     'hashed': True,
+                    'scheme': 'hmac-sha256',
                     'migrated_from': old_key
                 }
                 
@@ -330,6 +731,9 @@ class AuthService:
         
         # Replace old keys with new ones
         self.api_keys = new_keys
+        self._lookup = self._build_lookup()
+        self._unfingerprinted = self._find_unfingerprinted()
         self._save_api_keys()
+        self.invalidate()
         
         return migrations
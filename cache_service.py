@@ -3,50 +3,209 @@ Cache Service
 Handles screenshot caching with 24-hour expiration
 """
 
+import atexit
 import hashlib
-import json
+import os
+import orjson
+import shutil
+import sqlite3
+import threading
 import time
+from collections import OrderedDict
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 
 
 class CacheService:
     """Service for caching screenshots"""
     
-    def __init__(self, cache_duration_hours=24):
+    def __init__(self, cache_duration_hours=24, hot_cache_size=1024):
         """
         Initialize cache service
         
         Args:
             cache_duration_hours (int): Cache duration in hours
+            hot_cache_size (int): In-memory LRU entries kept in front of the index (0 disables)
         """
         self.cache_duration_hours = cache_duration_hours
+        self._cache_duration_seconds = cache_duration_hours * 3600
+        
+        # Most hits go to a few URLs; remember them as cache_key -> (file_path, expires)
+        self.hot_cache_size = hot_cache_size
+        self._hot = OrderedDict()
+        self._hot_lock = threading.Lock()
         self.cache_dir = Path('cache')
         self.cache_dir.mkdir(exist_ok=True)
         
+        # Image bytes are stored once per unique content under blobs/
+        self.blobs_dir = self.cache_dir / 'blobs'
+        self.blobs_dir.mkdir(exist_ok=True)
+        
+        # Index lives in SQLite (WAL) so lookups and inserts touch one row
+        # instead of rewriting a JSON file; one connection per thread
+        self.cache_db_file = self.cache_dir / 'index.db'
+        self._local = threading.local()
+        self._init_db()
+        
         self.cache_index_file = self.cache_dir / 'cache_index.json'
-        self.cache_index = self._load_cache_index()
+        self._migrate_json_index()
+        
+        # Stale entries found on lookup are queued and removed in batches,
+        # keeping writes off the request path
+        self._pending_evictions = set()
+        self._eviction_lock = threading.Lock()
+        self._eviction_event = threading.Event()
+        threading.Thread(target=self._eviction_flusher, name='cache-evict', daemon=True).start()
+        atexit.register(self.flush_evictions)
     
-    def _load_cache_index(self):
-        """Load cache index from file"""
-        if not self.cache_index_file.exists():
-            return {}
+    def _get_connection(self):
+        """Get this thread's SQLite connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.cache_db_file), isolation_level=None, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def _init_db(self):
+        """Create the index tables if needed"""
+        conn = self._get_connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, file_path TEXT NOT NULL, original_path TEXT, '
+            'ts REAL NOT NULL, expires REAL NOT NULL, blob_hash TEXT NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_entries_expires ON entries(expires)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            'hash TEXT PRIMARY KEY, file_path TEXT NOT NULL, refcount INTEGER NOT NULL)'
+        )
+    
+    def _release_entry(self, conn, file_path, blob_hash):
+        """
+        Drop one reference to an entry's blob, deleting it when unused
+        
+        Args:
+            conn: SQLite connection inside an open transaction
+            file_path (str): Path stored for the entry
+            blob_hash (str): Content hash of the blob
+        """
+        conn.execute('UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?', (blob_hash,))
+        row = conn.execute('SELECT refcount FROM blobs WHERE hash = ?', (blob_hash,)).fetchone()
+        if row is not None and row[0] > 0:
+            return
+        conn.execute('DELETE FROM blobs WHERE hash = ?', (blob_hash,))
         
         try:
-            with open(self.cache_index_file, 'r') as f:
-                return json.load(f)
+            Path(file_path).unlink()
         except Exception:
-            return {}
+            pass
+    
+    def _ref_blob(self, conn, source_path, blob_hash):
+        """
+        Add one reference to the blob for a file's content, storing it if new
+        
+        Args:
+            conn: SQLite connection inside an open transaction
+            source_path (Path): File holding the content
+            blob_hash (str): Content hash of source_path
+        
+        Returns:
+            Path: Blob path for the entry
+        """
+        blob_dir = self.blobs_dir / blob_hash[:2]
+        blob_path = blob_dir / f"{blob_hash}{source_path.suffix}"
+        
+        if conn.execute('SELECT 1 FROM blobs WHERE hash = ?', (blob_hash,)).fetchone():
+            conn.execute('UPDATE blobs SET refcount = refcount + 1 WHERE hash = ?', (blob_hash,))
+        else:
+            blob_dir.mkdir(exist_ok=True)
+            self._store_blob(source_path, blob_path)
+            conn.execute(
+                'INSERT INTO blobs (hash, file_path, refcount) VALUES (?, ?, 1)',
+                (blob_hash, str(blob_path))
+            )
+        return blob_path
+    
+    @staticmethod
+    def _store_blob(source_path, blob_path):
+        """
+        Place a screenshot in the blob store without copying bytes when possible
+        
+        Args:
+            source_path (Path): Captured screenshot
+            blob_path (Path): Destination inside the blob store
+        """
+        try:
+            # Hardlink when both live on the same filesystem
+            os.link(source_path, blob_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Cross-device: copyfile uses sendfile(2) on Linux
+            shutil.copyfile(source_path, blob_path)
+    
+    @staticmethod
+    def _hash_file(path):
+        """Content hash of a file, read in chunks"""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
     
-    def _save_cache_index(self):
-        """Save cache index to file"""
+    def _migrate_json_index(self):
+        """Import entries from the old JSON index once, then retire the file"""
+        if not self.cache_index_file.exists():
+            return
+        
         try:
-            with open(self.cache_index_file, 'w') as f:
-                json.dump(self.cache_index, f, indent=2)
+            with open(self.cache_index_file, 'rb') as f:
+                old_index = orjson.loads(f.read())
+            
+            # ISO timestamps are parsed here once; lookups only ever compare the stored float
+            now = time.time()
+            conn = self._get_connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for cache_key, cache_entry in old_index.items():
+                    old_file = Path(cache_entry['file_path'])
+                    cached_ts = datetime.fromisoformat(cache_entry['timestamp']).timestamp()
+                    expires = cached_ts + self._cache_duration_seconds
+                    # Another worker may have imported the entry first
+                    if expires < now or not old_file.exists() or conn.execute(
+                            'SELECT 1 FROM entries WHERE key = ?', (cache_key,)).fetchone():
+                        continue
+                    
+                    # Old per-key copies move into the blob store like fresh captures
+                    blob_hash = self._hash_file(old_file)
+                    blob_path = self._ref_blob(conn, old_file, blob_hash)
+                    conn.execute(
+                        'INSERT INTO entries (key, file_path, original_path, ts, expires, blob_hash) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (cache_key, str(blob_path), cache_entry.get('original_path'),
+                         cached_ts, expires, blob_hash)
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            
+            # Every per-key file is now linked into blobs/ or stale; none is referenced by the index
+            for cache_entry in old_index.values():
+                try:
+                    Path(cache_entry['file_path']).unlink(missing_ok=True)
+                except OSError:
+                    pass
+            self.cache_index_file.rename(self.cache_index_file.with_suffix('.json.migrated'))
         except Exception as e:
-            print(f"Error saving cache index: {e}")
+            print(f"Error migrating cache index: {e}")
     
-    def generate_cache_key(self, url, width, height, fullpage, image_format, quality, delay=0):
+    def generate_cache_key(self, url, width, height, fullpage, image_format, quality, delay=0,
+                           selector=None, device=None, user_agent=None, dark_mode=False,
+                           wait_for_selector=None, block_ads=False, scroll_page=False,
+                           media_type=None, timezone=None, compression=None, wait_until=None):
         """
         Generate a unique cache key based on parameters
         
@@ -58,12 +217,40 @@ class CacheService:
             image_format (str): Image format
             quality (int): Image quality
             delay (int): Delay before capture in milliseconds
+            selector (str): CSS selector for element capture
+            device (str): Device emulation name
+            user_agent (str): Custom user agent
+            dark_mode (bool): Dark mode flag
+            wait_for_selector (str): Selector waited for before capture
+            block_ads (bool): Ad blocking flag
+            scroll_page (bool): Lazy-load scrolling flag
+            media_type (str): Emulated media type
+            timezone (str): Timezone ID
+            compression (int): PNG compression level
+            wait_until (str): Navigation wait strategy
         
         Returns:
             str: Cache key hash
         """
-        key_string = f"{url}|{width}|{height}|{fullpage}|{image_format}|{quality}|{delay}"
-        return hashlib.sha256(key_string.encode()).hexdigest()
+        # Feed the hash piece by piece instead of building one joined string
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(url).encode('utf-8', 'replace'))
+        
+        numbers = (width, height, fullpage, quality, delay, dark_mode, block_ads, scroll_page)
+        if all(type(v) is int or type(v) is bool for v in numbers):
+            digest.update(b'|%d|%d|%d|%d|%d|%d|%d|%d|' % numbers)
+        else:
+            # Floats and unvalidated values (the cache is probed before validation)
+            # keep their full repr so 1280.5 never shares 1280's key
+            digest.update(repr(numbers).encode('utf-8', 'replace'))
+        
+        for value in (image_format, selector, device, user_agent, wait_for_selector,
+                      media_type, timezone, compression, wait_until):
+            digest.update(b'|')
+            if value is not None:
+                digest.update(str(value).encode('utf-8', 'replace'))
+        
+        return digest.hexdigest()
     
     def get_cached_screenshot(self, cache_key):
         """
@@ -75,35 +262,148 @@ class CacheService:
         Returns:
             str or None: Path to cached file if valid, None otherwise
         """
+        now = time.time()
+        
+        # Hot entries skip the index query. They are still stat'ed: another worker
+        # process can evict the file without touching this process's _hot
+        with self._hot_lock:
+            hot = self._hot.get(cache_key)
+            if hot is not None:
+                if now <= hot[1] and os.path.exists(hot[0]):
+                    self._hot.move_to_end(cache_key)
+                    return hot[0]
+                del self._hot[cache_key]
+        
+        conn = self._get_connection()
+        row = conn.execute(
+            'SELECT file_path, expires FROM entries WHERE key = ?', (cache_key,)
+        ).fetchone()
+        
         # Check if cache entry exists
-        if cache_key not in self.cache_index:
+        if row is None:
             return None
         
-        cache_entry = self.cache_index[cache_key]
-        cached_file = Path(cache_entry['file_path'])
+        file_path, expires = row
+        cached_file = Path(file_path)
         
-        # Check if file exists
-        if not cached_file.exists():
-            # Remove invalid entry
-            del self.cache_index[cache_key]
-            self._save_cache_index()
+        # Check if cache is expired or the file is gone; eviction happens in the background
+        if now > expires or not cached_file.exists():
+            self.mark_missing(cache_key)
             return None
         
-        # Check if cache is expired
-        cached_time = datetime.fromisoformat(cache_entry['timestamp'])
-        expiry_time = cached_time + timedelta(hours=self.cache_duration_hours)
+        self._remember_hot(cache_key, file_path, expires)
+        return file_path
+    
+    def content_etag(self, file_path):
+        """
+        Content hash of a file returned by this cache, for use as an ETag
+        
+        Blobs are named after their hash, so those are answered without reading the file.
+        
+        Args:
+            file_path (str): Path from get_cached_screenshot or cache_screenshot
+        
+        Returns:
+            str: Hex content hash
+        """
+        path = Path(file_path)
+        if path.parent.parent == self.blobs_dir:
+            return path.stem
+        return self._hash_file(path)
+    
+    def mark_missing(self, cache_key):
+        """
+        Treat an entry as unusable: drop it from the LRU and queue its eviction
+        
+        Callers use this when a path returned by get_cached_screenshot turns out
+        to be gone by the time they open it.
+        
+        Args:
+            cache_key (str): Cache key
+        """
+        self._forget_hot([cache_key])
+        with self._eviction_lock:
+            self._pending_evictions.add(cache_key)
+        self._eviction_event.set()
+    
+    def _remember_hot(self, cache_key, file_path, expires):
+        """Insert an entry into the in-memory LRU, evicting the least recently used"""
+        if self.hot_cache_size <= 0:
+            return
         
-        if datetime.now() > expiry_time:
-            # Cache expired, remove it
+        with self._hot_lock:
+            self._hot[cache_key] = (file_path, expires)
+            self._hot.move_to_end(cache_key)
+            if len(self._hot) > self.hot_cache_size:
+                self._hot.popitem(last=False)
+    
+    def _forget_hot(self, cache_keys=None):
+        """
+        Drop entries from the in-memory LRU
+        
+        Args:
+            cache_keys (iterable): Keys to drop. If None, clears the LRU.
+        """
+        with self._hot_lock:
+            if cache_keys is None:
+                self._hot.clear()
+            else:
+                for cache_key in cache_keys:
+                    self._hot.pop(cache_key, None)
+    
+    def _eviction_flusher(self, interval=1.0):
+        """Background loop that applies queued evictions at most once per interval"""
+        while True:
+            self._eviction_event.wait()
+            time.sleep(interval)
             try:
-                cached_file.unlink()
-            except Exception:
-                pass
-            del self.cache_index[cache_key]
-            self._save_cache_index()
-            return None
+                self.flush_evictions()
+            except Exception as e:
+                print(f"Error evicting cache entries: {e}")
+    
+    def flush_evictions(self):
+        """
+        Delete entries queued by get_cached_screenshot in one transaction
+        
+        Entries are re-checked first, since a key may have been re-cached
+        after it was queued.
+        
+        Returns:
+            int: Number of entries removed
+        """
+        with self._eviction_lock:
+            pending = self._pending_evictions
+            self._pending_evictions = set()
+            self._eviction_event.clear()
+        
+        if not pending:
+            return 0
+        
+        self._forget_hot(pending)
+        conn = self._get_connection()
+        now = time.time()
+        removed = 0
+        
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for cache_key in pending:
+                row = conn.execute(
+                    'SELECT file_path, blob_hash, expires FROM entries WHERE key = ?', (cache_key,)
+                ).fetchone()
+                if row is None:
+                    continue
+                
+                file_path, blob_hash, expires = row
+                if now > expires or not Path(file_path).exists():
+                    conn.execute('DELETE FROM entries WHERE key = ?', (cache_key,))
+                    self._release_entry(conn, file_path, blob_hash)
+                    removed += 1
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
         
-        return str(cached_file)
+        return removed
     
     def cache_screenshot(self, cache_key, screenshot_path):
         """
@@ -118,28 +418,39 @@ class CacheService:
         """
         source_path = Path(screenshot_path)
         
-        # Determine file extension
-        extension = source_path.suffix
-        
-        # Create cached file path
-        cached_filename = f"{cache_key}{extension}"
-        cached_filepath = self.cache_dir / cached_filename
+        conn = self._get_connection()
+        self._forget_hot([cache_key])
         
-        # Copy file to cache directory
         try:
-            import shutil
-            shutil.copy2(source_path, cached_filepath)
-            
-            # Update cache index
-            self.cache_index[cache_key] = {
-                'file_path': str(cached_filepath),
-                'timestamp': datetime.now().isoformat(),
-                'original_path': str(source_path)
-            }
+            # Identical renders from different parameters share one blob
+            blob_hash = self._hash_file(source_path)
             
-            self._save_cache_index()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Release whatever this key pointed at before
+                row = conn.execute(
+                    'SELECT file_path, blob_hash FROM entries WHERE key = ?', (cache_key,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute('DELETE FROM entries WHERE key = ?', (cache_key,))
+                    self._release_entry(conn, *row)
+                
+                blob_path = self._ref_blob(conn, source_path, blob_hash)
+                
+                # Update cache index
+                now = time.time()
+                conn.execute(
+                    'INSERT INTO entries (key, file_path, original_path, ts, expires, blob_hash) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (cache_key, str(blob_path), str(source_path), now,
+                     now + self._cache_duration_seconds, blob_hash)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
             
-            return str(cached_filepath)
+            return str(blob_path)
         
         except Exception as e:
             print(f"Error caching screenshot: {e}")
@@ -147,39 +458,49 @@ class CacheService:
     
     def cleanup_expired_cache(self):
         """Remove all expired cache entries"""
-        current_time = datetime.now()
-        expired_keys = []
+        conn = self._get_connection()
+        now = time.time()
         
-        for cache_key, cache_entry in self.cache_index.items():
-            cached_time = datetime.fromisoformat(cache_entry['timestamp'])
-            expiry_time = cached_time + timedelta(hours=self.cache_duration_hours)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            expired = conn.execute(
+                'SELECT key, file_path, blob_hash FROM entries WHERE expires < ?', (now,)
+            ).fetchall()
             
-            if current_time > expiry_time:
-                expired_keys.append(cache_key)
-                # Try to remove the file
-                try:
-                    Path(cache_entry['file_path']).unlink()
-                except Exception:
-                    pass
-        
-        # Remove expired entries from index
-        for key in expired_keys:
-            del self.cache_index[key]
-        
-        if expired_keys:
-            self._save_cache_index()
+            # Remove expired entries from index, deleting blobs nobody references
+            self._forget_hot([cache_key for cache_key, _, _ in expired])
+            for cache_key, file_path, blob_hash in expired:
+                conn.execute('DELETE FROM entries WHERE key = ?', (cache_key,))
+                self._release_entry(conn, file_path, blob_hash)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
         
-        return len(expired_keys)
+        return len(expired)
     
     def clear_all_cache(self):
         """Clear all cached screenshots"""
+        conn = self._get_connection()
+        
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            paths = conn.execute(
+                'SELECT file_path FROM entries UNION SELECT file_path FROM blobs'
+            ).fetchall()
+            
+            # Clear index
+            self._forget_hot()
+            conn.execute('DELETE FROM entries')
+            conn.execute('DELETE FROM blobs')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        
         # Remove all cached files
-        for cache_entry in self.cache_index.values():
+        for (file_path,) in paths:
             try:
-                Path(cache_entry['file_path']).unlink()
+                Path(file_path).unlink()
             except Exception:
                 pass
-        
-        # Clear index
-        self.cache_index = {}
-        self._save_cache_index()
@@ -3,21 +3,32 @@ Screenshot Comparison Service
 Handles visual regression testing and screenshot diff
 """
 
-from PIL import Image, ImageChops, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont
 from pathlib import Path
+import filecmp
 import hashlib
+import numpy as np
+import os
+import shutil
+import uuid
 from datetime import datetime
 
+# Rows per slice when thresholding a diff; keeps temporaries cache-sized for wide images
+DIFF_BAND_ROWS = 256
+
 
 class ComparisonService:
     """Service for comparing screenshots and detecting visual differences"""
     
+    # Label font, loaded on first use and shared by every visualization
+    _font = None
+    
     def __init__(self):
         self.comparisons_dir = Path('comparisons')
         self.comparisons_dir.mkdir(exist_ok=True)
     
     def compare_images(self, image1_path, image2_path, threshold=0.1, 
-                      highlight_color=(255, 0, 0), create_diff_image=True):
+                      highlight_color=(255, 0, 0), create_diff_image=True, fast=False):
         """
         Compare two images and detect differences
         
@@ -27,30 +38,47 @@ class ComparisonService:
             threshold (float): Difference threshold (0.0 - 1.0)
             highlight_color (tuple): RGB color for highlighting differences
             create_diff_image (bool): Create a visual diff image
+            fast (bool): Measure the diff on copies scaled to fit 640px; pixel counts
+                then refer to the scaled images. The diff image stays full size.
         
         Returns:
             dict: Comparison results with diff percentage and diff image path
         """
         try:
+            # Byte-identical files need no decode or pixel diff; filecmp checks size first
+            if filecmp.cmp(image1_path, image2_path, shallow=False):
+                with Image.open(image1_path) as img:
+                    size = img.size
+                return {
+                    'passed': True,
+                    'diff_percentage': 0.0,
+                    'threshold': threshold * 100,
+                    'total_pixels': size[0] * size[1],
+                    'different_pixels': 0,
+                    'image1_size': size,
+                    'image2_size': size
+                }
+            
             # Load images
             img1 = Image.open(image1_path).convert('RGB')
             img2 = Image.open(image2_path).convert('RGB')
             
             # Resize images to match if needed
             if img1.size != img2.size:
-                # Resize img2 to match img1
-                img2 = img2.resize(img1.size, Image.Resampling.LANCZOS)
+                # Resize img2 to match img1; bilinear is plenty for a thresholded diff
+                img2 = img2.resize(img1.size, Image.Resampling.BILINEAR)
             
             # Calculate difference
-            diff_img = ImageChops.difference(img1, img2)
-            
-            # Calculate diff percentage
-            diff_pixels = 0
-            total_pixels = img1.width * img1.height
-            
-            for pixel in diff_img.getdata():
-                if sum(pixel) > 30:  # Threshold for considering a pixel different
-                    diff_pixels += 1
+            if fast:
+                # Pass/fail barely moves at a quarter of the resolution, with a sixteenth of the pixels
+                sample1 = img1.copy()
+                sample1.thumbnail((640, 640), Image.Resampling.BILINEAR)
+                sample2 = img2.resize(sample1.size, Image.Resampling.BILINEAR)
+                mask, diff_pixels = self._compute_diff(sample1, sample2)
+                total_pixels = sample1.width * sample1.height
+            else:
+                mask, diff_pixels = self._compute_diff(img1, img2)
+                total_pixels = img1.width * img1.height
             
             diff_percentage = (diff_pixels / total_pixels) * 100
             
@@ -69,8 +97,10 @@ class ComparisonService:
             
             # Create diff visualization if requested
             if create_diff_image and diff_percentage > 0:
+                if fast:
+                    mask, _ = self._compute_diff(img1, img2)
                 diff_image_path = self._create_diff_visualization(
-                    img1, img2, diff_img, highlight_color, diff_percentage
+                    img1, img2, mask, highlight_color, diff_percentage
                 )
                 result['diff_image'] = str(diff_image_path)
             
@@ -79,14 +109,40 @@ class ComparisonService:
         except Exception as e:
             raise Exception(f"Failed to compare images: {str(e)}")
     
-    def _create_diff_visualization(self, img1, img2, diff_img, highlight_color, diff_percentage):
+    @staticmethod
+    def _compute_diff(img1, img2):
+        """
+        Mark and count the pixels that differ between two same-sized RGB images
+        
+        A pixel counts as different when its channel differences sum past 30.
+        
+        Returns:
+            tuple: (boolean mask array (height x width), number of differing pixels)
+        """
+        # Read both images in place; no third full-size difference image is built
+        pixels1 = np.asarray(img1)
+        pixels2 = np.asarray(img2)
+        mask = np.empty(pixels1.shape[:2], dtype=bool)
+        diff_pixels = 0
+        
+        # Widen and subtract a band of rows at a time so 4K+ captures never hold a
+        # full-size int16 copy; the sum fits int16 (3 * 255). Counting each band
+        # while it is still in cache saves a second walk over the whole mask.
+        for top in range(0, pixels1.shape[0], DIFF_BAND_ROWS):
+            rows = slice(top, top + DIFF_BAND_ROWS)
+            band = np.abs(pixels1[rows].astype(np.int16) - pixels2[rows])
+            band_mask = np.greater(band.sum(axis=2, dtype=np.int16), 30, out=mask[rows])
+            diff_pixels += int(np.count_nonzero(band_mask))
+        return mask, diff_pixels
+    
+    def _create_diff_visualization(self, img1, img2, mask, highlight_color, diff_percentage):
         """
         Create a visual diff image with side-by-side comparison
         
         Args:
             img1: PIL Image (baseline)
             img2: PIL Image (current)
-            diff_img: PIL Image (difference)
+            mask: Boolean array (height x width), True where pixels differ
             highlight_color: RGB tuple for highlights
             diff_percentage: Percentage difference
         
@@ -96,31 +152,24 @@ class ComparisonService:
         # Create side-by-side comparison
         width, height = img1.size
         
-        # Create canvas for 3 images side by side
-        comparison = Image.new('RGB', (width * 3 + 60, height + 80), 'white')
+        # Create canvas for 3 images side by side, filling it through array slices
+        canvas = np.full((height + 80, width * 3 + 60, 3), 255, dtype=np.uint8)
+        current = np.asarray(img2)
         
         # Add images
-        comparison.paste(img1, (10, 60))
-        comparison.paste(img2, (width + 30, 60))
+        canvas[60:60 + height, 10:10 + width] = np.asarray(img1)
+        canvas[60:60 + height, width + 30:width * 2 + 30] = current
         
-        # Create highlighted diff
-        diff_highlighted = img2.copy()
-        diff_pixels = diff_img.load()
-        highlighted_pixels = diff_highlighted.load()
+        # Create highlighted diff in place in the third panel
+        diff_panel = canvas[60:60 + height, width * 2 + 50:width * 3 + 50]
+        diff_panel[...] = current
+        diff_panel[mask] = highlight_color
         
-        for y in range(height):
-            for x in range(width):
-                if sum(diff_pixels[x, y]) > 30:
-                    highlighted_pixels[x, y] = highlight_color
-        
-        comparison.paste(diff_highlighted, (width * 2 + 50, 60))
+        comparison = Image.fromarray(canvas)
         
         # Add labels
         draw = ImageDraw.Draw(comparison)
-        try:
-            font = ImageFont.truetype("arial.ttf", 20)
-        except:
-            font = ImageFont.load_default()
+        font = self._get_font()
         
         draw.text((10, 10), "Baseline", fill='black', font=font)
         draw.text((width + 30, 10), "Current", fill='black', font=font)
@@ -131,14 +180,25 @@ class ComparisonService:
         status_color = 'green' if diff_percentage < 2.0 else 'red'
         draw.text((10, height + 65), status_text, fill=status_color, font=font)
         
-        # Save comparison image
+        # Save comparison image; gunicorn threads can finish compares within the same second
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'diff_{timestamp}.png'
+        filename = f'diff_{timestamp}_{uuid.uuid4().hex[:8]}.png'
         filepath = self.comparisons_dir / filename
-        comparison.save(filepath)
+        # A triple-width composite is big; zlib level 1 trades a little size for much cheaper encoding
+        comparison.save(filepath, 'PNG', compress_level=1)
         
         return filepath
     
+    @classmethod
+    def _get_font(cls):
+        """Return the label font, parsing the font file only once"""
+        if cls._font is None:
+            try:
+                cls._font = ImageFont.truetype("arial.ttf", 20)
+            except OSError:
+                cls._font = ImageFont.load_default()
+        return cls._font
+    
     def compare_by_url(self, url, baseline_path, screenshot_service, **capture_params):
         """
         Capture a new screenshot and compare with baseline
@@ -181,13 +241,17 @@ class ComparisonService:
         baselines_dir.mkdir(exist_ok=True)
         
         if not baseline_name:
-            baseline_name = hashlib.md5(screenshot_path.encode()).hexdigest()
+            baseline_name = hashlib.blake2b(screenshot_path.encode(), digest_size=16).hexdigest()
         
         baseline_path = baselines_dir / f"{baseline_name}.png"
         
-        # Copy screenshot to baselines
-        import shutil
-        shutil.copy2(screenshot_path, baseline_path)
+        # Baselines are never modified in place, so a hardlink to the screenshot is
+        # enough; fall back to copying across filesystems
+        baseline_path.unlink(missing_ok=True)
+        try:
+            os.link(screenshot_path, baseline_path)
+        except OSError:
+            shutil.copy2(screenshot_path, baseline_path)
         
         return str(baseline_path)
     
@@ -201,6 +265,8 @@ class ComparisonService:
         Returns:
             str or None: Path to baseline if exists
         """
+        # Stat on every call rather than memoizing: another worker or an operator
+        # may delete a baseline, and one exists() costs about as much as a cache lookup
         baselines_dir = Path('baselines')
         baseline_path = baselines_dir / f"{baseline_name}.png"
         
@@ -6,17 +6,38 @@ Handles usage statistics, analytics, and API key management
 from datetime import datetime, timedelta
 from pathlib import Path
 import json
+import os
+import psutil
+import re
+import time
 from collections import defaultdict
 
+# Matches the request log format in app.py:
+# '%(asctime)s - %(levelname)s - [%(api_key)s] - %(url)s - %(status)s - %(message)s'
+LOG_LINE_RE = re.compile(
+    r'(?P<timestamp>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \w+ - '
+    r'\[(?P<api_key>[^\]]*)\] - (?P<url>.*?) - (?P<status>\S+) - (?P<message>.*)'
+)
+LOG_KEYWORDS_RE = re.compile(r'successfully|cache|/screenshot|/batch|/compare|pdf|png|jpeg',
+                             re.IGNORECASE)
+
 
 class DashboardService:
     """Service for dashboard analytics and statistics"""
     
     def __init__(self, log_file='logs/api_requests.log'):
         self.log_file = Path(log_file)
+        # cache_key -> (stored_at, value); each entry ages on its own
         self.stats_cache = {}
-        self.cache_time = None
         self.cache_duration = 300  # 5 minutes
+        
+        # Prime CPU sampling so get_system_health reads the delta without blocking
+        psutil.cpu_percent(interval=None)
+        # Boot time never changes; read it once
+        try:
+            self._boot_time = psutil.boot_time()
+        except Exception:
+            self._boot_time = None
     
     def get_api_usage_stats(self, api_key=None, days=30):
         """
@@ -32,30 +53,29 @@ class DashboardService:
         # Check cache
         cache_key = f"{api_key}_{days}"
         if self._is_cache_valid(cache_key):
-            return self.stats_cache.get(cache_key)
+            return self.stats_cache[cache_key][1]
         
         stats = self._analyze_logs(api_key, days)
         
         # Update cache
-        self.stats_cache[cache_key] = stats
-        self.cache_time = datetime.now()
+        self.stats_cache[cache_key] = (time.monotonic(), stats)
         
         return stats
     
     def _is_cache_valid(self, cache_key):
         """Check if cache is still valid"""
-        if not self.cache_time or cache_key not in self.stats_cache:
+        entry = self.stats_cache.get(cache_key)
+        if entry is None:
             return False
         
-        age = (datetime.now() - self.cache_time).total_seconds()
-        return age < self.cache_duration
+        return time.monotonic() - entry[0] < self.cache_duration
     
     def _analyze_logs(self, api_key, days):
         """Analyze log file for statistics"""
         if not self.log_file.exists():
             return self._empty_stats()
         
-        cutoff_date = datetime.now() - timedelta(days=days)
+        cutoff = self._cutoff_timestamp(days)
         
         stats = {
             'total_requests': 0,
@@ -77,88 +97,82 @@ class DashboardService:
         }
         
         try:
-            with open(self.log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    try:
-                        # Parse log line
-                        if ' - ' not in line:
-                            continue
-                        
-                        # Extract timestamp
-                        timestamp_str = line.split('[')[1].split(']')[0] if '[' in line else None
-                        if not timestamp_str:
-                            continue
-                        
-                        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S,%f')
-                        
-                        if timestamp < cutoff_date:
-                            continue
-                        
-                        # Filter by API key if specified
-                        if api_key and api_key not in line:
-                            continue
-                        
-                        # Count requests
-                        stats['total_requests'] += 1
-                        
-                        # Count by day
-                        day_key = timestamp.strftime('%Y-%m-%d')
-                        stats['requests_by_day'][day_key] += 1
-                        
-                        # Count by hour
-                        hour_key = timestamp.hour
-                        stats['requests_by_hour'][hour_key] += 1
-                        
-                        # Extract status code
-                        if ' 200 ' in line or 'successfully' in line.lower():
-                            stats['successful_requests'] += 1
-                            stats['requests_by_status']['200'] += 1
-                        elif ' 400 ' in line:
-                            stats['failed_requests'] += 1
-                            stats['requests_by_status']['400'] += 1
-                        elif ' 401 ' in line:
-                            stats['failed_requests'] += 1
-                            stats['requests_by_status']['401'] += 1
-                        elif ' 429 ' in line:
-                            stats['failed_requests'] += 1
-                            stats['requests_by_status']['429'] += 1
-                        elif ' 500 ' in line:
-                            stats['failed_requests'] += 1
-                            stats['requests_by_status']['500'] += 1
-                        
-                        # Count cached requests
-                        if 'cache' in line.lower():
-                            stats['cached_requests'] += 1
-                        
-                        # Count by endpoint
-                        if '/screenshot' in line:
-                            stats['requests_by_endpoint']['screenshot'] += 1
-                            stats['total_screenshots'] += 1
-                        if '/batch' in line:
-                            stats['requests_by_endpoint']['batch'] += 1
-                        if '/compare' in line:
-                            stats['requests_by_endpoint']['compare'] += 1
-                            stats['total_comparisons'] += 1
-                        if 'pdf' in line.lower():
-                            stats['total_pdfs'] += 1
-                            stats['formats_used']['pdf'] += 1
-                        if 'png' in line.lower():
-                            stats['formats_used']['png'] += 1
-                        if 'jpeg' in line.lower():
-                            stats['formats_used']['jpeg'] += 1
-                        
-                        # Extract URL if present
-                        if 'URL:' in line or 'url=' in line:
-                            # Simple URL extraction (can be improved)
-                            pass
-                        
-                    except Exception as e:
-                        # Skip malformed log lines
+            # Walk the log newest-first and stop at the first line older than the window
+            for line in self._iter_lines_reverse(self.log_file):
+                try:
+                    # Parse log line
+                    match = LOG_LINE_RE.match(line)
+                    if match is None:
+                        continue
+                    
+                    # Fixed-width stamps compare correctly as strings; no datetime per line
+                    timestamp = match['timestamp']
+                    
+                    if timestamp < cutoff:
+                        break
+                    
+                    # Filter by API key if specified
+                    if api_key and match['api_key'] != api_key:
                         continue
+                    
+                    # Count requests
+                    stats['total_requests'] += 1
+                    
+                    # Count by day
+                    day_key = timestamp[:10]
+                    stats['requests_by_day'][day_key] += 1
+                    
+                    # Count by hour
+                    hour_key = int(timestamp[11:13])
+                    stats['requests_by_hour'][hour_key] += 1
+                    
+                    # One scan of the url and message finds every keyword counted below
+                    keywords = {word.lower() for word in LOG_KEYWORDS_RE.findall(line, match.start('url'))}
+                    
+                    # Extract status code
+                    status = match['status']
+                    if status == '200' or 'successfully' in keywords:
+                        stats['successful_requests'] += 1
+                        stats['requests_by_status']['200'] += 1
+                    elif status[:1] in ('4', '5'):
+                        stats['failed_requests'] += 1
+                        stats['requests_by_status'][status] += 1
+                    
+                    # Count cached requests
+                    if 'cache' in keywords:
+                        stats['cached_requests'] += 1
+                    
+                    # Count by endpoint
+                    if '/screenshot' in keywords:
+                        stats['requests_by_endpoint']['screenshot'] += 1
+                        stats['total_screenshots'] += 1
+                    if '/batch' in keywords:
+                        stats['requests_by_endpoint']['batch'] += 1
+                    if '/compare' in keywords:
+                        stats['requests_by_endpoint']['compare'] += 1
+                        stats['total_comparisons'] += 1
+                    if 'pdf' in keywords:
+                        stats['total_pdfs'] += 1
+                        stats['formats_used']['pdf'] += 1
+                    if 'png' in keywords:
+                        stats['formats_used']['png'] += 1
+                    if 'jpeg' in keywords:
+                        stats['formats_used']['jpeg'] += 1
+                    
+                    # Count target URLs
+                    if match['url'] != 'N/A':
+                        stats['top_urls'][match['url']] += 1
+                    
+                except Exception as e:
+                    # Skip malformed log lines
+                    continue
         
         except Exception as e:
             print(f"Error analyzing logs: {e}")
         
+        # Lines were read newest-first; keep the per-day series chronological
+        stats['requests_by_day'] = dict(sorted(stats['requests_by_day'].items()))
+        
         # Calculate derived stats
         if stats['total_requests'] > 0:
             stats['success_rate'] = round((stats['successful_requests'] / stats['total_requests']) * 100, 2)
@@ -169,6 +183,42 @@ class DashboardService:
         
         return stats
     
+    @staticmethod
+    def _cutoff_timestamp(days):
+        """Format the start of the analysis window the way log lines stamp asctime"""
+        cutoff_date = datetime.now() - timedelta(days=days)
+        return cutoff_date.strftime('%Y-%m-%d %H:%M:%S,') + f'{cutoff_date.microsecond // 1000:03d}'
+    
+    @staticmethod
+    def _iter_lines_reverse(path, block_size=65536):
+        """
+        Yield the lines of a file from last to first, reading fixed-size blocks from the end
+        
+        Args:
+            path (Path): File to read
+            block_size (int): Bytes read per seek
+        
+        Yields:
+            str: Lines without their trailing newline
+        """
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b''
+            
+            while position > 0:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b'\n')
+                
+                # The first piece may be the tail of a line that starts in an earlier block
+                remainder = lines[0]
+                for line in reversed(lines[1:]):
+                    yield line.decode('utf-8', errors='ignore')
+            
+            yield remainder.decode('utf-8', errors='ignore')
+    
     def _empty_stats(self):
         """Return empty statistics structure"""
         return {
@@ -197,26 +247,76 @@ class DashboardService:
         Returns:
             list: List of API key statistics
         """
-        api_keys = auth_service.api_keys.get('keys', [])
+        # One log scan covers every key; logged keys are mapped by digest only, never with bcrypt
+        totals = defaultdict(lambda: [0, 0])
+        for logged_key, (total, successful) in self._requests_by_key(days=30).items():
+            stored_key = auth_service.resolve_api_key(logged_key)
+            if stored_key is not None:
+                totals[stored_key][0] += total
+                totals[stored_key][1] += successful
         
         key_stats = []
-        for key_data in api_keys:
-            key = key_data.get('key')
-            stats = self.get_api_usage_stats(api_key=key, days=30)
+        for stored_key, key_data in auth_service.api_keys.items():
+            total, successful = totals.get(stored_key, (0, 0))
+            
+            # Identify keys by a short digest prefix; legacy entries are stored as the plaintext key itself
+            if not key_data.get('hashed', False):
+                digest = auth_service.digest_api_key(stored_key)
+            elif key_data.get('scheme') == 'hmac-sha256':
+                digest = stored_key
+            else:
+                digest = key_data.get('fingerprint')
+            masked_key = digest[:8] + '...' if digest else key_data.get('name', 'No description')
             
             key_stats.append({
-                'key': key[:10] + '...' + key[-4:],  # Masked for security
-                'full_key': key,
-                'description': key_data.get('description', 'No description'),
+                'key': masked_key,
+                'description': key_data.get('name', 'No description'),
                 'active': key_data.get('active', True),
                 'created': key_data.get('created', 'Unknown'),
-                'total_requests': stats['total_requests'],
-                'success_rate': stats['success_rate'],
+                'total_requests': total,
+                'success_rate': round(successful / total * 100, 2) if total else 0,
                 'last_used': key_data.get('last_used', 'Never')
             })
         
         return key_stats
     
+    def _requests_by_key(self, days):
+        """
+        Count requests per logged API key in a single pass over the log
+        
+        Args:
+            days (int): Number of days to analyze
+        
+        Returns:
+            dict: api_key -> [total_requests, successful_requests]
+        """
+        cache_key = f"by_key_{days}"
+        if self._is_cache_valid(cache_key):
+            return self.stats_cache[cache_key][1]
+        
+        counts = defaultdict(lambda: [0, 0])
+        if self.log_file.exists():
+            cutoff = self._cutoff_timestamp(days)
+            try:
+                for line in self._iter_lines_reverse(self.log_file):
+                    match = LOG_LINE_RE.match(line)
+                    if match is None:
+                        continue
+                    
+                    if match['timestamp'] < cutoff:
+                        break
+                    
+                    entry = counts[match['api_key']]
+                    entry[0] += 1
+                    if match['status'] == '200' or 'successfully' in match['message'].lower():
+                        entry[1] += 1
+            except Exception as e:
+                print(f"Error analyzing logs: {e}")
+        
+        counts = dict(counts)
+        self.stats_cache[cache_key] = (time.monotonic(), counts)
+        return counts
+    
     def get_recent_requests(self, limit=50):
         """
         Get recent API requests
@@ -233,34 +333,36 @@ class DashboardService:
         requests = []
         
         try:
-            with open(self.log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
+            # Newest lines come first, so the result is already most-recent-first
+            for line in self._iter_lines_reverse(self.log_file):
+                if len(requests) >= limit:
+                    break
                 
-                # Get last N lines
-                for line in lines[-limit:]:
-                    try:
-                        if ' - ' not in line:
-                            continue
-                        
-                        # Parse log line
-                        timestamp_str = line.split('[')[1].split(']')[0] if '[' in line else 'Unknown'
-                        
-                        # Extract info
-                        request_info = {
-                            'timestamp': timestamp_str,
-                            'message': line.split('] ')[-1].strip() if '] ' in line else line.strip(),
-                            'status': 'success' if '200' in line or 'success' in line.lower() else 'error'
-                        }
-                        
-                        requests.append(request_info)
-                        
-                    except Exception:
+                try:
+                    if ' - ' not in line:
                         continue
+                    
+                    # Parse log line: asctime is a fixed 23-character prefix, the
+                    # message follows the bracketed api key field
+                    timestamp_str = line[:23]
+                    key_end = line.find('] - ', 23)
+                    
+                    # Extract info
+                    request_info = {
+                        'timestamp': timestamp_str,
+                        'message': line[key_end + 4:].strip() if key_end != -1 else line.strip(),
+                        'status': 'success' if '200' in line or 'success' in line.lower() else 'error'
+                    }
+                    
+                    requests.append(request_info)
+                    
+                except Exception:
+                    continue
         
         except Exception as e:
             print(f"Error reading recent requests: {e}")
         
-        return list(reversed(requests))  # Most recent first
+        return requests
     
     def get_system_health(self):
         """
@@ -269,12 +371,9 @@ class DashboardService:
         Returns:
             dict: System health information
         """
-        import psutil
-        import os
-        
         try:
-            # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
+            # CPU usage since the previous call
+            cpu_percent = psutil.cpu_percent(interval=None)
             
             # Memory usage
             memory = psutil.virtual_memory()
@@ -288,11 +387,7 @@ class DashboardService:
             disk_free_gb = disk.free / (1024 * 1024 * 1024)
             
             # Uptime (if possible)
-            try:
-                uptime_seconds = time.time() - psutil.boot_time()
-                uptime_hours = uptime_seconds / 3600
-            except:
-                uptime_hours = 0
+            uptime_hours = (time.time() - self._boot_time) / 3600 if self._boot_time else 0
             
             return {
                 'status': 'healthy' if cpu_percent < 80 and memory_percent < 90 else 'warning',
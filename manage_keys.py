@@ -12,9 +12,8 @@ def print_header():
     print("  API Key Management")
     print("=" * 60 + "\n")
 
-def list_keys():
+def list_keys(auth):
     """List all API keys"""
-    auth = AuthService()
     print("\n📋 Current API Keys:\n")
     
     if not auth.api_keys:
@@ -29,10 +28,8 @@ def list_keys():
         print(f"    Created: {info.get('created', 'N/A')}")
         print()
 
-def generate_key():
+def generate_key(auth):
     """Generate a new API key"""
-    auth = AuthService()
-    
     name = input("Enter name for this API key: ").strip()
     if not name:
         name = "Custom Key"
@@ -52,10 +49,8 @@ def generate_key():
     else:
         print("\n❌ Failed to create API key (key already exists)")
 
-def add_custom_key():
+def add_custom_key(auth):
     """Add a custom API key"""
-    auth = AuthService()
-    
     key = input("Enter the API key: ").strip()
     if not key:
         print("❌ API key cannot be empty")
@@ -74,10 +69,8 @@ def add_custom_key():
     else:
         print("\n❌ Failed to add API key (key already exists)")
 
-def deactivate_key():
+def deactivate_key(auth):
     """Deactivate an API key"""
-    auth = AuthService()
-    
     key = input("Enter the API key to deactivate: ").strip()
     if not key:
         print("❌ API key cannot be empty")
@@ -104,18 +97,21 @@ def main():
     """Main function"""
     print_header()
     
+    # Load the key store once; every menu action works on the same instance
+    auth = AuthService()
+    
     while True:
         show_menu()
         choice = input("Enter your choice (1-5): ").strip()
         
         if choice == '1':
-            list_keys()
+            list_keys(auth)
         elif choice == '2':
-            generate_key()
+            generate_key(auth)
         elif choice == '3':
-            add_custom_key()
+            add_custom_key(auth)
         elif choice == '4':
-            deactivate_key()
+            deactivate_key(auth)
         elif choice == '5':
             print("\n👋 Goodbye!\n")
             break
@@ -15,9 +15,8 @@ def print_header(title):
     print("=" * 60)
 
 
-def list_keys():
+def list_keys(auth):
     """List all API keys"""
-    auth = AuthService()
     keys = auth.list_api_keys()
     
     print_header("API KEYS")
@@ -37,10 +36,8 @@ def list_keys():
     print(f"\nTotal: {len(keys)} keys")
 
 
-def add_key():
+def add_key(auth):
     """Add a new API key"""
-    auth = AuthService()
-    
     print_header("ADD NEW API KEY")
     
     name = input("\nEnter key name (e.g., 'Production Key'): ").strip()
@@ -62,14 +59,12 @@ def add_key():
         print("\n❌ Failed to create key (already exists)")
 
 
-def deactivate_key():
+def deactivate_key(auth):
     """Deactivate an API key"""
-    auth = AuthService()
-    
     print_header("DEACTIVATE API KEY")
     
     # First show current keys
-    list_keys()
+    list_keys(auth)
     
     print("\n⚠️  You need the PLAINTEXT key to deactivate it.")
     key = input("\nEnter the plaintext API key to deactivate: ").strip()
@@ -84,10 +79,8 @@ def deactivate_key():
         print("\n❌ API key not found")
 
 
-def validate_key():
+def validate_key(auth):
     """Validate an API key"""
-    auth = AuthService()
-    
     print_header("VALIDATE API KEY")
     
     key = input("\nEnter API key to validate: ").strip()
@@ -102,16 +95,14 @@ def validate_key():
         print("\n❌ API key is INVALID or INACTIVE")
 
 
-def migrate_keys():
+def migrate_keys(auth):
     """Migrate legacy plaintext keys to hashed keys"""
-    auth = AuthService()
-    
     print_header("MIGRATE LEGACY KEYS")
     
     print("\n⚠️  WARNING: This will replace all legacy plaintext keys with new hashed keys!")
     print("⚠️  You will need to update all clients with the new keys!")
     print("\nCurrent keys:")
-    list_keys()
+    list_keys(auth)
     
     confirm = input("\nAre you sure you want to migrate? (yes/no): ").strip().lower()
     
@@ -154,19 +145,22 @@ def show_menu():
 
 def main():
     """Main function"""
+    # Load the key store once; every menu action works on the same instance
+    auth = AuthService()
+    
     while True:
         choice = show_menu()
         
         if choice == '1':
-            list_keys()
+            list_keys(auth)
         elif choice == '2':
-            add_key()
+            add_key(auth)
         elif choice == '3':
-            deactivate_key()
+            deactivate_key(auth)
         elif choice == '4':
-            validate_key()
+            validate_key(auth)
         elif choice == '5':
-            migrate_keys()
+            migrate_keys(auth)
         elif choice == '6':
             print("\n👋 Goodbye!")
             sys.exit(0)
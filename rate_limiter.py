@@ -3,13 +3,29 @@ Rate Limiter Service
 Handles rate limiting per API key
 """
 
+import threading
 import time
-from collections import defaultdict, deque
-from datetime import datetime, timedelta
+
+
+NS_PER_SECOND = 1_000_000_000
+
+# Bucket updates are spread over this many locks (a power of two) by key hash
+LOCK_STRIPES = 16
 
 
 class RateLimiter:
-    """Service for rate limiting API requests"""
+    """
+    Service for rate limiting API requests
+    
+    Uses a per-minute and a per-hour token bucket per API key, computed with
+    integer nanosecond arithmetic. A bucket of capacity C over a window of W
+    nanoseconds stores its tokens scaled by W, so refilling C tokens per window
+    is just ``elapsed_ns * C`` and no floats are involved.
+    
+    State is three ints per key whatever the traffic, and, unlike a two-window
+    sliding counter, there is no window to rotate and no approximation at the
+    window boundary.
+    """
     
     def __init__(self, requests_per_minute=10, requests_per_hour=60):
         """
@@ -22,9 +38,94 @@ class RateLimiter:
         self.requests_per_minute = requests_per_minute
         self.requests_per_hour = requests_per_hour
         
-        # Store request timestamps for each API key
-        self.minute_requests = defaultdict(deque)
-        self.hour_requests = defaultdict(deque)
+        self._minute_ns = 60 * NS_PER_SECOND
+        self._hour_ns = 3600 * NS_PER_SECOND
+        self._minute_capacity = requests_per_minute * self._minute_ns
+        self._hour_capacity = requests_per_hour * self._hour_ns
+        
+        # api_key -> [minute_units, hour_units, last_refill_ns]; each key is guarded by
+        # one stripe lock, so request threads only contend when their keys share a stripe
+        self._buckets = {}
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        
+        # Drop idle keys in the background so the table tracks active keys only
+        threading.Thread(target=self._sweeper, name='ratelimit-sweep', daemon=True).start()
+    
+    def _lock_for(self, api_key):
+        """Return the stripe lock that guards an API key's bucket"""
+        return self._locks[hash(api_key) & (LOCK_STRIPES - 1)]
+    
+    def _peek(self, api_key, now_ns):
+        """
+        Compute a key's current token units without storing anything
+        
+        Read-only queries must not create buckets, or probing random keys would
+        grow the table without bound. Unknown keys read as full.
+        """
+        bucket = self._buckets.get(api_key)
+        if bucket is None:
+            return (self._minute_capacity, self._hour_capacity)
+        
+        elapsed = max(0, now_ns - bucket[2])
+        return (min(self._minute_capacity, bucket[0] + elapsed * self.requests_per_minute),
+                min(self._hour_capacity, bucket[1] + elapsed * self.requests_per_hour))
+    
+    def _retry_after(self, bucket, cost):
+        """Seconds until both buckets hold ``cost`` tokens again"""
+        wait_ns = 0
+        minute_needed = cost * self._minute_ns - bucket[0]
+        if minute_needed > 0:
+            wait_ns = -(-minute_needed // self.requests_per_minute)
+        hour_needed = cost * self._hour_ns - bucket[1]
+        if hour_needed > 0:
+            wait_ns = max(wait_ns, -(-hour_needed // self.requests_per_hour))
+        return -(-wait_ns // NS_PER_SECOND)
+    
+    def check_and_consume(self, api_key, cost=1):
+        """
+        Check both limits and consume tokens in a single locked pass
+        
+        Args:
+            api_key (str): The API key to check
+            cost (int): Number of requests to consume
+        
+        Returns:
+            tuple: (allowed, remaining_per_minute, remaining_per_hour, retry_after_seconds)
+        """
+        now_ns = time.monotonic_ns()
+        minute_cost = cost * self._minute_ns
+        hour_cost = cost * self._hour_ns
+        
+        # Runs on every request: the stripe lookup and refill are inlined, min() calls
+        # are avoided and the bucket is read into locals once
+        with self._locks[hash(api_key) & (LOCK_STRIPES - 1)]:
+            bucket = self._buckets.get(api_key)
+            if bucket is None:
+                bucket = [self._minute_capacity, self._hour_capacity, now_ns]
+                self._buckets[api_key] = bucket
+            else:
+                # Top up both buckets for the time elapsed since the last call
+                elapsed = now_ns - bucket[2]
+                if elapsed > 0:
+                    minute_units = bucket[0] + elapsed * self.requests_per_minute
+                    hour_units = bucket[1] + elapsed * self.requests_per_hour
+                    bucket[0] = minute_units if minute_units < self._minute_capacity else self._minute_capacity
+                    bucket[1] = hour_units if hour_units < self._hour_capacity else self._hour_capacity
+                    bucket[2] = now_ns
+            
+            minute_units, hour_units = bucket[0], bucket[1]
+            allowed = minute_units >= minute_cost and hour_units >= hour_cost
+            if allowed:
+                bucket[0] = minute_units = minute_units - minute_cost
+                bucket[1] = hour_units = hour_units - hour_cost
+                retry_after = 0
+            else:
+                retry_after = self._retry_after(bucket, cost)
+            
+            return (allowed,
+                    minute_units // self._minute_ns,
+                    hour_units // self._hour_ns,
+                    retry_after)
     
     def check_rate_limit(self, api_key):
         """
@@ -36,41 +137,180 @@ class RateLimiter:
         Returns:
             bool: True if within limits, False if exceeded
         """
-        current_time = time.time()
+        return self.check_and_consume(api_key)[0]
+    
+    def get_retry_after(self, api_key):
+        """
+        Get seconds until the next available request slot
         
-        # Clean up old entries and check minute limit
-        self._cleanup_old_requests(api_key, current_time)
+        Args:
+            api_key (str): The API key to check
         
-        minute_count = len(self.minute_requests[api_key])
-        hour_count = len(self.hour_requests[api_key])
+        Returns:
+            int: Seconds to wait before retrying
+        """
+        with self._lock_for(api_key):
+            bucket = self._peek(api_key, time.monotonic_ns())
+            return self._retry_after(bucket, 1)
+    
+    def get_remaining_requests(self, api_key):
+        """
+        Get remaining requests for an API key
         
-        # Check if limits are exceeded
-        if minute_count >= self.requests_per_minute:
-            return False
+        Args:
+            api_key (str): The API key to check
         
-        if hour_count >= self.requests_per_hour:
-            return False
+        Returns:
+            dict: Remaining requests per minute and per hour
+        """
+        with self._lock_for(api_key):
+            bucket = self._peek(api_key, time.monotonic_ns())
+            return {
+                'per_minute': bucket[0] // self._minute_ns,
+                'per_hour': bucket[1] // self._hour_ns
+            }
+    
+    def reset_limits(self, api_key):
+        """
+        Reset rate limits for an API key
         
-        # Record this request
-        self.minute_requests[api_key].append(current_time)
-        self.hour_requests[api_key].append(current_time)
+        Args:
+            api_key (str): The API key to reset
+        """
+        with self._lock_for(api_key):
+            self._buckets.pop(api_key, None)
+    
+    def sweep(self, now_ns=None):
+        """
+        Forget keys that have been idle for a full hour
+        
+        After an hour without requests both buckets have refilled to capacity,
+        which is exactly how an unknown key starts, so dropping them changes nothing.
+        
+        Args:
+            now_ns (int, optional): Monotonic time in nanoseconds (default: now)
+        
+        Returns:
+            int: Number of keys removed
+        """
+        if now_ns is None:
+            now_ns = time.monotonic_ns()
         
-        return True
+        removed = 0
+        for api_key, bucket in list(self._buckets.items()):
+            if now_ns - bucket[2] < self._hour_ns:
+                continue
+            with self._lock_for(api_key):
+                # Re-check under the lock in case a request just refreshed it
+                if self._buckets.get(api_key) is bucket and now_ns - bucket[2] >= self._hour_ns:
+                    del self._buckets[api_key]
+                    removed += 1
+        return removed
     
-    def _cleanup_old_requests(self, api_key, current_time):
-        """Remove requests older than the time windows"""
-        minute_ago = current_time - 60
-        hour_ago = current_time - 3600
+    def _sweeper(self, interval=60.0):
+        """Background loop that runs sweep() once per interval"""
+        while True:
+            time.sleep(interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Rate limiter sweep warning: {e}")
+
+
+# Token bucket for both windows in one round trip. Units are milliseconds scaled
+# by capacity, mirroring RateLimiter. ARGV: now_ms, cost, per_minute, per_hour, peek.
+REDIS_TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local per_minute = tonumber(ARGV[3])
+local per_hour = tonumber(ARGV[4])
+local peek = tonumber(ARGV[5])
+local minute_ms = 60000
+local hour_ms = 3600000
+
+local state = redis.call('HMGET', KEYS[1], 'm', 'h', 't')
+local m = tonumber(state[1]) or per_minute * minute_ms
+local h = tonumber(state[2]) or per_hour * hour_ms
+local last = tonumber(state[3]) or now
+
+local elapsed = math.max(0, now - last)
+m = math.min(per_minute * minute_ms, m + elapsed * per_minute)
+h = math.min(per_hour * hour_ms, h + elapsed * per_hour)
+
+local allowed = 0
+local retry_ms = 0
+if m >= cost * minute_ms and h >= cost * hour_ms then
+    allowed = 1
+    if peek == 0 then
+        m = m - cost * minute_ms
+        h = h - cost * hour_ms
+    end
+else
+    retry_ms = math.max(math.ceil((cost * minute_ms - m) / per_minute),
+                        math.ceil((cost * hour_ms - h) / per_hour))
+end
+
+if peek == 0 then
+    redis.call('HSET', KEYS[1], 'm', m, 'h', h, 't', now)
+    redis.call('PEXPIRE', KEYS[1], hour_ms)
+end
+
+return {allowed, math.floor(m / minute_ms), math.floor(h / hour_ms), retry_ms}
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Rate limiter sharing its buckets through Redis
+    
+    Keeps limits exact across gunicorn workers and hosts. If Redis cannot be
+    reached, calls fall back to the in-process buckets of RateLimiter.
+    """
+    
+    def __init__(self, redis_url, requests_per_minute=10, requests_per_hour=60, prefix='ratelimit:'):
+        """
+        Initialize Redis-backed rate limiter
         
-        # Clean minute requests
-        while (self.minute_requests[api_key] and 
-               self.minute_requests[api_key][0] < minute_ago):
-            self.minute_requests[api_key].popleft()
+        Args:
+            redis_url (str): Redis connection URL
+            requests_per_minute (int): Maximum requests per minute per API key
+            requests_per_hour (int): Maximum requests per hour per API key
+            prefix (str): Prefix for Redis keys
+        """
+        super().__init__(requests_per_minute, requests_per_hour)
+        
+        import redis  # Optional dependency, only needed when REDIS_URL is set
         
-        # Clean hour requests
-        while (self.hour_requests[api_key] and 
-               self.hour_requests[api_key][0] < hour_ago):
-            self.hour_requests[api_key].popleft()
+        self.prefix = prefix
+        self.redis = redis.Redis.from_url(redis_url)
+        self.redis.ping()
+        self._script = self.redis.register_script(REDIS_TOKEN_BUCKET_SCRIPT)
+    
+    def _eval(self, api_key, cost, peek):
+        """Run the token bucket script and return (allowed, minute, hour, retry_after_seconds)"""
+        now_ms = time.time_ns() // 1_000_000
+        allowed, remaining_minute, remaining_hour, retry_ms = self._script(
+            keys=[self.prefix + api_key],
+            args=[now_ms, cost, self.requests_per_minute, self.requests_per_hour, int(peek)]
+        )
+        return (bool(allowed), int(remaining_minute), int(remaining_hour), -(-int(retry_ms) // 1000))
+    
+    def check_and_consume(self, api_key, cost=1):
+        """
+        Check both limits and consume tokens with one Redis round trip
+        
+        Args:
+            api_key (str): The API key to check
+            cost (int): Number of requests to consume
+        
+        Returns:
+            tuple: (allowed, remaining_per_minute, remaining_per_hour, retry_after_seconds)
+        """
+        try:
+            return self._eval(api_key, cost, peek=False)
+        except Exception as e:
+            print(f"Redis rate limiter warning: {e}")
+            return super().check_and_consume(api_key, cost)
     
     def get_retry_after(self, api_key):
         """
@@ -82,20 +322,11 @@ class RateLimiter:
         Returns:
             int: Seconds to wait before retrying
         """
-        current_time = time.time()
-        self._cleanup_old_requests(api_key, current_time)
-        
-        # Check minute limit
-        if len(self.minute_requests[api_key]) >= self.requests_per_minute:
-            oldest_minute = self.minute_requests[api_key][0]
-            return int(60 - (current_time - oldest_minute)) + 1
-        
-        # Check hour limit
-        if len(self.hour_requests[api_key]) >= self.requests_per_hour:
-            oldest_hour = self.hour_requests[api_key][0]
-            return int(3600 - (current_time - oldest_hour)) + 1
-        
-        return 0
+        try:
+            return self._eval(api_key, 1, peek=True)[3]
+        except Exception as e:
+            print(f"Redis rate limiter warning: {e}")
+            return super().get_retry_after(api_key)
     
     def get_remaining_requests(self, api_key):
         """
@@ -107,13 +338,15 @@ class RateLimiter:
         Returns:
             dict: Remaining requests per minute and per hour
         """
-        current_time = time.time()
-        self._cleanup_old_requests(api_key, current_time)
-        
-        return {
-            'per_minute': max(0, self.requests_per_minute - len(self.minute_requests[api_key])),
-            'per_hour': max(0, self.requests_per_hour - len(self.hour_requests[api_key]))
-        }
+        try:
+            _, remaining_minute, remaining_hour, _ = self._eval(api_key, 0, peek=True)
+            return {
+                'per_minute': remaining_minute,
+                'per_hour': remaining_hour
+            }
+        except Exception as e:
+            print(f"Redis rate limiter warning: {e}")
+            return super().get_remaining_requests(api_key)
     
     def reset_limits(self, api_key):
         """
@@ -122,7 +355,8 @@ class RateLimiter:
         Args:
             api_key (str): The API key to reset
         """
-        if api_key in self.minute_requests:
-            del self.minute_requests[api_key]
-        if api_key in self.hour_requests:
-            del self.hour_requests[api_key]
+        super().reset_limits(api_key)
+        try:
+            self.redis.delete(self.prefix + api_key)
+        except Exception as e:
+            print(f"Redis rate limiter warning: {e}")
@@ -5,9 +5,15 @@ Handles webpage screenshot capture using Playwright with advanced features
 
 import os
 import asyncio
+import re
+import atexit
+import hashlib
+import threading
+import time
+import uuid
 from pathlib import Path
 from datetime import datetime
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from PIL import Image
 import io
 
@@ -15,6 +21,9 @@ import io
 class ScreenshotService:
     """Service for capturing webpage screenshots with advanced features"""
     
+    # JPEG quality when the caller gives none; the API uses the same default
+    DEFAULT_QUALITY = 85
+    
     # Device presets for emulation
     DEVICE_PRESETS = {
         'iphone13': {'width': 390, 'height': 844, 'user_agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/605.1.15', 'mobile': True},
@@ -26,18 +35,221 @@ class ScreenshotService:
         'desktop_4k': {'width': 3840, 'height': 2160, 'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36', 'mobile': False},
     }
     
+    # Browser context options per preset, built once instead of per capture
+    DEVICE_CONTEXT = {
+        name: {
+            'viewport': {'width': preset['width'], 'height': preset['height']},
+            'user_agent': preset['user_agent'],
+            'is_mobile': preset.get('mobile', False),
+            # Add device scale factor for mobile devices
+            **({'device_scale_factor': 2} if preset.get('mobile', False) else {}),
+        }
+        for name, preset in DEVICE_PRESETS.items()
+    }
+    
+    # Requests dropped when block_ads is set, matched once per network request
+    _AD_RE = re.compile(r'ads|tracking|analytics|doubleclick')
+    _BLOCKED_TYPES = frozenset({'image', 'media', 'font'})
+    
     def __init__(self):
         self.screenshots_dir = Path('screenshots')
         self.screenshots_dir.mkdir(exist_ok=True)
+        
+        # Playwright runs on one background event loop so captures requested
+        # from any worker thread are in flight concurrently
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._playwright = None
+        self._playwright_lock = None
+        
+        # Long-lived browsers (one per engine) and a bound on open contexts
+        self._browsers = {}
+        self._pool_size = 4
+        self._context_slots = None
+        
+        # Identical captures already running, keyed by argument digest; only
+        # touched from the event loop thread so needs no lock
+        self._inflight = {}
+        
+        # Expire old captures in the background, never on a request
+        threading.Thread(target=self._sweeper, name='screenshot-sweep', daemon=True).start()
+        
+        atexit.register(self.close)
+    
+    def start_pool(self, size=4):
+        """
+        Pre-launch the default browser and size the context pool
+        
+        Args:
+            size (int): Maximum number of browser contexts open at once
+        """
+        self._pool_size = size
+        try:
+            self._run(self._get_browser('chromium'))
+        except Exception as e:
+            print(f"Browser pool warm-up warning: {e}")
+    
+    def close(self):
+        """Close pooled browsers, stop Playwright and the event loop"""
+        if self._loop is None:
+            return
+        try:
+            self._run(self._close_async())
+        except Exception as e:
+            print(f"Browser pool shutdown warning: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+    
+    async def _close_async(self):
+        """Close all browsers and the Playwright driver"""
+        for browser in self._browsers.values():
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        self._browsers = {}
+        
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+    
+    def _get_loop(self):
+        """Start the background event loop on first use and return it"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name='playwright-loop'
+                )
+                thread.daemon = True
+                thread.start()
+        return self._loop
+    
+    def _run(self, coro):
+        """
+        Run a coroutine on the Playwright event loop and wait for the result
+        
+        Args:
+            coro: Coroutine to execute
+        
+        Returns:
+            The coroutine's return value
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+    
+    async def _get_playwright(self):
+        """Start the Playwright driver once and share it between captures"""
+        if self._playwright_lock is None:
+            self._playwright_lock = asyncio.Lock()
+        
+        async with self._playwright_lock:
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+        
+        return self._playwright
+    
+    async def _get_browser(self, browser_type='chromium'):
+        """
+        Return the shared browser for an engine, launching it on first use
+        
+        Args:
+            browser_type (str): Browser engine ('chromium', 'firefox', 'webkit')
+        
+        Returns:
+            Browser: Playwright browser instance
+        """
+        playwright = await self._get_playwright()
+        
+        browser_engines = {
+            'chromium': playwright.chromium,
+            'firefox': playwright.firefox,
+            'webkit': playwright.webkit
+        }
+        if browser_type not in browser_engines:
+            browser_type = 'chromium'
+        
+        async with self._playwright_lock:
+            browser = self._browsers.get(browser_type)
+            if browser is None or not browser.is_connected():
+                browser = await browser_engines[browser_type].launch(headless=True)
+                self._browsers[browser_type] = browser
+        
+        return browser
+    
+    def _get_context_slots(self):
+        """Semaphore limiting how many contexts are open at once"""
+        if self._context_slots is None:
+            self._context_slots = asyncio.Semaphore(self._pool_size)
+        return self._context_slots
+    
+    def capture_screenshot(self, url, **kwargs):
+        """
+        Capture a screenshot of a webpage (blocking, callable from any thread)
+        
+        Accepts the same arguments as capture_screenshot_async.
+        
+        Returns:
+            str: Path to the saved screenshot
+        """
+        return self._run(self.capture_screenshot_async(url, **kwargs))
+    
+    def capture_many(self, params_list):
+        """
+        Capture several screenshots concurrently (blocking, callable from any thread)
+        
+        Args:
+            params_list (list): Keyword arguments for capture_screenshot_async, one dict per capture
+        
+        Returns:
+            list: Screenshot path or the exception raised, in input order
+        """
+        return self._run(self.capture_many_async(params_list))
+    
+    async def capture_many_async(self, params_list):
+        """
+        Capture several screenshots on the shared browser, one context each
+        
+        Args:
+            params_list (list): Keyword arguments for capture_screenshot_async, one dict per capture
+        
+        Returns:
+            list: Screenshot path or the exception raised, in input order
+        """
+        # The context semaphore bounds how many of these render at once
+        return await asyncio.gather(
+            *(self.capture_screenshot_async(**params) for params in params_list),
+            return_exceptions=True
+        )
     
-    def capture_screenshot(self, url, width=1920, height=1080, fullpage=False, 
-                          delay=0, image_format='png', quality=80, selector=None,
-                          device=None, user_agent=None, dark_mode=False, 
-                          wait_for_selector=None, custom_script=None, 
-                          block_ads=False, scroll_page=False, media_type=None,
-                          extra_headers=None, cookies=None, geolocation=None,
-                          timezone=None, browser_type='chromium', disable_animations=False,
-                          inject_data=None):
+    async def capture_screenshot_async(self, url, **kwargs):
+        """
+        Capture a screenshot, sharing one render between identical concurrent calls
+        
+        Accepts the same arguments as _render_screenshot.
+        
+        Returns:
+            str: Path to the saved screenshot
+        """
+        key = hashlib.blake2b(repr((url, sorted(kwargs.items()))).encode(), digest_size=16).hexdigest()
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._render_screenshot(url, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        
+        # Shield so one caller giving up does not cancel the others' render
+        return await asyncio.shield(task)
+    
+    async def _render_screenshot(self, url, width=1920, height=1080, fullpage=False,
+                                 delay=0, image_format='png', quality=DEFAULT_QUALITY, selector=None,
+                                 device=None, user_agent=None, dark_mode=False,
+                                 wait_for_selector=None, custom_script=None,
+                                 block_ads=False, scroll_page=False, media_type=None,
+                                 extra_headers=None, cookies=None, geolocation=None,
+                                 timezone=None, browser_type='chromium', disable_animations=False,
+                                 inject_data=None, compression=None, wait_until=None):
         """
         Capture a screenshot of a webpage with advanced options
         
@@ -65,6 +277,8 @@ class ScreenshotService:
             browser_type (str): Browser engine ('chromium', 'firefox', 'webkit')
             disable_animations (bool): Freeze all animations and transitions
             inject_data (dict): Data to inject (localStorage, sessionStorage, api_mocks)
+            compression (int): PNG zlib level 0-9 to re-encode with (default: browser output)
+            wait_until (str): 'networkidle' to wait for network quiet (default: DOM ready plus load)
         
         Returns:
             str: Path to the saved screenshot
@@ -73,21 +287,14 @@ class ScreenshotService:
             Exception: If screenshot capture fails
         """
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        filename = f'screenshot_{timestamp}.{image_format}'
+        filename = f'screenshot_{timestamp}_{uuid.uuid4().hex[:8]}.{image_format}'
         filepath = self.screenshots_dir / filename
         
         try:
-            with sync_playwright() as playwright:
-                # Launch browser based on browser_type
-                browser_engines = {
-                    'chromium': playwright.chromium,
-                    'firefox': playwright.firefox,
-                    'webkit': playwright.webkit
-                }
-                
-                browser_engine = browser_engines.get(browser_type.lower(), playwright.chromium)
-                browser = browser_engine.launch(headless=True)
-                
+            # Reuse the long-lived browser for this engine
+            browser = await self._get_browser(browser_type.lower())
+            
+            async with self._get_context_slots():
                 # Prepare context options
                 context_options = {
                     'ignore_https_errors': True,
@@ -95,20 +302,12 @@ class ScreenshotService:
                 }
                 
                 # Device emulation
-                if device and device.lower() in self.DEVICE_PRESETS:
-                    preset = self.DEVICE_PRESETS[device.lower()]
-                    context_options['viewport'] = {
-                        'width': preset['width'], 
-                        'height': preset['height']
-                    }
-                    context_options['user_agent'] = preset['user_agent']
-                    context_options['is_mobile'] = preset.get('mobile', False)
-                    # Add device scale factor for mobile devices
-                    if preset.get('mobile', False):
-                        context_options['device_scale_factor'] = 2
+                device_context = self.DEVICE_CONTEXT.get(device.lower()) if device else None
+                if device_context:
+                    context_options.update(device_context)
                     # Override width/height from device preset
-                    width = preset['width']
-                    height = preset['height']
+                    width = device_context['viewport']['width']
+                    height = device_context['viewport']['height']
                 else:
                     context_options['viewport'] = {'width': width, 'height': height}
                     if user_agent:
@@ -132,96 +331,107 @@ class ScreenshotService:
                     context_options['extra_http_headers'] = extra_headers
                 
                 # Create context
-                context = browser.new_context(**context_options)
-                
-                # Set cookies
-                if cookies:
-                    context.add_cookies(cookies)
-                
-                # Block ads and trackers
-                if block_ads:
-                    context.route("**/*", lambda route: route.abort() 
-                                 if route.request.resource_type in ["image", "media", "font"] 
-                                 or any(ad in route.request.url for ad in ['ads', 'tracking', 'analytics', 'doubleclick'])
-                                 else route.continue_())
+                context = await browser.new_context(**context_options)
                 
-                # Create new page
-                page = context.new_page()
-                
-                # Emulate media type
-                if media_type == 'print':
-                    page.emulate_media(media='print')
-                elif media_type == 'screen':
-                    page.emulate_media(media='screen')
-                
-                # Set timeout
-                page.set_default_timeout(60000)  # 60 seconds for advanced features
-                
-                # Navigate to URL
                 try:
-                    page.goto(url, wait_until='networkidle', timeout=45000)
-                except PlaywrightTimeoutError:
-                    # Fallback to domcontentloaded if networkidle times out
-                    page.goto(url, wait_until='domcontentloaded', timeout=45000)
-                
-                # Inject data (localStorage, sessionStorage, API mocks)
-                if inject_data:
-                    self._inject_test_data(page, inject_data)
-                
-                # Disable animations for consistent screenshots
-                if disable_animations:
-                    self._freeze_animations(page)
-                
-                # Scroll page for lazy loading
-                if scroll_page:
-                    self._scroll_page(page)
-                
-                # Wait for specific selector
-                if wait_for_selector:
-                    try:
-                        page.wait_for_selector(wait_for_selector, timeout=30000)
-                    except PlaywrightTimeoutError:
-                        pass  # Continue even if selector not found
-                
-                # Execute custom JavaScript
-                if custom_script:
-                    try:
-                        page.evaluate(custom_script)
-                    except Exception as e:
-                        print(f"JavaScript execution warning: {e}")
-                
-                # Wait for specified delay
-                if delay > 0:
-                    page.wait_for_timeout(min(delay, 30000))  # Max 30 seconds
-                
-                # Capture screenshot
-                screenshot_options = {
-                    'path': str(filepath),
-                    'full_page': fullpage
-                }
-                
-                if image_format == 'jpeg':
-                    screenshot_options['type'] = 'jpeg'
-                    screenshot_options['quality'] = quality
-                else:
-                    screenshot_options['type'] = 'png'
-                
-                # Element-specific screenshot
-                if selector:
-                    try:
-                        element = page.query_selector(selector)
-                        if element:
-                            element.screenshot(**screenshot_options)
-                        else:
-                            page.screenshot(**screenshot_options)
-                    except Exception:
-                        page.screenshot(**screenshot_options)
-                else:
-                    page.screenshot(**screenshot_options)
-                
-                # Close browser
-                context.close()
-                browser.close()
+                    # Set cookies
+                    if cookies:
+                        await context.add_cookies(cookies)
+                    
+                    # Block ads and trackers
+                    if block_ads:
+                        await context.route("**/*", self._route_blocked)
+                    
+                    # Create new page
+                    page = await context.new_page()
+                    
+                    # Emulate media type
+                    if media_type == 'print':
+                        await page.emulate_media(media='print')
+                    elif media_type == 'screen':
+                        await page.emulate_media(media='screen')
+                    
+                    # Set timeout
+                    page.set_default_timeout(60000)  # 60 seconds for advanced features
+                    
+                    # Navigate to URL
+                    if wait_until == 'networkidle':
+                        try:
+                            await page.goto(url, wait_until='networkidle', timeout=45000)
+                        except PlaywrightTimeoutError:
+                            # Fallback to domcontentloaded if networkidle times out
+                            await page.goto(url, wait_until='domcontentloaded', timeout=45000)
+                    else:
+                        # Analytics-heavy pages rarely go network-idle; wait for the
+                        # DOM, then give the load event a bounded chance to fire
+                        await page.goto(url, wait_until='domcontentloaded', timeout=45000)
+                        try:
+                            await page.wait_for_load_state('load', timeout=10000)
+                        except PlaywrightTimeoutError:
+                            pass
+                    
+                    # Inject data (localStorage, sessionStorage, API mocks)
+                    if inject_data:
+                        await self._inject_test_data(page, inject_data)
+                    
+                    # Disable animations for consistent screenshots
+                    if disable_animations:
+                        await self._freeze_animations(page)
+                    
+                    # Scroll page for lazy loading
+                    if scroll_page:
+                        await self._scroll_page(page)
+                    
+                    # Wait for specific selector
+                    if wait_for_selector:
+                        try:
+                            await page.wait_for_selector(wait_for_selector, timeout=30000)
+                        except PlaywrightTimeoutError:
+                            pass  # Continue even if selector not found
+                    
+                    # Execute custom JavaScript
+                    if custom_script:
+                        try:
+                            await page.evaluate(custom_script)
+                        except Exception as e:
+                            print(f"JavaScript execution warning: {e}")
+                    
+                    # Wait for specified delay
+                    if delay > 0:
+                        await page.wait_for_timeout(min(delay, 30000))  # Max 30 seconds
+                    
+                    # Capture to memory; the file is written once below
+                    screenshot_options = {
+                        'full_page': fullpage
+                    }
+                    
+                    if image_format == 'jpeg':
+                        screenshot_options['type'] = 'jpeg'
+                        screenshot_options['quality'] = quality
+                    else:
+                        screenshot_options['type'] = 'png'
+                    
+                    # Element-specific screenshot
+                    if selector:
+                        try:
+                            element = await page.query_selector(selector)
+                            if element:
+                                image_data = await element.screenshot(**screenshot_options)
+                            else:
+                                image_data = await page.screenshot(**screenshot_options)
+                        except Exception:
+                            image_data = await page.screenshot(**screenshot_options)
+                    else:
+                        image_data = await page.screenshot(**screenshot_options)
+                
+                finally:
+                    await context.close()
+            
+            # Re-encode and write off the event loop so other captures keep running
+            png_level = compression if image_format == 'png' else None
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write_screenshot, filepath, image_data, png_level
+            )
             
             return str(filepath)
         
@@ -233,7 +443,41 @@ class ScreenshotService:
                 filepath.unlink()
             raise Exception(f"Failed to capture screenshot: {str(e)}")
     
-    def _scroll_page(self, page):
+    @classmethod
+    async def _route_blocked(cls, route):
+        """
+        Abort heavy resources and ad/tracker requests, continue everything else
+        
+        Args:
+            route: Playwright route for the intercepted request
+        """
+        request = route.request
+        if request.resource_type in cls._BLOCKED_TYPES or cls._AD_RE.search(request.url):
+            await route.abort()
+        else:
+            await route.continue_()
+    
+    @staticmethod
+    def _write_screenshot(filepath, image_data, compression=None):
+        """
+        Write captured image bytes to disk, re-encoding PNGs in memory first
+        
+        Args:
+            filepath (Path): Destination file
+            image_data (bytes): Image returned by the browser
+            compression (int): zlib level to re-encode a PNG with, None to keep browser output
+        """
+        if compression is not None:
+            with Image.open(io.BytesIO(image_data)) as img:
+                img.load()
+            buffer = io.BytesIO()
+            img.save(buffer, 'PNG', compress_level=compression, optimize=False)
+            image_data = buffer.getbuffer()
+        
+        with open(filepath, 'wb') as f:
+            f.write(image_data)
+    
+    async def _scroll_page(self, page):
         """
         Scroll through the entire page to trigger lazy loading
         
@@ -241,29 +485,26 @@ class ScreenshotService:
             page: Playwright page object
         """
         try:
-            page.evaluate("""
+            # Quarter-page jumps still cross every intersection observer
+            # threshold without pacing 100px at a time
+            await page.evaluate("""
                 async () => {
-                    await new Promise((resolve) => {
-                        let totalHeight = 0;
-                        const distance = 100;
-                        const timer = setInterval(() => {
-                            const scrollHeight = document.body.scrollHeight;
-                            window.scrollBy(0, distance);
-                            totalHeight += distance;
-                            
-                            if(totalHeight >= scrollHeight){
-                                clearInterval(timer);
-                                window.scrollTo(0, 0);
-                                resolve();
-                            }
-                        }, 100);
-                    });
+                    const pause = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+                    for (const fraction of [0.25, 0.5, 0.75, 1]) {
+                        window.scrollTo(0, document.body.scrollHeight * fraction);
+                        await pause(200);
+                    }
+                    window.scrollTo(0, 0);
                 }
             """)
+            try:
+                await page.wait_for_load_state('networkidle', timeout=5000)
+            except PlaywrightTimeoutError:
+                pass  # Capture whatever has loaded so far
         except Exception as e:
             print(f"Scroll warning: {e}")
     
-    def _freeze_animations(self, page):
+    async def _freeze_animations(self, page):
         """
         Freeze all CSS animations, transitions, and animated images
         
@@ -292,7 +533,7 @@ class ScreenshotService:
                     }
                 </style>
             """
-            page.evaluate(f"""
+            await page.evaluate(f"""
                 () => {{
                     const style = document.createElement('style');
                     style.id = 'animation-freeze';
@@ -309,7 +550,7 @@ class ScreenshotService:
         except Exception as e:
             print(f"Animation freeze warning: {e}")
     
-    def _inject_test_data(self, page, inject_data):
+    async def _inject_test_data(self, page, inject_data):
         """
         Inject test data into localStorage, sessionStorage, and mock API responses
         
@@ -318,54 +559,60 @@ class ScreenshotService:
             inject_data (dict): Data to inject with keys: localStorage, sessionStorage, api_mocks
         """
         try:
-            # Inject localStorage
-            if 'localStorage' in inject_data and inject_data['localStorage']:
-                for key, value in inject_data['localStorage'].items():
-                    page.evaluate(f"""
-                        () => {{
-                            localStorage.setItem('{key}', '{value}');
-                        }}
-                    """)
-            
-            # Inject sessionStorage
-            if 'sessionStorage' in inject_data and inject_data['sessionStorage']:
-                for key, value in inject_data['sessionStorage'].items():
-                    page.evaluate(f"""
-                        () => {{
-                            sessionStorage.setItem('{key}', '{value}');
-                        }}
-                    """)
+            # Set both storages in one round-trip; values go over as data, not code
+            local_storage = inject_data.get('localStorage') or {}
+            session_storage = inject_data.get('sessionStorage') or {}
+            if local_storage or session_storage:
+                await page.evaluate("""
+                    (data) => {
+                        for (const [key, value] of Object.entries(data.local)) {
+                            localStorage.setItem(key, String(value));
+                        }
+                        for (const [key, value] of Object.entries(data.session)) {
+                            sessionStorage.setItem(key, String(value));
+                        }
+                    }
+                """, {'local': local_storage, 'session': session_storage})
             
             # Mock API responses (intercept fetch)
-            if 'api_mocks' in inject_data and inject_data['api_mocks']:
-                import json
-                mocks_json = json.dumps(inject_data['api_mocks'])
-                page.evaluate(f"""
-                    (mocks) => {{
+            if inject_data.get('api_mocks'):
+                await page.evaluate("""
+                    (mocks) => {
                         const originalFetch = window.fetch;
-                        window.fetch = function(url, options) {{
+                        window.fetch = function(url, options) {
                             // Check if this URL should be mocked
-                            for (const [mockUrl, mockResponse] of Object.entries(mocks)) {{
-                                if (url.includes(mockUrl)) {{
-                                    return Promise.resolve({{
-                                        ok: mockResponse.status < 400,
+                            for (const [mockUrl, mockResponse] of Object.entries(mocks)) {
+                                if (String(url).includes(mockUrl)) {
+                                    return Promise.resolve({
+                                        ok: (mockResponse.status || 200) < 400,
                                         status: mockResponse.status || 200,
-                                        json: () => Promise.resolve(mockResponse.body || {{}}),
-                                        text: () => Promise.resolve(JSON.stringify(mockResponse.body || {{}})),
-                                        headers: new Headers(mockResponse.headers || {{}})
-                                    }});
-                                }}
-                            }}
+                                        json: () => Promise.resolve(mockResponse.body || {}),
+                                        text: () => Promise.resolve(JSON.stringify(mockResponse.body || {})),
+                                        headers: new Headers(mockResponse.headers || {})
+                                    });
+                                }
+                            }
                             return originalFetch(url, options);
-                        }};
-                    }}
-                """, mocks_json)
-                
+                        };
+                    }
+                """, inject_data['api_mocks'])
+        
         except Exception as e:
             print(f"Data injection warning: {e}")
     
-    def capture_pdf(self, url, width=1920, height=1080, landscape=False, 
-                   print_background=True, scale=1.0, extra_headers=None):
+    def capture_pdf(self, url, **kwargs):
+        """
+        Capture webpage as PDF (blocking, callable from any thread)
+        
+        Accepts the same arguments as capture_pdf_async.
+        
+        Returns:
+            str: Path to the saved PDF
+        """
+        return self._run(self.capture_pdf_async(url, **kwargs))
+    
+    async def capture_pdf_async(self, url, width=1920, height=1080, landscape=False,
+                                print_background=True, scale=1.0, extra_headers=None):
         """
         Capture webpage as PDF
         
@@ -382,13 +629,14 @@ class ScreenshotService:
             str: Path to the saved PDF
         """
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        filename = f'screenshot_{timestamp}.pdf'
+        filename = f'screenshot_{timestamp}_{uuid.uuid4().hex[:8]}.pdf'
         filepath = self.screenshots_dir / filename
         
         try:
-            with sync_playwright() as playwright:
-                browser = playwright.chromium.launch(headless=True)
-                
+            # PDFs are Chromium-only; share the pooled browser with screenshots
+            browser = await self._get_browser('chromium')
+            
+            async with self._get_context_slots():
                 context_options = {
                     'ignore_https_errors': True,
                     'viewport': {'width': width, 'height': height}
@@ -397,24 +645,25 @@ class ScreenshotService:
                 if extra_headers:
                     context_options['extra_http_headers'] = extra_headers
                 
-                context = browser.new_context(**context_options)
-                page = context.new_page()
+                context = await browser.new_context(**context_options)
                 
-                page.emulate_media(media='print')
-                page.goto(url, wait_until='networkidle', timeout=45000)
-                
-                pdf_options = {
-                    'path': str(filepath),
-                    'landscape': landscape,
-                    'print_background': print_background,
-                    'scale': scale,
-                    'format': 'A4'
-                }
-                
-                page.pdf(**pdf_options)
-                
-                context.close()
-                browser.close()
+                try:
+                    page = await context.new_page()
+                    
+                    await page.emulate_media(media='print')
+                    await page.goto(url, wait_until='networkidle', timeout=45000)
+                    
+                    pdf_options = {
+                        'path': str(filepath),
+                        'landscape': landscape,
+                        'print_background': print_background,
+                        'scale': scale,
+                        'format': 'A4'
+                    }
+                    
+                    await page.pdf(**pdf_options)
+                finally:
+                    await context.close()
             
             return str(filepath)
         
@@ -430,15 +679,25 @@ class ScreenshotService:
         Args:
             max_age_hours (int): Maximum age in hours
         """
-        import time
         current_time = time.time()
         max_age_seconds = max_age_hours * 3600
         
-        for screenshot_file in self.screenshots_dir.glob('screenshot_*'):
-            if screenshot_file.is_file():
-                file_age = current_time - screenshot_file.stat().st_mtime
-                if file_age > max_age_seconds:
-                    try:
-                        screenshot_file.unlink()
-                    except Exception:
-                        pass  # Ignore cleanup errors
+        # DirEntry carries the file type from readdir, so each file costs one stat
+        with os.scandir(self.screenshots_dir) as entries:
+            for entry in entries:
+                if not entry.name.startswith('screenshot_') or not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    if current_time - entry.stat().st_mtime > max_age_seconds:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass  # Ignore cleanup errors (e.g. removed concurrently)
+    
+    def _sweeper(self, interval=3600.0):
+        """Background loop that runs cleanup_old_screenshots() once per interval"""
+        while True:
+            time.sleep(interval)
+            try:
+                self.cleanup_old_screenshots()
+            except Exception as e:
+                print(f"Screenshot cleanup warning: {e}")
@@ -3,29 +3,60 @@ Test Script for Webpage Screenshot API
 Demonstrates various API features and validates functionality
 """
 
+import hashlib
 import requests
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
+from test_utils import API_BASE, SESSION, print_section, save_response
 
 # Configuration
-API_BASE_URL = "http://localhost:5000"
-API_KEY = "demo-key-12345"
 OUTPUT_DIR = "test_outputs"
 
+# Output rules, built once
+SECTION_WIDTH = 60
+HBAR = "═" * 58
+BANNER = f"╔{HBAR}╗\n║{' ' * 10}Webpage Screenshot API Test Suite{' ' * 14}║\n╚{HBAR}╝"
+
+# Screenshot request params -> (ETag, BLAKE2b digest of the body) from the last full download
+CONTENT_HASHES = {}
+
 # Create output directory
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def print_section(title):
-    """Print a formatted section header"""
-    print("\n" + "=" * 60)
-    print(f"  {title}")
-    print("=" * 60)
+def content_digest(response):
+    """BLAKE2b digest of a response body, cheaper to keep and compare than the bytes"""
+    return hashlib.blake2b(response.content, digest_size=16).digest()
+
+def fetch_screenshot(params, revalidate=True, stream=False):
+    """
+    GET a screenshot, revalidating with If-None-Match when the same request was downloaded before
+    
+    Args:
+        params (dict): Query parameters
+        revalidate (bool): Send the stored ETag so an unchanged screenshot comes back as 304
+        stream (bool): Leave the body unread for save_response (no content digest is kept)
+    
+    Returns:
+        requests.Response: 200 with the image, or 304 with an empty body
+    """
+    key = tuple(sorted(params.items()))
+    known = CONTENT_HASHES.get(key)
+    headers = {}
+    if revalidate and known and known[0]:
+        headers["If-None-Match"] = known[0]
+    
+    response = SESSION.get(f"{API_BASE}/screenshot", params=params, headers=headers, stream=stream)
+    if response.status_code == 200:
+        digest = None if stream else content_digest(response)
+        CONTENT_HASHES[key] = (response.headers.get("ETag"), digest)
+    return response
 
 def test_health_check():
     """Test the health endpoint"""
-    print_section("Test 1: Health Check")
+    print_section("Test 1: Health Check", width=SECTION_WIDTH)
     
-    response = requests.get(f"{API_BASE_URL}/health")
+    response = SESSION.get(f"{API_BASE}/health")
     print(f"Status Code: {response.status_code}")
     print(f"Response: {response.json()}")
     
@@ -34,9 +65,10 @@ def test_health_check():
 
 def test_missing_api_key():
     """Test request without API key"""
-    print_section("Test 2: Missing API Key")
+    print_section("Test 2: Missing API Key", width=SECTION_WIDTH)
     
-    response = requests.get(f"{API_BASE_URL}/screenshot?url=https://example.com")
+    # Drop the session's key for this call only
+    response = SESSION.get(f"{API_BASE}/screenshot?url=https://example.com", headers={"X-API-Key": None})
     print(f"Status Code: {response.status_code}")
     print(f"Response: {response.json()}")
     
@@ -45,10 +77,10 @@ def test_missing_api_key():
 
 def test_invalid_api_key():
     """Test request with invalid API key"""
-    print_section("Test 3: Invalid API Key")
+    print_section("Test 3: Invalid API Key", width=SECTION_WIDTH)
     
     headers = {"X-API-Key": "invalid-key-xyz"}
-    response = requests.get(f"{API_BASE_URL}/screenshot?url=https://example.com", headers=headers)
+    response = SESSION.get(f"{API_BASE}/screenshot?url=https://example.com", headers=headers)
     print(f"Status Code: {response.status_code}")
     print(f"Response: {response.json()}")
     
@@ -57,10 +89,9 @@ def test_invalid_api_key():
 
 def test_missing_url():
     """Test request without URL parameter"""
-    print_section("Test 4: Missing URL Parameter")
+    print_section("Test 4: Missing URL Parameter", width=SECTION_WIDTH)
     
-    headers = {"X-API-Key": API_KEY}
-    response = requests.get(f"{API_BASE_URL}/screenshot", headers=headers)
+    response = SESSION.get(f"{API_BASE}/screenshot")
     print(f"Status Code: {response.status_code}")
     print(f"Response: {response.json()}")
     
@@ -69,83 +100,81 @@ def test_missing_url():
 
 def test_basic_screenshot():
     """Test basic screenshot capture"""
-    print_section("Test 5: Basic Screenshot (PNG)")
+    print_section("Test 5: Basic Screenshot (PNG)", width=SECTION_WIDTH)
     
-    headers = {"X-API-Key": API_KEY}
     params = {
         "url": "https://example.com",
         "width": 1280,
-        "height": 720
+        "height": 720,
+        "format": "png"
     }
     
     start_time = time.time()
-    response = requests.get(f"{API_BASE_URL}/screenshot", headers=headers, params=params)
+    response = fetch_screenshot(params, stream=True)
     elapsed = time.time() - start_time
     
     print(f"Status Code: {response.status_code}")
     print(f"Content-Type: {response.headers.get('Content-Type')}")
-    print(f"Content-Length: {len(response.content)} bytes")
     print(f"Time Taken: {elapsed:.2f} seconds")
     
     if response.status_code == 200:
         output_file = os.path.join(OUTPUT_DIR, "test_basic.png")
-        with open(output_file, "wb") as f:
-            f.write(response.content)
+        size = save_response(response, output_file)
+        print(f"Content-Length: {size} bytes")
         print(f"✅ Screenshot saved to: {output_file}")
+    elif response.status_code == 304:
+        print("✅ Not modified since the last download")
     else:
         print(f"❌ Error: {response.json()}")
 
 def test_jpeg_screenshot():
     """Test JPEG screenshot with quality"""
-    print_section("Test 6: JPEG Screenshot")
+    print_section("Test 6: JPEG Screenshot", width=SECTION_WIDTH)
     
-    headers = {"X-API-Key": API_KEY}
     params = {
         "url": "https://example.com",
         "format": "jpeg",
         "quality": 90
     }
     
-    response = requests.get(f"{API_BASE_URL}/screenshot", headers=headers, params=params)
+    response = fetch_screenshot(params, stream=True)
     print(f"Status Code: {response.status_code}")
     print(f"Content-Type: {response.headers.get('Content-Type')}")
-    print(f"Content-Length: {len(response.content)} bytes")
     
     if response.status_code == 200:
         output_file = os.path.join(OUTPUT_DIR, "test_jpeg.jpg")
-        with open(output_file, "wb") as f:
-            f.write(response.content)
+        size = save_response(response, output_file)
+        print(f"Content-Length: {size} bytes")
         print(f"✅ JPEG screenshot saved to: {output_file}")
+    elif response.status_code == 304:
+        print("✅ Not modified since the last download")
 
 def test_fullpage_screenshot():
     """Test full page screenshot"""
-    print_section("Test 7: Full Page Screenshot")
+    print_section("Test 7: Full Page Screenshot", width=SECTION_WIDTH)
     
-    headers = {"X-API-Key": API_KEY}
     params = {
         "url": "https://example.com",
         "fullpage": "true",
         "width": 1920,
-        "height": 1080
+        "height": 1080,
+        "format": "png"
     }
     
-    response = requests.get(f"{API_BASE_URL}/screenshot", headers=headers, params=params)
+    response = fetch_screenshot(params, stream=True)
     print(f"Status Code: {response.status_code}")
     
     if response.status_code == 200:
         output_file = os.path.join(OUTPUT_DIR, "test_fullpage.png")
-        with open(output_file, "wb") as f:
-            f.write(response.content)
+        save_response(response, output_file)
         print(f"✅ Full page screenshot saved to: {output_file}")
+    elif response.status_code == 304:
+        print("✅ Not modified since the last download")
 
 def test_post_request():
     """Test POST request with JSON body"""
-    print_section("Test 8: POST Request with JSON")
+    print_section("Test 8: POST Request with JSON", width=SECTION_WIDTH)
     
-    headers = {
-        "X-API-Key": API_KEY,
-        "Content-Type": "application/json"
-    }
     data = {
         "url": "https://example.com",
         "width": 800,
@@ -153,20 +182,18 @@ def test_post_request():
         "format": "png"
     }
     
-    response = requests.post(f"{API_BASE_URL}/screenshot", headers=headers, json=data)
+    response = SESSION.post(f"{API_BASE}/screenshot", json=data, stream=True)
     print(f"Status Code: {response.status_code}")
     
     if response.status_code == 200:
         output_file = os.path.join(OUTPUT_DIR, "test_post.png")
-        with open(output_file, "wb") as f:
-            f.write(response.content)
+        save_response(response, output_file)
         print(f"✅ POST request screenshot saved to: {output_file}")
 
 def test_caching():
     """Test caching functionality"""
-    print_section("Test 9: Caching Performance")
+    print_section("Test 9: Caching Performance", width=SECTION_WIDTH)
     
-    headers = {"X-API-Key": API_KEY}
     params = {
         "url": "https://example.com",
         "width": 1024,
@@ -176,17 +203,27 @@ def test_caching():
     # First request (should capture)
     print("Making first request (will capture screenshot)...")
     start_time = time.time()
-    response1 = requests.get(f"{API_BASE_URL}/screenshot", headers=headers, params=params)
+    response1 = fetch_screenshot(params, revalidate=False)
     time1 = time.time() - start_time
     print(f"First request time: {time1:.2f} seconds")
     
     # Second request (should use cache)
     print("Making second request (should use cache)...")
     start_time = time.time()
-    response2 = requests.get(f"{API_BASE_URL}/screenshot", headers=headers, params=params)
+    response2 = fetch_screenshot(params, revalidate=False)
     time2 = time.time() - start_time
     print(f"Second request time: {time2:.2f} seconds")
     
+    # A cache that serves the wrong bytes fast should not pass
+    assert content_digest(response2) == content_digest(response1)
+    print("✅ Cached screenshot matches the original")
+    
+    # Third request revalidates with the ETag and should skip the download
+    response3 = fetch_screenshot(params)
+    print(f"Revalidation status: {response3.status_code}")
+    if response3.status_code == 304:
+        print("✅ Unchanged screenshot revalidated without re-downloading")
+    
     if time2 < time1:
         speedup = time1 / time2
         print(f"✅ Cache speedup: {speedup:.2f}x faster!")
@@ -195,42 +232,40 @@ def test_caching():
 
 def test_rate_limiting():
     """Test rate limiting"""
-    print_section("Test 10: Rate Limiting")
+    print_section("Test 10: Rate Limiting", width=SECTION_WIDTH)
     
-    headers = {"X-API-Key": API_KEY}
     params = {"url": "https://example.com"}
     
-    print("Sending 12 rapid requests to test rate limiting...")
-    success_count = 0
-    rate_limited = False
+    print("Sending a burst of 12 simultaneous requests to test rate limiting...")
     
-    for i in range(12):
-        response = requests.get(f"{API_BASE_URL}/screenshot", headers=headers, params=params)
+    # The requests are identical, so merge headers and encode the query string once
+    prepared = SESSION.prepare_request(requests.Request("GET", f"{API_BASE}/screenshot", params=params))
+    
+    # Fire them all at once so the bucket cannot refill between requests
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        futures = [executor.submit(SESSION.send, prepared, timeout=60) for _ in range(12)]
+        responses = [future.result() for future in futures]
+    
+    for i, response in enumerate(responses):
         if response.status_code == 200:
-            success_count += 1
             print(f"Request {i+1}: ✅ Success")
         elif response.status_code == 429:
-            rate_limited = True
-            print(f"Request {i+1}: ⚠️  Rate limited")
-            retry_after = response.json().get('retry_after')
-            print(f"  Retry after: {retry_after} seconds")
-            break
+            print(f"Request {i+1}: ⚠️  Rate limited (retry after {response.headers.get('Retry-After')} seconds)")
         else:
             print(f"Request {i+1}: ❌ Error {response.status_code}")
-        
-        time.sleep(0.1)  # Small delay between requests
+    
+    success_count = sum(response.status_code == 200 for response in responses)
+    rate_limited = any(response.status_code == 429 for response in responses)
     
     if rate_limited:
-        print(f"✅ Rate limiting working! {success_count} requests succeeded before limit")
+        print(f"✅ Rate limiting working! {success_count} of {len(responses)} requests succeeded within the limit")
     else:
         print(f"⚠️  All {success_count} requests succeeded (rate limit not triggered)")
 
 def run_all_tests():
     """Run all tests"""
     print("\n")
-    print("╔" + "═" * 58 + "╗")
-    print("║" + " " * 10 + "Webpage Screenshot API Test Suite" + " " * 14 + "║")
-    print("╚" + "═" * 58 + "╝")
+    print(BANNER)
     
     try:
         test_health_check()
@@ -244,7 +279,7 @@ def run_all_tests():
         test_caching()
         test_rate_limiting()
         
-        print_section("🎉 All Tests Completed!")
+        print_section("🎉 All Tests Completed!", width=SECTION_WIDTH)
         print(f"\nScreenshots saved to: {os.path.abspath(OUTPUT_DIR)}")
         
     except requests.exceptions.ConnectionError:
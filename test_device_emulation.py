@@ -3,12 +3,12 @@
 Test Device Emulation Feature
 """
 
-import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
+from test_utils import API_BASE, SESSION, save_response
 
-# Test configuration
-BASE_URL = "http://localhost:5000"
-API_KEY = "demo-key-12345"
+# These screenshots are only looked at, so fetch small JPEGs rather than lossless PNGs
+IMAGE_PARAMS = {'format': 'jpeg', 'quality': 85}
 
 def test_device_emulation():
     """Test device emulation with different presets"""
@@ -30,25 +30,31 @@ def test_device_emulation():
     print("=" * 60)
     print()
     
-    for device in devices:
-        print(f"Testing device: {device}")
-        
-        # Test with GET request
-        response = requests.get(
-            f"{BASE_URL}/screenshot",
+    def capture(device):
+        """Capture one device preset with a GET request"""
+        response = SESSION.get(
+            f"{API_BASE}/screenshot",
             params={
                 'url': test_url,
                 'device': device,
-                'api_key': API_KEY
-            }
+                **IMAGE_PARAMS
+            },
+            stream=True
         )
+        return device, response
+    
+    # Presets are independent, so render them concurrently; files are written below in order
+    with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+        results = list(executor.map(capture, devices))
+    
+    for device, response in results:
+        print(f"Testing device: {device}")
         
         if response.status_code == 200:
-            filename = f"test_device_{device}.png"
-            with open(filename, 'wb') as f:
-                f.write(response.content)
+            filename = f"test_device_{device}.jpg"
+            size = save_response(response, filename)
             print(f"  ✅ Screenshot saved: {filename}")
-            print(f"  Size: {len(response.content)} bytes")
+            print(f"  Size: {size} bytes")
         else:
             print(f"  ❌ Error: {response.status_code}")
             print(f"  {response.text}")
@@ -71,45 +77,45 @@ def test_device_vs_manual():
     
     # Test 1: Using device preset
     print("Test 1: Using device='iphone13'")
-    response1 = requests.get(
-        f"{BASE_URL}/screenshot",
+    response1 = SESSION.get(
+        f"{API_BASE}/screenshot",
         params={
             'url': test_url,
             'device': 'iphone13',
-            'api_key': API_KEY
-        }
+            **IMAGE_PARAMS
+        },
+        stream=True
     )
     
     if response1.status_code == 200:
-        with open('test_iphone13_preset.png', 'wb') as f:
-            f.write(response1.content)
-        print("  ✅ Screenshot saved: test_iphone13_preset.png")
+        save_response(response1, 'test_iphone13_preset.jpg')
+        print("  ✅ Screenshot saved: test_iphone13_preset.jpg")
         print(f"  Expected: 390x844")
     
     print()
     
     # Test 2: Manual viewport (same dimensions as iPhone 13)
     print("Test 2: Using width=390, height=844 (manual)")
-    response2 = requests.get(
-        f"{BASE_URL}/screenshot",
+    response2 = SESSION.get(
+        f"{API_BASE}/screenshot",
         params={
             'url': test_url,
             'width': 390,
             'height': 844,
-            'api_key': API_KEY
-        }
+            **IMAGE_PARAMS
+        },
+        stream=True
     )
     
     if response2.status_code == 200:
-        with open('test_iphone13_manual.png', 'wb') as f:
-            f.write(response2.content)
-        print("  ✅ Screenshot saved: test_iphone13_manual.png")
+        save_response(response2, 'test_iphone13_manual.jpg')
+        print("  ✅ Screenshot saved: test_iphone13_manual.jpg")
         print(f"  Expected: 390x844")
     
     print()
     print("Compare the two screenshots:")
-    print("  - test_iphone13_preset.png (should show mobile user agent)")
-    print("  - test_iphone13_manual.png (should show desktop user agent)")
+    print("  - test_iphone13_preset.jpg (should show mobile user agent)")
+    print("  - test_iphone13_manual.jpg (should show desktop user agent)")
     print()
 
 if __name__ == '__main__':
@@ -4,29 +4,20 @@ Test Enterprise Features:
 2. Usage Dashboard
 """
 
-import requests
 import json
+import os
 import time
-from datetime import datetime
+from test_utils import API_BASE, BAR, OUT, SESSION, print_banner, print_section
 
-API_BASE = "http://localhost:5000"
-API_KEY = "demo-key-12345"
-
-print("=" * 80)
-print("  TESTING ENTERPRISE FEATURES")
-print("=" * 80)
-print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("=" * 80)
+print_banner("TESTING ENTERPRISE FEATURES")
 
 # FEATURE 1: Async Screenshot with Webhook
-print("\n[FEATURE 1] ASYNC SCREENSHOT WITH WEBHOOK")
-print("-" * 80)
+print_section("[FEATURE 1] ASYNC SCREENSHOT WITH WEBHOOK")
 
 print("\nTest 1: Create async screenshot job...")
 try:
-    response = requests.post(
+    response = SESSION.post(
         f"{API_BASE}/screenshot/async",
-        headers={"X-API-Key": API_KEY},
         json={
             "url": "https://example.com",
             "webhook_url": "https://webhook.site/your-unique-url",  # Replace with real webhook
@@ -50,16 +41,19 @@ try:
         
         # Check job status
         print(f"\n  Checking job status...")
-        for i in range(5):
-            time.sleep(2)
-            status_response = requests.get(
-                f"{API_BASE}/jobs/{job_id}",
-                headers={"X-API-Key": API_KEY}
+        # Back off from 100ms up to 2s so fast jobs are seen quickly
+        delay = 0.1
+        deadline = time.time() + 30
+        attempt = 0
+        while time.time() < deadline:
+            attempt += 1
+            status_response = SESSION.get(
+                f"{API_BASE}/jobs/{job_id}"
             )
             
             if status_response.status_code == 200:
                 status_data = status_response.json()
-                print(f"    Attempt {i+1}: Status = {status_data['status']}")
+                print(f"    Attempt {attempt}: Status = {status_data['status']}")
                 
                 if status_data['status'] == 'completed':
                     print(f"  [SUCCESS] Job completed!")
@@ -68,6 +62,9 @@ try:
                 elif status_data['status'] == 'failed':
                     print(f"  [FAILED] Job failed: {status_data.get('error')}")
                     break
+            
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
     else:
         print(f"  [FAIL] Status: {response.status_code}")
         print(f"  Error: {response.text}")
@@ -75,8 +72,7 @@ except Exception as e:
     print(f"  [FAIL] Error: {str(e)}")
 
 # FEATURE 2: Usage Dashboard
-print("\n\n[FEATURE 2] USAGE DASHBOARD")
-print("-" * 80)
+print_section("[FEATURE 2] USAGE DASHBOARD")
 
 print("\nTest 1: Access dashboard (browser required)...")
 print(f"  Dashboard URL: {API_BASE}/dashboard")
@@ -95,66 +91,74 @@ test_urls = [
     "https://github.com"
 ]
 
-for url in test_urls:
-    try:
-        response = requests.get(
-            f"{API_BASE}/screenshot",
-            headers={"X-API-Key": API_KEY},
-            params={"url": url, "width": 800, "height": 600},
-            timeout=30
-        )
-        if response.status_code == 200:
-            print(f"  [PASS] Screenshot captured: {url}")
-        else:
-            print(f"  [INFO] Request logged: {url}")
-    except Exception as e:
-        print(f"  [INFO] Request logged (timeout): {url}")
+# One /batch call; the server captures the URLs concurrently
+try:
+    response = SESSION.post(
+        f"{API_BASE}/batch",
+        json={"urls": test_urls, "settings": {"width": 800, "height": 600, "format": "jpeg", "quality": 85}},
+        timeout=60
+    )
+    if response.status_code == 200:
+        for result in response.json()['results']:
+            if result['status'] == 'success':
+                print(f"  [PASS] Screenshot captured: {result['url']}")
+            else:
+                print(f"  [INFO] Request logged: {result['url']}")
+    else:
+        print(f"  [INFO] Batch request logged: status {response.status_code}")
+except Exception as e:
+    print(f"  [INFO] Batch request logged (timeout): {str(e)}")
 
 print("\n[INFO] Dashboard data generated!")
 print(f"  Now visit: {API_BASE}/dashboard")
 
 # Test webhook verification
-print("\n\n[FEATURE 3] WEBHOOK SIGNATURE VERIFICATION")
-print("-" * 80)
+print_section("[FEATURE 3] WEBHOOK SIGNATURE VERIFICATION")
 
-print("\nTest: Webhook signature generation...")
-try:
-    from webhook_service import WebhookService
-    
-    webhook_service = WebhookService()
-    
-    test_payload = {"job_id": "test123", "status": "completed"}
-    secret = "my-secret"
-    
-    signature = webhook_service._generate_signature(test_payload, secret)
-    print(f"  [PASS] Signature generated: {signature[:20]}...")
-    
-    # Verify signature
-    is_valid = webhook_service.verify_webhook_signature(test_payload, signature, secret)
-    print(f"  [PASS] Signature verification: {'Valid' if is_valid else 'Invalid'}")
-    
-    # Test with wrong signature
-    is_valid_wrong = webhook_service.verify_webhook_signature(test_payload, "wrong_signature", secret)
-    print(f"  [PASS] Wrong signature rejected: {'Yes' if not is_valid_wrong else 'No'}")
-    
-except Exception as e:
-    print(f"  [FAIL] Error: {str(e)}")
+# Set TEST_WEBHOOK=0 to skip importing the webhook service
+if os.getenv('TEST_WEBHOOK', '1') == '1':
+    print("\nTest: Webhook signature generation...")
+    try:
+        from webhook_service import WebhookService
+        
+        webhook_service = WebhookService()
+        
+        test_payload = {"job_id": "test123", "status": "completed"}
+        secret = "my-secret"
+        
+        signature = webhook_service._generate_signature(test_payload, secret)
+        print(f"  [PASS] Signature generated: {signature[:20]}...")
+        
+        # Verify signature
+        is_valid = webhook_service.verify_webhook_signature(test_payload, signature, secret)
+        print(f"  [PASS] Signature verification: {'Valid' if is_valid else 'Invalid'}")
+        
+        # Test with wrong signature
+        is_valid_wrong = webhook_service.verify_webhook_signature(test_payload, "wrong_signature", secret)
+        print(f"  [PASS] Wrong signature rejected: {'Yes' if not is_valid_wrong else 'No'}")
+        
+    except Exception as e:
+        print(f"  [FAIL] Error: {str(e)}")
+else:
+    print("\nTest: Webhook signature generation... skipped (TEST_WEBHOOK=0)")
 
 # Summary
-print("\n" + "=" * 80)
-print("  ENTERPRISE FEATURES TEST SUMMARY")
-print("=" * 80)
-print("\n1. [DONE] Async Screenshot with Webhook")
-print("   - Create async jobs")
-print("   - Track job status")
-print("   - Webhook notifications")
-print("   - HMAC signature verification")
-print("\n2. [DONE] Usage Dashboard")
-print("   - Statistics and analytics")
-print("   - API key management")
-print("   - Recent request logs")
-print("   - System health monitoring")
-print("\n" + "=" * 80)
-print(f"Visit the dashboard: {API_BASE}/dashboard")
-print(f"Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("=" * 80)
+OUT(
+    f"\n{BAR}\n"
+    "  ENTERPRISE FEATURES TEST SUMMARY\n"
+    f"{BAR}\n"
+    "\n1. [DONE] Async Screenshot with Webhook\n"
+    "   - Create async jobs\n"
+    "   - Track job status\n"
+    "   - Webhook notifications\n"
+    "   - HMAC signature verification\n"
+    "\n2. [DONE] Usage Dashboard\n"
+    "   - Statistics and analytics\n"
+    "   - API key management\n"
+    "   - Recent request logs\n"
+    "   - System health monitoring\n"
+    f"\n{BAR}\n"
+    f"Visit the dashboard: {API_BASE}/dashboard\n"
+    f"Completed at: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+    f"{BAR}\n"
+)
@@ -6,51 +6,88 @@ Test Suite for 4 New Developer Features:
 4. Data Injection
 """
 
-import requests
 import json
+import orjson
 import os
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from test_utils import API_BASE, BAR, OUT, SESSION, print_banner, print_section, save_response
 
-API_BASE = "http://localhost:5000"
-API_KEY = "demo-key-12345"
 TARGET_URL = "https://example.com"
 OUTPUT_DIR = "test_new_features_output"
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-print("=" * 80)
-print("  TESTING 4 NEW DEVELOPER FEATURES")
-print("=" * 80)
-print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("=" * 80)
+# Every file this script writes, joined once
+PATHS = {name: os.path.join(OUTPUT_DIR, name) for name in (
+    'chromium_screenshot.png', 'firefox_screenshot.png', 'webkit_screenshot.png',
+    'no_freeze.png', 'with_freeze.png', 'data_injected.png'
+)}
+
+# Request bodies are fixed, so serialize them once at import
+JSON_HEADERS = {"Content-Type": "application/json"}
+INJECT_PAYLOAD = orjson.dumps({
+    "url": TARGET_URL,
+    "inject_data": {
+        "localStorage": {
+            "user_id": "test123",
+            "theme": "dark",
+            "test_mode": "enabled"
+        },
+        "sessionStorage": {
+            "session_token": "abc123xyz"
+        },
+        "api_mocks": {
+            "/api/user": {
+                "status": 200,
+                "body": {"name": "Test User", "role": "admin"}
+            }
+        }
+    }
+})
+
+print_banner("TESTING 4 NEW DEVELOPER FEATURES")
 
 # FEATURE 1: Multi-Browser Support
-print("\n[FEATURE 1] MULTI-BROWSER SUPPORT")
-print("-" * 80)
+print_section("[FEATURE 1] MULTI-BROWSER SUPPORT")
 
 browsers = ['chromium', 'firefox', 'webkit']
-for browser in browsers:
-    print(f"\nTesting {browser.upper()}...")
+BROWSER_PAYLOADS = {
+    browser: orjson.dumps({"url": TARGET_URL, "browser": browser, "width": 1280, "height": 720})
+    for browser in browsers
+}
+
+
+def capture_browser(browser):
+    """Capture the target page with one engine, returning the response or the error"""
     try:
-        response = requests.post(
+        return browser, SESSION.post(
             f"{API_BASE}/screenshot",
-            headers={"X-API-Key": API_KEY},
-            json={
-                "url": TARGET_URL,
-                "browser": browser,
-                "width": 1280,
-                "height": 720
-            },
-            timeout=60
+            data=BROWSER_PAYLOADS[browser],
+            headers=JSON_HEADERS,
+            timeout=60,
+            stream=True
         )
+    except Exception as e:
+        return browser, e
+
+
+# Engines are independent, so render them concurrently; files are written below in order
+with ThreadPoolExecutor(max_workers=len(browsers)) as executor:
+    browser_results = list(executor.map(capture_browser, browsers))
+
+for browser, response in browser_results:
+    print(f"\nTesting {browser.upper()}...")
+    try:
+        if isinstance(response, Exception):
+            raise response
         
         if response.status_code == 200:
             filename = f"{browser}_screenshot.png"
-            filepath = os.path.join(OUTPUT_DIR, filename)
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            filepath = PATHS[filename]
+            size = save_response(response, filepath)
             print(f"  [PASS] {browser} - Saved to {filepath}")
-            print(f"  Size: {len(response.content)} bytes")
+            print(f"  Size: {size} bytes")
         else:
             print(f"  [FAIL] {browser} - Status: {response.status_code}")
             print(f"  Error: {response.text[:200]}")
@@ -58,21 +95,19 @@ for browser in browsers:
         print(f"  [FAIL] {browser} - Error: {str(e)}")
 
 # FEATURE 2: Animation Freezing
-print("\n\n[FEATURE 2] ANIMATION FREEZING")
-print("-" * 80)
+print_section("[FEATURE 2] ANIMATION FREEZING")
 
 print("\nTest 1: Without animation freeze...")
 try:
-    response1 = requests.get(
+    response1 = SESSION.get(
         f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
         params={"url": TARGET_URL, "disable_animations": "false"},
-        timeout=60
+        timeout=60,
+        stream=True
     )
     if response1.status_code == 200:
-        with open(os.path.join(OUTPUT_DIR, "no_freeze.png"), 'wb') as f:
-            f.write(response1.content)
-        print(f"  [PASS] Screenshot without freeze - {len(response1.content)} bytes")
+        size = save_response(response1, PATHS["no_freeze.png"])
+        print(f"  [PASS] Screenshot without freeze - {size} bytes")
     else:
         print(f"  [FAIL] Status: {response1.status_code}")
 except Exception as e:
@@ -80,16 +115,15 @@ except Exception as e:
 
 print("\nTest 2: With animation freeze...")
 try:
-    response2 = requests.get(
+    response2 = SESSION.get(
         f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
         params={"url": TARGET_URL, "disable_animations": "true"},
-        timeout=60
+        timeout=60,
+        stream=True
     )
     if response2.status_code == 200:
-        with open(os.path.join(OUTPUT_DIR, "with_freeze.png"), 'wb') as f:
-            f.write(response2.content)
-        print(f"  [PASS] Screenshot with freeze - {len(response2.content)} bytes")
+        size = save_response(response2, PATHS["with_freeze.png"])
+        print(f"  [PASS] Screenshot with freeze - {size} bytes")
         print(f"  Note: Screenshots should be identical (animations frozen)")
     else:
         print(f"  [FAIL] Status: {response2.status_code}")
@@ -97,40 +131,21 @@ except Exception as e:
     print(f"  [FAIL] Error: {str(e)}")
 
 # FEATURE 3: Data Injection
-print("\n\n[FEATURE 3] DATA INJECTION")
-print("-" * 80)
+print_section("[FEATURE 3] DATA INJECTION")
 
 print("\nInjecting localStorage and mocking API...")
 try:
-    response = requests.post(
+    response = SESSION.post(
         f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        json={
-            "url": TARGET_URL,
-            "inject_data": {
-                "localStorage": {
-                    "user_id": "test123",
-                    "theme": "dark",
-                    "test_mode": "enabled"
-                },
-                "sessionStorage": {
-                    "session_token": "abc123xyz"
-                },
-                "api_mocks": {
-                    "/api/user": {
-                        "status": 200,
-                        "body": {"name": "Test User", "role": "admin"}
-                    }
-                }
-            }
-        },
-        timeout=60
+        data=INJECT_PAYLOAD,
+        headers=JSON_HEADERS,
+        timeout=60,
+        stream=True
     )
     
     if response.status_code == 200:
-        filepath = os.path.join(OUTPUT_DIR, "data_injected.png")
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
+        filepath = PATHS["data_injected.png"]
+        save_response(response, filepath)
         print(f"  [PASS] Screenshot with injected data")
         print(f"  - localStorage: 3 items injected")
         print(f"  - sessionStorage: 1 item injected")
@@ -143,14 +158,12 @@ except Exception as e:
     print(f"  [FAIL] Error: {str(e)}")
 
 # FEATURE 4: Visual Regression Testing
-print("\n\n[FEATURE 4] VISUAL REGRESSION TESTING")
-print("-" * 80)
+print_section("[FEATURE 4] VISUAL REGRESSION TESTING")
 
 print("\nStep 1: Creating baseline...")
 try:
-    response = requests.post(
+    response = SESSION.post(
         f"{API_BASE}/baseline",
-        headers={"X-API-Key": API_KEY},
         json={
             "url": TARGET_URL,
             "name": "example_homepage",
@@ -172,9 +185,8 @@ except Exception as e:
 
 print("\nStep 2: Comparing with baseline (should match)...")
 try:
-    response = requests.post(
+    response = SESSION.post(
         f"{API_BASE}/compare",
-        headers={"X-API-Key": API_KEY},
         json={
             "url": TARGET_URL,
             "baseline": "example_homepage",
@@ -207,9 +219,8 @@ except Exception as e:
 
 print("\nStep 3: Testing comparison with different size (should fail)...")
 try:
-    response = requests.post(
+    response = SESSION.post(
         f"{API_BASE}/compare",
-        headers={"X-API-Key": API_KEY},
         json={
             "url": TARGET_URL,
             "baseline": "example_homepage",
@@ -233,14 +244,16 @@ except Exception as e:
     print(f"  [FAIL] Error: {str(e)}")
 
 # Summary
-print("\n" + "=" * 80)
-print("  SUMMARY - ALL 4 FEATURES TESTED")
-print("=" * 80)
-print("\n1. [DONE] Multi-Browser Support - Chrome, Firefox, Safari")
-print("2. [DONE] Animation Freezing - Consistent screenshots")
-print("3. [DONE] Data Injection - localStorage, sessionStorage, API mocks")
-print("4. [DONE] Visual Regression - Baseline creation and comparison")
-print("\n" + "=" * 80)
-print(f"All test outputs saved to: {OUTPUT_DIR}/")
-print(f"Completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("=" * 80)
+OUT(
+    f"\n{BAR}\n"
+    "  SUMMARY - ALL 4 FEATURES TESTED\n"
+    f"{BAR}\n"
+    "\n1. [DONE] Multi-Browser Support - Chrome, Firefox, Safari\n"
+    "2. [DONE] Animation Freezing - Consistent screenshots\n"
+    "3. [DONE] Data Injection - localStorage, sessionStorage, API mocks\n"
+    "4. [DONE] Visual Regression - Baseline creation and comparison\n"
+    f"\n{BAR}\n"
+    f"All test outputs saved to: {OUTPUT_DIR}/\n"
+    f"Completed at: {time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+    f"{BAR}\n"
+)
@@ -0,0 +1,57 @@
+"""
+Shared helpers for the API test scripts
+One session and one set of output helpers, so scripts run in the same
+process also share a connection pool
+"""
+
+import os
+import sys
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Configuration
+API_BASE = "http://localhost:5000"
+API_KEY = "demo-key-12345"
+
+# Output rules, built once
+BAR = "=" * 80
+RULE = "-" * 80
+
+# Multi-line blocks go out in one write instead of one print per line
+OUT = sys.stdout.write
+
+# One keep-alive session for every call; the pool is sized for the threaded tests
+SESSION = requests.Session()
+SESSION.headers.update({"X-API-Key": API_KEY})
+SESSION.mount("http://", HTTPAdapter(pool_connections=20, pool_maxsize=20, max_retries=0))
+
+
+def print_banner(title):
+    """Print a script banner with its start time"""
+    OUT(f"{BAR}\n  {title}\n{BAR}\n"
+        f"Started at: {time.strftime('%Y-%m-%d %H:%M:%S')}\n{BAR}\n")
+
+
+def print_section(title, width=None):
+    """
+    Print a feature section header
+    
+    Args:
+        title (str): Section title
+        width (int, optional): Frame the title between '=' bars this wide instead of underlining it
+    """
+    if width is None:
+        OUT(f"\n\n{title}\n{RULE}\n")
+    else:
+        bar = "=" * width
+        OUT(f"\n{bar}\n  {title}\n{bar}\n")
+
+
+def save_response(response, output_file):
+    """Write a response body to disk in chunks instead of buffering it whole; returns its size"""
+    # 1 MiB file buffer so multi-MB fullpage PNGs and PDFs go out in few write syscalls
+    with open(output_file, "wb", buffering=1024 * 1024) as f:
+        for chunk in response.iter_content(262144):
+            f.write(chunk)
+    return os.path.getsize(output_file)
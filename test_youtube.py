@@ -3,15 +3,16 @@ Comprehensive Unit Testing for All API Features
 Target: YouTube.com
 """
 
-import requests
-import json
+import base64
+import orjson
 import time
 import os
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from test_utils import API_BASE, SESSION, save_response
 
 # Configuration
-API_BASE = "http://localhost:5000"
-API_KEY = "demo-key-12345"
 TARGET_URL = "https://youtube.com"
 OUTPUT_DIR = "test_results_youtube"
 
@@ -24,6 +25,7 @@ test_results = {
     'failed': 0,
     'tests': []
 }
+results_lock = threading.Lock()
 
 def log_test(name, status, details=""):
     """Log test result"""
@@ -34,24 +36,25 @@ def log_test(name, status, details=""):
         'details': details,
         'timestamp': timestamp
     }
-    test_results['tests'].append(result)
-    
-    if status == 'PASS':
-        test_results['passed'] += 1
-        print(f"[{timestamp}] [PASS] {name}")
-    else:
-        test_results['failed'] += 1
-        print(f"[{timestamp}] [FAIL] {name}")
-    
-    if details:
-        print(f"          {details}")
+    with results_lock:
+        test_results['tests'].append(result)
+        
+        if status == 'PASS':
+            test_results['passed'] += 1
+            print(f"[{timestamp}] [PASS] {name}")
+        else:
+            test_results['failed'] += 1
+            print(f"[{timestamp}] [FAIL] {name}")
+        
+        if details:
+            print(f"          {details}")
 
 def save_screenshot(response, filename):
-    """Save screenshot if successful"""
-    if response.status_code == 200:
+    """Save screenshot if successful and the body really is an image or PDF"""
+    content_type = response.headers.get('Content-Type', '')
+    if response.status_code == 200 and content_type.startswith(('image/', 'application/pdf')):
         filepath = os.path.join(OUTPUT_DIR, filename)
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
+        save_response(response, filepath)
         return filepath
     return None
 
@@ -62,387 +65,143 @@ print(f"Output Directory: {OUTPUT_DIR}")
 print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 print("=" * 80)
 
-# Test 1: Basic Screenshot
-print("\n[TEST 1] Basic Screenshot")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "format": "png"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "01_basic.png")
-        log_test("Basic Screenshot", "PASS", f"Size: {len(response.content)} bytes, Saved: {path}")
-    else:
-        log_test("Basic Screenshot", "FAIL", f"Status: {response.status_code}, {response.text[:100]}")
-except Exception as e:
-    log_test("Basic Screenshot", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 2: Custom Viewport Size
-print("\n[TEST 2] Custom Viewport Size (1280x720)")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "width": 1280, "height": 720},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "02_custom_size.png")
-        log_test("Custom Viewport", "PASS", f"1280x720, Saved: {path}")
-    else:
-        log_test("Custom Viewport", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Custom Viewport", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 3: Full Page Screenshot
-print("\n[TEST 3] Full Page Screenshot")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "fullpage": "true"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "03_fullpage.png")
-        log_test("Full Page", "PASS", f"Size: {len(response.content)} bytes, Saved: {path}")
-    else:
-        log_test("Full Page", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Full Page", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 4: With Delay
-print("\n[TEST 4] Screenshot with 5-second Delay")
-try:
-    start = time.time()
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "delay": 5000},
-        timeout=60
-    )
-    elapsed = time.time() - start
-    if response.status_code == 200:
-        path = save_screenshot(response, "04_delay_5s.png")
-        log_test("Delay Feature", "PASS", f"Took {elapsed:.1f}s (expected >5s), Saved: {path}")
-    else:
-        log_test("Delay Feature", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Delay Feature", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 5: JPEG Format
-print("\n[TEST 5] JPEG Format with Quality 90")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "format": "jpeg", "quality": 90},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "05_jpeg_q90.jpg")
-        content_type = response.headers.get('Content-Type')
-        log_test("JPEG Format", "PASS", f"Type: {content_type}, Saved: {path}")
-    else:
-        log_test("JPEG Format", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("JPEG Format", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 6: PDF Export
-print("\n[TEST 6] PDF Export")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "format": "pdf"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "06_export.pdf")
-        content_type = response.headers.get('Content-Type')
-        log_test("PDF Export", "PASS", f"Type: {content_type}, Saved: {path}")
-    else:
-        log_test("PDF Export", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("PDF Export", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 7: Device Emulation - iPhone 13
-print("\n[TEST 7] Device Emulation (iPhone 13)")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "device": "iphone13"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "07_iphone13.png")
-        log_test("iPhone 13 Emulation", "PASS", f"Saved: {path}")
-    else:
-        log_test("iPhone 13 Emulation", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("iPhone 13 Emulation", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 8: Device Emulation - iPad Pro
-print("\n[TEST 8] Device Emulation (iPad Pro)")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "device": "ipad_pro"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "08_ipad_pro.png")
-        log_test("iPad Pro Emulation", "PASS", f"Saved: {path}")
-    else:
-        log_test("iPad Pro Emulation", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("iPad Pro Emulation", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 9: Dark Mode
-print("\n[TEST 9] Dark Mode")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "dark_mode": "true"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "09_dark_mode.png")
-        log_test("Dark Mode", "PASS", f"Saved: {path}")
-    else:
-        log_test("Dark Mode", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Dark Mode", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 10: Block Ads
-print("\n[TEST 10] Block Ads and Trackers")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "block_ads": "true"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "10_block_ads.png")
-        log_test("Block Ads", "PASS", f"Saved: {path}")
-    else:
-        log_test("Block Ads", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Block Ads", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 11: Scroll Page for Lazy Loading
-print("\n[TEST 11] Scroll Page for Lazy Loading")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "scroll_page": "true", "fullpage": "true"},
-        timeout=90
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "11_scroll_lazy.png")
-        log_test("Scroll & Lazy Load", "PASS", f"Saved: {path}")
-    else:
-        log_test("Scroll & Lazy Load", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Scroll & Lazy Load", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 12: Element Selector
-print("\n[TEST 12] Element-Specific Screenshot (logo)")
-try:
-    response = requests.post(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        json={"url": TARGET_URL, "selector": "#logo"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "12_element_logo.png")
-        log_test("Element Selector", "PASS", f"Selector: #logo, Saved: {path}")
-    else:
-        log_test("Element Selector", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Element Selector", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 13: Custom JavaScript
-print("\n[TEST 13] Custom JavaScript Execution")
-try:
-    response = requests.post(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        json={
-            "url": TARGET_URL,
-            "script": "document.body.style.backgroundColor='lightblue'"
-        },
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "13_custom_js.png")
-        log_test("Custom JavaScript", "PASS", f"Saved: {path}")
-    else:
-        log_test("Custom JavaScript", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Custom JavaScript", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 14: Wait for Selector
-print("\n[TEST 14] Wait for Selector")
-try:
-    response = requests.post(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        json={"url": TARGET_URL, "wait_for_selector": "body"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "14_wait_selector.png")
-        log_test("Wait for Selector", "PASS", f"Saved: {path}")
-    else:
-        log_test("Wait for Selector", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Wait for Selector", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 15: Print Media Type
-print("\n[TEST 15] Print Media Emulation")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL, "media_type": "print"},
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "15_print_media.png")
-        log_test("Print Media", "PASS", f"Saved: {path}")
-    else:
-        log_test("Print Media", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Print Media", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 16: Combined Features
-print("\n[TEST 16] Combined Features (Mobile + Dark + Block Ads)")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={
-            "url": TARGET_URL,
-            "device": "iphone13",
-            "dark_mode": "true",
-            "block_ads": "true"
-        },
-        timeout=60
-    )
-    if response.status_code == 200:
-        path = save_screenshot(response, "16_combined.png")
-        log_test("Combined Features", "PASS", f"Saved: {path}")
-    else:
-        log_test("Combined Features", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Combined Features", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 17: Rate Limit Headers
-print("\n[TEST 17] Rate Limit Headers")
-try:
-    response = requests.get(
-        f"{API_BASE}/screenshot",
-        headers={"X-API-Key": API_KEY},
-        params={"url": TARGET_URL},
-        timeout=60
-    )
+def check_rate_limit_headers(response):
+    """Pass when the rate limit headers are present, whatever the status"""
     minute = response.headers.get('X-RateLimit-Remaining-Minute', 'N/A')
     hour = response.headers.get('X-RateLimit-Remaining-Hour', 'N/A')
     if minute != 'N/A' or hour != 'N/A':
-        log_test("Rate Limit Headers", "PASS", f"Minute: {minute}, Hour: {hour}")
-    else:
-        log_test("Rate Limit Headers", "FAIL", "Headers not found")
-except Exception as e:
-    log_test("Rate Limit Headers", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 18: Batch Processing
-print("\n[TEST 18] Batch Processing (2 URLs)")
-try:
-    response = requests.post(
-        f"{API_BASE}/batch",
-        headers={"X-API-Key": API_KEY},
-        json={
-            "urls": [TARGET_URL, "https://example.com"],
-            "settings": {"width": 800, "height": 600, "format": "png"}
-        },
-        timeout=120
-    )
-    if response.status_code == 200:
-        result = response.json()
-        log_test("Batch Processing", "PASS", f"Processed {result['total']} URLs")
-    else:
-        log_test("Batch Processing", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Batch Processing", "FAIL", str(e))
-
-time.sleep(1)
-
-# Test 19: Device List Endpoint
-print("\n[TEST 19] Device List Endpoint")
-try:
-    response = requests.get(f"{API_BASE}/devices", timeout=10)
-    if response.status_code == 200:
-        devices = response.json()
-        log_test("Device List", "PASS", f"Found {len(devices.get('devices', []))} devices")
-    else:
-        log_test("Device List", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Device List", "FAIL", str(e))
-
-# Test 20: Health Check
-print("\n[TEST 20] Health Check Endpoint")
-try:
-    response = requests.get(f"{API_BASE}/health", timeout=10)
-    if response.status_code == 200:
-        health = response.json()
-        log_test("Health Check", "PASS", f"Status: {health.get('status')}")
-    else:
-        log_test("Health Check", "FAIL", f"Status: {response.status_code}")
-except Exception as e:
-    log_test("Health Check", "FAIL", str(e))
+        return True, f"Minute: {minute}, Hour: {hour}"
+    return False, "Headers not found"
+
+def save_batch_entry(item):
+    """Decode one successful batch entry's data URI and write it to disk"""
+    number, entry = item
+    header, encoded = entry['data'].split(',', 1)
+    # Name the file from the data URI's media type, e.g. data:image/png;base64
+    extension = header[len('data:image/'):].split(';')[0]
+    with open(os.path.join(OUTPUT_DIR, f"18_batch_{number}.{extension}"), 'wb') as f:
+        f.write(base64.b64decode(encoded))
+
+def check_batch(response):
+    """Pass when every batch entry succeeded; decode and save each returned screenshot"""
+    if response.status_code != 200:
+        return False, f"Status: {response.status_code}"
+    result = orjson.loads(response.content)
+    entries = list(enumerate(result['results'], 1))
+    errors = [f"{entry['url']}: {entry.get('message')}" for _, entry in entries if entry['status'] != 'success']
+    saved = [item for item in entries if item[1]['status'] == 'success']
+    if saved:
+        # Decode and write the images side by side; file writes release the GIL
+        with ThreadPoolExecutor(max_workers=len(saved)) as executor:
+            list(executor.map(save_batch_entry, saved))
+    if errors:
+        return False, f"{len(errors)}/{result['total']} failed: {'; '.join(errors)}"
+    return True, f"Processed {result['total']} URLs, Saved: {OUTPUT_DIR}/18_batch_*"
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Test descriptors: every test is independent, so they run concurrently.
+# POST bodies are serialized once here rather than by every request
+TESTS = [
+    {"name": "Basic Screenshot", "title": "Basic Screenshot",
+     "params": {"url": TARGET_URL, "format": "png"}, "save": "01_basic.png",
+     "details": lambda r, elapsed, path: f"Size: {os.path.getsize(path)} bytes, Saved: {path}"},
+    {"name": "Custom Viewport", "title": "Custom Viewport Size (1280x720)",
+     "params": {"url": TARGET_URL, "width": 1280, "height": 720, "format": "png"}, "save": "02_custom_size.png",
+     "details": lambda r, elapsed, path: f"1280x720, Saved: {path}"},
+    {"name": "Full Page", "title": "Full Page Screenshot",
+     "params": {"url": TARGET_URL, "fullpage": "true", "format": "png"}, "save": "03_fullpage.png",
+     "details": lambda r, elapsed, path: f"Size: {os.path.getsize(path)} bytes, Saved: {path}"},
+    {"name": "Delay Feature", "title": "Screenshot with 5-second Delay",
+     "params": {"url": TARGET_URL, "delay": 5000, "format": "png"}, "save": "04_delay_5s.png",
+     "details": lambda r, elapsed, path: f"Took {elapsed:.1f}s (expected >5s), Saved: {path}"},
+    {"name": "JPEG Format", "title": "JPEG Format with Quality 90",
+     "params": {"url": TARGET_URL, "format": "jpeg", "quality": 90}, "save": "05_jpeg_q90.jpg",
+     "details": lambda r, elapsed, path: f"Type: {r.headers.get('Content-Type')}, Saved: {path}"},
+    {"name": "PDF Export", "title": "PDF Export",
+     "params": {"url": TARGET_URL, "format": "pdf"}, "save": "06_export.pdf",
+     "details": lambda r, elapsed, path: f"Type: {r.headers.get('Content-Type')}, Saved: {path}"},
+    {"name": "iPhone 13 Emulation", "title": "Device Emulation (iPhone 13)",
+     "params": {"url": TARGET_URL, "device": "iphone13", "format": "png"}, "save": "07_iphone13.png"},
+    {"name": "iPad Pro Emulation", "title": "Device Emulation (iPad Pro)",
+     "params": {"url": TARGET_URL, "device": "ipad_pro", "format": "png"}, "save": "08_ipad_pro.png"},
+    {"name": "Dark Mode", "title": "Dark Mode",
+     "params": {"url": TARGET_URL, "dark_mode": "true", "format": "png"}, "save": "09_dark_mode.png"},
+    {"name": "Block Ads", "title": "Block Ads and Trackers",
+     "params": {"url": TARGET_URL, "block_ads": "true", "format": "png"}, "save": "10_block_ads.png"},
+    {"name": "Scroll & Lazy Load", "title": "Scroll Page for Lazy Loading",
+     "params": {"url": TARGET_URL, "scroll_page": "true", "fullpage": "true", "format": "png"}, "save": "11_scroll_lazy.png",
+     "timeout": 90},
+    {"name": "Element Selector", "title": "Element-Specific Screenshot (logo)", "method": "POST",
+     "body": orjson.dumps({"url": TARGET_URL, "selector": "#logo", "format": "png"}), "save": "12_element_logo.png",
+     "details": lambda r, elapsed, path: f"Selector: #logo, Saved: {path}"},
+    {"name": "Custom JavaScript", "title": "Custom JavaScript Execution", "method": "POST",
+     "body": orjson.dumps({"url": TARGET_URL, "script": "document.body.style.backgroundColor='lightblue'",
+                           "format": "png"}),
+     "save": "13_custom_js.png"},
+    {"name": "Wait for Selector", "title": "Wait for Selector", "method": "POST",
+     "body": orjson.dumps({"url": TARGET_URL, "wait_for_selector": "body", "format": "png"}), "save": "14_wait_selector.png"},
+    {"name": "Print Media", "title": "Print Media Emulation",
+     "params": {"url": TARGET_URL, "media_type": "print", "format": "png"}, "save": "15_print_media.png"},
+    {"name": "Combined Features", "title": "Combined Features (Mobile + Dark + Block Ads)",
+     "params": {"url": TARGET_URL, "device": "iphone13", "dark_mode": "true", "block_ads": "true", "format": "png"},
+     "save": "16_combined.png"},
+    {"name": "Rate Limit Headers", "title": "Rate Limit Headers",
+     "params": {"url": TARGET_URL}, "check": check_rate_limit_headers},
+    {"name": "Batch Processing", "title": "Batch Processing (2 URLs)", "method": "POST", "path": "/batch",
+     "body": orjson.dumps({"urls": [TARGET_URL, "https://example.com"],
+                           "settings": {"width": 800, "height": 600, "format": "png"}}),
+     "timeout": 120, "check": check_batch},
+    {"name": "Device List", "title": "Device List Endpoint", "path": "/devices", "timeout": 10,
+     "details": lambda r, elapsed, path: f"Found {len(r.json().get('devices', []))} devices"},
+    {"name": "Health Check", "title": "Health Check Endpoint", "path": "/health", "timeout": 10,
+     "details": lambda r, elapsed, path: f"Status: {r.json().get('status')}"},
+]
+
+def run_test(spec):
+    """
+    Run one test descriptor
+    
+    Args:
+        spec (dict): Test descriptor from TESTS
+    
+    Returns:
+        dict: Test name, PASS/FAIL status and details
+    """
+    try:
+        start = time.time()
+        response = SESSION.request(
+            spec.get("method", "GET"),
+            f"{API_BASE}{spec.get('path', '/screenshot')}",
+            params=spec.get("params"),
+            data=spec.get("body"),
+            headers=JSON_HEADERS if "body" in spec else None,
+            timeout=spec.get("timeout", 60),
+            stream="save" in spec
+        )
+        elapsed = time.time() - start
+        if "check" in spec:
+            passed, details = spec["check"](response)
+        elif response.status_code == 200:
+            path = save_screenshot(response, spec["save"]) if "save" in spec else None
+            if "save" in spec and path is None:
+                passed, details = False, f"Unexpected Content-Type: {response.headers.get('Content-Type')}"
+            else:
+                passed = True
+                details = spec["details"](response, elapsed, path) if "details" in spec else f"Saved: {path}"
+        else:
+            passed, details = False, f"Status: {response.status_code}"
+        # Hand a streamed connection back to the pool even if the body was never read
+        response.close()
+    except Exception as e:
+        passed, details = False, str(e)
+    return {"name": spec["name"], "status": "PASS" if passed else "FAIL", "details": details}
+
+with ThreadPoolExecutor(max_workers=8) as executor:
+    # map() yields in submission order, so the log reads like the sequential run
+    for number, (spec, result) in enumerate(zip(TESTS, executor.map(run_test, TESTS)), 1):
+        print(f"\n[TEST {number}] {spec['title']}")
+        log_test(result["name"], result["status"], result["details"])
 
 # Generate Report
 print("\n" + "=" * 80)
@@ -456,8 +215,9 @@ print("=" * 80)
 
 # Save detailed report
 report_file = os.path.join(OUTPUT_DIR, "test_report.json")
-with open(report_file, 'w') as f:
-    json.dump(test_results, f, indent=2)
+with open(report_file, 'wb', buffering=1024 * 1024) as f:
+    # Still indented: the report is read by people, orjson makes that cheap
+    f.write(orjson.dumps(test_results, option=orjson.OPT_INDENT_2))
 
 print(f"\n[REPORT] Detailed report saved to: {report_file}")
 print(f"[FILES] All screenshots saved to: {OUTPUT_DIR}/")
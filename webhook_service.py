@@ -4,42 +4,150 @@ Handles async job notifications and callbacks
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import hashlib
 import hmac
 import json
+import orjson
+import sqlite3
+import threading
 from datetime import datetime
 from pathlib import Path
-import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 class WebhookService:
     """Service for managing webhooks and async job notifications"""
     
-    def __init__(self):
+    WEBHOOK_RETRIES = 3
+    
+    def __init__(self, max_workers=4, max_queued_jobs=100):
+        """
+        Initialize webhook service
+        
+        Args:
+            max_workers (int): Jobs processed concurrently (match the browser pool size)
+            max_queued_jobs (int): Pending jobs accepted before is_overloaded() reports True
+        """
         self.webhooks_dir = Path('webhooks')
         self.webhooks_dir.mkdir(exist_ok=True)
-        self.jobs = {}  # In-memory job tracking
+        
+        # Jobs live in SQLite (WAL): a mutation touches one row, lookups read one
+        # row, and every gunicorn worker sees the same jobs; one connection per thread
+        self.jobs_db_file = self.webhooks_dir / 'jobs.db'
+        self._local = threading.local()
+        self._init_db()
+        
         self.job_file = self.webhooks_dir / 'jobs.json'
-        self.load_jobs()
+        self._migrate_json_jobs()
+        self.cleanup_old_jobs()
+        
+        # Bounded pools instead of a new thread per job / webhook delivery
+        self.max_queued_jobs = max_queued_jobs
+        # Jobs submitted and not yet finished (running ones included), counted
+        # under a lock so the capacity check and the submit happen together
+        self._max_pending_jobs = max_workers + max_queued_jobs
+        self._pending_jobs = 0
+        self._pending_lock = threading.Lock()
+        self._job_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='shot-job')
+        # Deliveries are network-bound and sleep between retries, so they get more workers than jobs
+        self._webhook_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='webhook')
+        
+        # One keep-alive session for deliveries: connections to a receiver are
+        # reused across retries and jobs; pools hold one connection per worker.
+        # WEBHOOK_RETRIES counts attempts, so the first post is followed by an
+        # immediate retry and one after 2s; Retry-After is ignored so a
+        # receiver cannot park a delivery worker indefinitely
+        self._http = requests.Session()
+        retry = Retry(
+            total=self.WEBHOOK_RETRIES - 1,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=None,
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=16, max_retries=retry)
+        self._http.mount('http://', adapter)
+        self._http.mount('https://', adapter)
     
-    def load_jobs(self):
-        """Load jobs from persistent storage"""
-        if self.job_file.exists():
-            try:
-                with open(self.job_file, 'r') as f:
-                    self.jobs = json.load(f)
-            except Exception as e:
-                print(f"Error loading jobs: {e}")
-                self.jobs = {}
+    def _get_connection(self):
+        """Get this thread's SQLite connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.jobs_db_file), isolation_level=None, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def _init_db(self):
+        """Create the jobs table if needed"""
+        conn = self._get_connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'job_id TEXT PRIMARY KEY, status TEXT NOT NULL, data BLOB NOT NULL, completed_at REAL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_completed_at ON jobs(completed_at)')
     
-    def save_jobs(self):
-        """Save jobs to persistent storage"""
+    @staticmethod
+    def _completed_at(job):
+        """Completion epoch used for expiry, or None while the job is still running"""
+        if job['status'] in ['completed', 'failed']:
+            return datetime.fromisoformat(job['updated_at']).timestamp()
+        return None
+    
+    def _migrate_json_jobs(self):
+        """Import jobs from the old jobs.json file once, then retire it"""
+        if not self.job_file.exists():
+            return
+        
         try:
-            with open(self.job_file, 'w') as f:
-                json.dump(self.jobs, f, indent=2)
+            with open(self.job_file, 'rb') as f:
+                jobs = orjson.loads(f.read())
+            
+            self._get_connection().executemany(
+                'INSERT OR IGNORE INTO jobs (job_id, status, data, completed_at) VALUES (?, ?, ?, ?)',
+                [(job_id, job['status'], orjson.dumps(job), self._completed_at(job))
+                 for job_id, job in jobs.items()]
+            )
+            self.job_file.rename(self.job_file.with_name(self.job_file.name + '.migrated'))
         except Exception as e:
-            print(f"Error saving jobs: {e}")
+            print(f"Error migrating jobs: {e}")
+    
+    def _record(self, job_id, fields):
+        """
+        Apply field changes to a stored job
+        
+        Args:
+            job_id (str): Job ID
+            fields (dict): Fields to overwrite
+        
+        Returns:
+            dict: Updated job, or None if the job does not exist
+        """
+        conn = self._get_connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT data FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            
+            job = orjson.loads(row[0])
+            job.update(fields)
+            conn.execute(
+                'UPDATE jobs SET status = ?, data = ?, completed_at = ? WHERE job_id = ?',
+                (job['status'], orjson.dumps(job), self._completed_at(job), job_id)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        
+        return job
     
     def create_job(self, job_type, params, webhook_url=None, webhook_secret=None):
         """
@@ -57,6 +165,7 @@ class WebhookService:
         import uuid
         
         job_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
         
         job = {
             'job_id': job_id,
@@ -65,15 +174,17 @@ class WebhookService:
             'params': params,
             'webhook_url': webhook_url,
             'webhook_secret': webhook_secret,
-            'created_at': datetime.now().isoformat(),
-            'updated_at': datetime.now().isoformat(),
+            'created_at': now,
+            'updated_at': now,
             'result': None,
             'error': None,
             'attempts': 0
         }
         
-        self.jobs[job_id] = job
-        self.save_jobs()
+        self._get_connection().execute(
+            'INSERT INTO jobs (job_id, status, data, completed_at) VALUES (?, ?, ?, NULL)',
+            (job_id, job['status'], orjson.dumps(job))
+        )
         
         return job_id
     
@@ -87,19 +198,19 @@ class WebhookService:
             result (dict): Job result data
             error (str): Error message if failed
         """
-        if job_id not in self.jobs:
-            return False
-        
-        self.jobs[job_id]['status'] = status
-        self.jobs[job_id]['updated_at'] = datetime.now().isoformat()
+        fields = {
+            'status': status,
+            'updated_at': datetime.now().isoformat()
+        }
         
         if result:
-            self.jobs[job_id]['result'] = result
+            fields['result'] = result
         
         if error:
-            self.jobs[job_id]['error'] = error
+            fields['error'] = error
         
-        self.save_jobs()
+        if self._record(job_id, fields) is None:
+            return False
         
         # Trigger webhook if job completed or failed
         if status in ['completed', 'failed']:
@@ -109,7 +220,10 @@ class WebhookService:
     
     def get_job(self, job_id):
         """Get job details"""
-        return self.jobs.get(job_id)
+        row = self._get_connection().execute(
+            'SELECT data FROM jobs WHERE job_id = ?', (job_id,)
+        ).fetchone()
+        return orjson.loads(row[0]) if row else None
     
     def trigger_webhook(self, job_id):
         """
@@ -118,7 +232,7 @@ class WebhookService:
         Args:
             job_id (str): Job ID
         """
-        job = self.jobs.get(job_id)
+        job = self.get_job(job_id)
         if not job or not job.get('webhook_url'):
             return
         
@@ -136,24 +250,21 @@ class WebhookService:
             'error': job.get('error')
         }
         
+        # Serialize once: the same bytes are signed and sent as the body
+        payload_bytes = self._canonical_payload(payload)
+        
         # Send webhook in background thread
-        thread = threading.Thread(
-            target=self._send_webhook,
-            args=(webhook_url, payload, webhook_secret, job_id)
-        )
-        thread.daemon = True
-        thread.start()
+        self._webhook_executor.submit(self._send_webhook, webhook_url, payload_bytes, webhook_secret, job_id)
     
-    def _send_webhook(self, url, payload, secret, job_id, max_retries=3):
+    def _send_webhook(self, url, payload_bytes, secret, job_id):
         """
-        Send webhook with retries
+        Send webhook; retries and backoff are handled by the session's adapter
         
         Args:
             url (str): Webhook URL
-            payload (dict): Payload data
+            payload_bytes (bytes): Canonical JSON payload from _canonical_payload
             secret (str): Webhook secret
             job_id (str): Job ID
-            max_retries (int): Maximum retry attempts
         """
         headers = {
             'Content-Type': 'application/json',
@@ -163,96 +274,156 @@ class WebhookService:
         
         # Add signature if secret provided
         if secret:
-            signature = self._generate_signature(payload, secret)
+            signature = self._generate_signature(payload_bytes, secret)
             headers['X-Webhook-Signature'] = signature
         
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(
-                    url,
-                    json=payload,
-                    headers=headers,
-                    timeout=10
-                )
-                
-                if response.status_code == 200:
-                    # Webhook delivered successfully
-                    self.jobs[job_id]['webhook_delivered'] = True
-                    self.jobs[job_id]['webhook_delivered_at'] = datetime.now().isoformat()
-                    self.save_jobs()
-                    return
-                
-            except Exception as e:
-                print(f"Webhook delivery failed (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
+        try:
+            response = self._http.post(
+                url,
+                data=payload_bytes,
+                headers=headers,
+                timeout=(3, 10)
+            )
+            
+            if response.status_code == 200:
+                # Webhook delivered successfully
+                self._record(job_id, {
+                    'webhook_delivered': True,
+                    'webhook_delivered_at': datetime.now().isoformat()
+                })
+                return
+            
+            print(f"Webhook delivery failed: HTTP {response.status_code}")
+        except Exception as e:
+            print(f"Webhook delivery failed: {e}")
         
         # All attempts failed
-        self.jobs[job_id]['webhook_failed'] = True
-        self.jobs[job_id]['attempts'] = max_retries
-        self.save_jobs()
+        self._record(job_id, {'webhook_failed': True, 'attempts': self.WEBHOOK_RETRIES})
+    
+    @staticmethod
+    def _canonical_payload(payload):
+        """
+        Serialize a webhook payload the way receivers re-serialize it to verify
+        
+        Stays on stdlib json: orjson's compact output would not match the
+        json.dumps(payload, sort_keys=True) receivers are documented to use.
+        
+        Args:
+            payload (dict): Payload data
+        
+        Returns:
+            bytes: Key-sorted JSON encoding
+        """
+        return json.dumps(payload, sort_keys=True).encode()
+    
+    def _digest_bytes(self, payload, secret):
+        """
+        Compute the raw HMAC-SHA256 digest of a webhook payload
+        
+        Args:
+            payload (dict | bytes): Payload data, or bytes already from _canonical_payload
+            secret (str): Webhook secret
+        
+        Returns:
+            bytes: 32-byte digest
+        """
+        if isinstance(payload, dict):
+            payload = self._canonical_payload(payload)
+        return hmac.new(secret.encode(), payload, hashlib.sha256).digest()
     
     def _generate_signature(self, payload, secret):
         """
         Generate HMAC signature for webhook payload
         
         Args:
-            payload (dict): Payload data
+            payload (dict | bytes): Payload data, or bytes already from _canonical_payload
             secret (str): Webhook secret
         
         Returns:
             str: HMAC signature
         """
-        payload_str = json.dumps(payload, sort_keys=True)
-        signature = hmac.new(
-            secret.encode(),
-            payload_str.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        return signature
+        return self._digest_bytes(payload, secret).hex()
     
     def verify_webhook_signature(self, payload, signature, secret):
         """
         Verify webhook signature
         
         Args:
-            payload (dict): Payload data
-            signature (str): Provided signature
+            payload (dict | bytes): Payload data, or the raw request body
+            signature (str | bytes): Provided hex signature, or the raw digest
             secret (str): Webhook secret
         
         Returns:
             bool: True if signature is valid
         """
-        expected_signature = self._generate_signature(payload, secret)
-        return hmac.compare_digest(signature, expected_signature)
+        if isinstance(signature, str):
+            try:
+                signature = bytes.fromhex(signature)
+            except ValueError:
+                return False  # Not hex, so it cannot match
+        return hmac.compare_digest(self._digest_bytes(payload, secret), signature)
     
     def process_job_async(self, job_id, job_function, *args, **kwargs):
         """
-        Process job asynchronously in background thread
+        Process job asynchronously on the job worker pool
         
         Args:
             job_id (str): Job ID
             job_function (callable): Function to execute
             *args, **kwargs: Arguments for job function
+        
+        Returns:
+            bool: False if the queue is full; the job is then marked failed
         """
-        def worker():
-            try:
-                # Update status to processing
-                self.update_job_status(job_id, 'processing')
-                
-                # Execute job
-                result = job_function(*args, **kwargs)
-                
-                # Update status to completed
-                self.update_job_status(job_id, 'completed', result=result)
-                
-            except Exception as e:
-                # Update status to failed
-                self.update_job_status(job_id, 'failed', error=str(e))
-        
-        thread = threading.Thread(target=worker)
-        thread.daemon = True
-        thread.start()
+        with self._pending_lock:
+            full = self._pending_jobs >= self._max_pending_jobs
+            if not full:
+                self._pending_jobs += 1
+        
+        if full:
+            # The caller answers 503, so no webhook is sent for the rejected job
+            self._record(job_id, {'status': 'failed', 'error': 'Async job queue full',
+                                  'updated_at': datetime.now().isoformat()})
+            return False
+        
+        try:
+            future = self._job_executor.submit(self._run_job, job_id, job_function, args, kwargs)
+        except Exception:
+            self._release_job_slot()
+            raise
+        future.add_done_callback(self._release_job_slot)
+        return True
+    
+    def _release_job_slot(self, future=None):
+        """Give back the slot taken by process_job_async"""
+        with self._pending_lock:
+            self._pending_jobs -= 1
+    
+    def _run_job(self, job_id, job_function, args, kwargs):
+        """Execute a job and record its outcome"""
+        try:
+            # Update status to processing
+            self.update_job_status(job_id, 'processing')
+            
+            # Execute job
+            result = job_function(*args, **kwargs)
+            
+            # Update status to completed
+            self.update_job_status(job_id, 'completed', result=result)
+            
+        except Exception as e:
+            # Update status to failed
+            self.update_job_status(job_id, 'failed', error=str(e))
+    
+    def is_overloaded(self):
+        """
+        Check whether the job queue is full
+        
+        Returns:
+            bool: True if new jobs should be rejected
+        """
+        with self._pending_lock:
+            return self._pending_jobs >= self._max_pending_jobs
     
     def get_job_status(self, job_id):
         """
@@ -285,22 +456,14 @@ class WebhookService:
         
         Args:
             max_age_hours (int): Maximum age in hours
-        """
-        from datetime import timedelta
-        
-        cutoff_time = datetime.now() - timedelta(hours=max_age_hours)
         
-        jobs_to_remove = []
-        for job_id, job in self.jobs.items():
-            if job['status'] in ['completed', 'failed']:
-                updated_at = datetime.fromisoformat(job['updated_at'])
-                if updated_at < cutoff_time:
-                    jobs_to_remove.append(job_id)
-        
-        for job_id in jobs_to_remove:
-            del self.jobs[job_id]
-        
-        if jobs_to_remove:
-            self.save_jobs()
+        Returns:
+            int: Number of jobs removed
+        """
+        cutoff = time.time() - max_age_hours * 3600
         
-        return len(jobs_to_remove)
+        # Running jobs have no completed_at, so the index range never includes them
+        cursor = self._get_connection().execute(
+            'DELETE FROM jobs WHERE completed_at < ?', (cutoff,)
+        )
+        return cursor.rowcount